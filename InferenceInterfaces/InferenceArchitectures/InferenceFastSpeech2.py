@@ -7,8 +7,11 @@ from Layers.DurationPredictor import DurationPredictor
 from Layers.LengthRegulator import LengthRegulator
 from Layers.PostNet import PostNet
 from Layers.VariancePredictor import VariancePredictor
+from Utility.deployment_checkpoint import share_weights
+from Utility.quantization import quantize_linears
 from Utility.utils import make_non_pad_mask
 from Utility.utils import make_pad_mask
+from Utility.utils import pad_list
 
 
 class FastSpeech2(torch.nn.Module, ABC):
@@ -81,6 +84,7 @@ class FastSpeech2(torch.nn.Module, ABC):
         self.use_scaled_pos_enc = use_scaled_pos_enc
         self.multilingual_model = lang_embs is not None
         self.multispeaker_model = utt_embed_dim is not None
+        self.bfloat16 = False
 
         embed = torch.nn.Sequential(torch.nn.Linear(idim, 100),
                                     torch.nn.Tanh(),
@@ -91,15 +95,18 @@ class FastSpeech2(torch.nn.Module, ABC):
                                  normalize_before=encoder_normalize_before, concat_after=encoder_concat_after,
                                  positionwise_conv_kernel_size=positionwise_conv_kernel_size, macaron_style=use_macaron_style_in_conformer,
                                  use_cnn_module=use_cnn_in_conformer, cnn_module_kernel=conformer_enc_kernel_size, zero_triu=False,
-                                 utt_embed=utt_embed_dim, connect_utt_emb_at_encoder_out=connect_utt_emb_at_encoder_out, lang_embs=lang_embs)
+                                 utt_embed=utt_embed_dim, connect_utt_emb_at_encoder_out=connect_utt_emb_at_encoder_out, lang_embs=lang_embs,
+                                 mask_padding=True)
         self.duration_predictor = DurationPredictor(idim=adim, n_layers=duration_predictor_layers,
                                                     n_chans=duration_predictor_chans,
                                                     kernel_size=duration_predictor_kernel_size,
-                                                    dropout_rate=duration_predictor_dropout_rate, )
+                                                    dropout_rate=duration_predictor_dropout_rate,
+                                                    mask_padding=True)
         self.pitch_predictor = VariancePredictor(idim=adim, n_layers=pitch_predictor_layers,
                                                  n_chans=pitch_predictor_chans,
                                                  kernel_size=pitch_predictor_kernel_size,
-                                                 dropout_rate=pitch_predictor_dropout)
+                                                 dropout_rate=pitch_predictor_dropout,
+                                                 mask_padding=True)
         self.pitch_embed = torch.nn.Sequential(torch.nn.Conv1d(in_channels=1, out_channels=adim,
                                                                kernel_size=pitch_embed_kernel_size,
                                                                padding=(pitch_embed_kernel_size - 1) // 2),
@@ -107,7 +114,8 @@ class FastSpeech2(torch.nn.Module, ABC):
         self.energy_predictor = VariancePredictor(idim=adim, n_layers=energy_predictor_layers,
                                                   n_chans=energy_predictor_chans,
                                                   kernel_size=energy_predictor_kernel_size,
-                                                  dropout_rate=energy_predictor_dropout)
+                                                  dropout_rate=energy_predictor_dropout,
+                                                  mask_padding=True)
         self.energy_embed = torch.nn.Sequential(torch.nn.Conv1d(in_channels=1, out_channels=adim,
                                                                 kernel_size=energy_embed_kernel_size,
                                                                 padding=(energy_embed_kernel_size - 1) // 2),
@@ -127,7 +135,8 @@ class FastSpeech2(torch.nn.Module, ABC):
                                  positionwise_conv_kernel_size=positionwise_conv_kernel_size,
                                  macaron_style=use_macaron_style_in_conformer,
                                  use_cnn_module=use_cnn_in_conformer,
-                                 cnn_module_kernel=conformer_dec_kernel_size)
+                                 cnn_module_kernel=conformer_dec_kernel_size,
+                                 mask_padding=True)
         self.feat_out = torch.nn.Linear(adim, odim * reduction_factor)
         self.postnet = PostNet(idim=idim,
                                odim=odim,
@@ -137,12 +146,123 @@ class FastSpeech2(torch.nn.Module, ABC):
                                use_batch_norm=use_batch_norm,
                                dropout_rate=postnet_dropout_rate)
         self.load_state_dict(weights)
+        share_weights(self, weights)
+
+    def quantize(self):
+        """
+        Quantizes the linear layers of the encoder, the decoder and the output projection to int8,
+        for inference on CPU. The variance predictors stay in float, since small errors in the
+        predicted durations would change the length of the whole utterance.
+        """
+        quantize_linears(self, ["encoder", "decoder", "feat_out"])
+        return self
+
+    def to_bfloat16(self):
+        """
+        Stores the weights in bfloat16 and runs the forward passes under autocast, which uses the bfloat16
+        matrix multiplications of recent CPUs. The duration predictor stays in float32, since the durations
+        are rounded and an error of one frame already shows. The variances are scaled in float32 as well.
+        """
+        self.to(torch.bfloat16)
+        self.duration_predictor.float()
+        self.bfloat16 = True
+        return self
+
+    def autocast(self):
+        """
+        The context that the forward passes run in, callers need it for anything else they run on the model.
+        """
+        return torch.autocast(device_type=next(self.parameters()).device.type, dtype=torch.bfloat16, enabled=self.bfloat16)
 
     def _forward(self, text_tensors, text_lens, gold_speech=None, speech_lens=None,
                  gold_durations=None, gold_pitch=None, gold_energy=None,
                  is_inference=False, duration_scaling_factor=1.0, utterance_embedding=None, lang_ids=None,
-                 pitch_variance_scale=1.0, energy_variance_scale=1.0):
+                 pitch_variance_scale=1.0, energy_variance_scale=1.0, prediction=None):
+
+        encoded_texts, duration_predictions, pitch_predictions, energy_predictions, speech_lens = self._encode(text_tensors,
+                                                                                                               text_lens,
+                                                                                                               speech_lens=speech_lens,
+                                                                                                               gold_durations=gold_durations,
+                                                                                                               gold_pitch=gold_pitch,
+                                                                                                               gold_energy=gold_energy,
+                                                                                                               is_inference=is_inference,
+                                                                                                               duration_scaling_factor=duration_scaling_factor,
+                                                                                                               utterance_embedding=utterance_embedding,
+                                                                                                               lang_ids=lang_ids,
+                                                                                                               pitch_variance_scale=pitch_variance_scale,
+                                                                                                               energy_variance_scale=energy_variance_scale,
+                                                                                                               prediction=prediction)
+
+        # forward decoder
+        if speech_lens is not None and not is_inference:
+            if self.reduction_factor > 1:
+                olens_in = speech_lens.new([olen // self.reduction_factor for olen in speech_lens])
+            else:
+                olens_in = speech_lens
+            h_masks = self._source_mask(olens_in)
+        elif is_inference and encoded_texts.size(0) > 1:
+            # in a batch, the frames that pad the shorter utterances must not be attended to
+            h_masks = self._source_mask(speech_lens)
+        else:
+            h_masks = None
+        before_outs, after_outs = self._decode(encoded_texts, h_masks)
+
+        return before_outs, after_outs, duration_predictions, pitch_predictions, energy_predictions, speech_lens
+
+    def _encode(self, text_tensors, text_lens, speech_lens=None,
+                gold_durations=None, gold_pitch=None, gold_energy=None,
+                is_inference=False, duration_scaling_factor=1.0, utterance_embedding=None, lang_ids=None,
+                pitch_variance_scale=1.0, energy_variance_scale=1.0, prediction=None):
+        """
+        Encoder and variance adaptor, returns the frame level sequence that goes into the decoder
+        """
+
+        with self.autocast():
+            if prediction is None:
+                prediction = self._predict(text_tensors,
+                                           text_lens,
+                                           utterance_embedding=utterance_embedding,
+                                           lang_ids=lang_ids,
+                                           predict_durations=is_inference and gold_durations is None)
+            encoded_texts, duration_predictions, pitch_predictions, energy_predictions = prediction
+
+            if is_inference:
+                if gold_durations is not None:
+                    duration_predictions = gold_durations
+                if gold_pitch is not None:
+                    pitch_predictions = gold_pitch
+                if gold_energy is not None:
+                    energy_predictions = gold_energy
+
+                pitch_predictions = _scale_variance(pitch_predictions.float(), pitch_variance_scale)
+                energy_predictions = _scale_variance(energy_predictions.float(), energy_variance_scale)
 
+                pitch_embeddings = self.pitch_embed(pitch_predictions.transpose(1, 2)).transpose(1, 2)
+                energy_embeddings = self.energy_embed(energy_predictions.transpose(1, 2)).transpose(1, 2)
+                encoded_texts = encoded_texts + energy_embeddings + pitch_embeddings
+                encoded_texts = encoded_texts.masked_fill(make_pad_mask(text_lens, device=text_lens.device).unsqueeze(-1), 0.0)
+                encoded_texts = self.length_regulator(encoded_texts, duration_predictions, duration_scaling_factor)
+                speech_lens = _regulated_lengths(duration_predictions, duration_scaling_factor)
+            else:
+                duration_masks = make_pad_mask(text_lens, device=text_lens.device)
+                duration_predictions = self.duration_predictor(encoded_texts, duration_masks)
+
+                pitch_predictions = _scale_variance(pitch_predictions, pitch_variance_scale)
+                energy_predictions = _scale_variance(energy_predictions, energy_variance_scale)
+
+                # use groundtruth to clone
+                pitch_embeddings = self.pitch_embed(gold_pitch.transpose(1, 2)).transpose(1, 2)
+                energy_embeddings = self.energy_embed(gold_energy.transpose(1, 2)).transpose(1, 2)
+                encoded_texts = encoded_texts + energy_embeddings + pitch_embeddings
+                encoded_texts = self.length_regulator(encoded_texts, gold_durations)  # (B, Lmax, adim)
+
+        return encoded_texts, duration_predictions, pitch_predictions, energy_predictions, speech_lens
+
+    def _predict(self, text_tensors, text_lens, utterance_embedding=None, lang_ids=None, predict_durations=True):
+        """
+        Encoder and variance predictors, everything that only depends on the phones, the speaker and the language
+        and not on the scaling factors. The predictions are not scaled yet.
+        """
         if not self.multilingual_model:
             lang_ids = None
 
@@ -156,6 +276,8 @@ class FastSpeech2(torch.nn.Module, ABC):
 
         # forward duration predictor and variance predictors
         duration_masks = make_pad_mask(text_lens, device=text_lens.device)
+        # in a batch, the predictors must see zeros beyond the end of the shorter utterances, just like an utterance on its own
+        encoded_texts = encoded_texts.masked_fill(duration_masks.unsqueeze(-1), 0.0)
 
         if self.stop_gradient_from_pitch_predictor:
             pitch_predictions = self.pitch_predictor(encoded_texts.detach(), duration_masks.unsqueeze(-1))
@@ -167,51 +289,51 @@ class FastSpeech2(torch.nn.Module, ABC):
         else:
             energy_predictions = self.energy_predictor(encoded_texts, duration_masks.unsqueeze(-1))
 
-        if is_inference:
-            if gold_durations is not None:
-                duration_predictions = gold_durations
-            else:
-                duration_predictions = self.duration_predictor.inference(encoded_texts, duration_masks)
-            if gold_pitch is not None:
-                pitch_predictions = gold_pitch
-            if gold_energy is not None:
-                energy_predictions = gold_energy
-
-            pitch_predictions = _scale_variance(pitch_predictions, pitch_variance_scale)
-            energy_predictions = _scale_variance(energy_predictions, energy_variance_scale)
-
-            pitch_embeddings = self.pitch_embed(pitch_predictions.transpose(1, 2)).transpose(1, 2)
-            energy_embeddings = self.energy_embed(energy_predictions.transpose(1, 2)).transpose(1, 2)
-            encoded_texts = encoded_texts + energy_embeddings + pitch_embeddings
-            encoded_texts = self.length_regulator(encoded_texts, duration_predictions, duration_scaling_factor)
-        else:
-            duration_predictions = self.duration_predictor(encoded_texts, duration_masks)
+        duration_predictions = None
+        if predict_durations:
+            with torch.autocast(device_type=encoded_texts.device.type, enabled=False):
+                duration_predictions = self.duration_predictor.inference(encoded_texts.float(), duration_masks)
 
-            pitch_predictions = _scale_variance(pitch_predictions, pitch_variance_scale)
-            energy_predictions = _scale_variance(energy_predictions, energy_variance_scale)
+        return encoded_texts, duration_predictions, pitch_predictions, energy_predictions
 
-            # use groundtruth to clone
-            pitch_embeddings = self.pitch_embed(gold_pitch.transpose(1, 2)).transpose(1, 2)
-            energy_embeddings = self.energy_embed(gold_energy.transpose(1, 2)).transpose(1, 2)
-            encoded_texts = encoded_texts + energy_embeddings + pitch_embeddings
-            encoded_texts = self.length_regulator(encoded_texts, gold_durations)  # (B, Lmax, adim)
+    def _decode(self, encoded_texts, h_masks=None):
+        with self.autocast():
+            zs, _ = self.decoder(encoded_texts, h_masks)  # (B, Lmax, adim)
+            before_outs = self.feat_out(zs).view(zs.size(0), -1, self.odim)  # (B, Lmax, odim)
 
-        # forward decoder
-        if speech_lens is not None and not is_inference:
-            if self.reduction_factor > 1:
-                olens_in = speech_lens.new([olen // self.reduction_factor for olen in speech_lens])
-            else:
-                olens_in = speech_lens
-            h_masks = self._source_mask(olens_in)
-        else:
-            h_masks = None
-        zs, _ = self.decoder(encoded_texts, h_masks)  # (B, Lmax, adim)
-        before_outs = self.feat_out(zs).view(zs.size(0), -1, self.odim)  # (B, Lmax, odim)
+            # postnet -> (B, Lmax//r * r, odim)
+            after_outs = before_outs + self.postnet(before_outs.transpose(1, 2), h_masks).transpose(1, 2)
 
-        # postnet -> (B, Lmax//r * r, odim)
-        after_outs = before_outs + self.postnet(before_outs.transpose(1, 2)).transpose(1, 2)
+        return before_outs.float(), after_outs.float()
 
-        return before_outs, after_outs, duration_predictions, pitch_predictions, energy_predictions
+    @torch.no_grad()
+    def predict(self, text, utterance_embedding=None, lang_id=None):
+        """
+        Runs only the encoder and the variance predictors. The result can be passed to forward and stream_forward as
+        the prediction for the same text, speaker and language, which then only apply the scaling factors, the
+        length regulator and the decoder. This makes re-rendering a sentence with different scales much cheaper.
+
+        Args:
+            text: see forward
+            utterance_embedding: see forward
+            lang_id: see forward
+
+        Returns:
+            the encoded phones (1, T, adim), the predicted durations (1, T), pitch (1, T, 1) and energy (1, T, 1)
+
+        """
+        training = self.training
+        self.eval()
+        ilens = torch.tensor([text.shape[0]], dtype=torch.long, device=text.device)
+        if lang_id is not None:
+            lang_id = lang_id.unsqueeze(0).to(text.device)
+        with self.autocast():
+            prediction = self._predict(text.unsqueeze(0),
+                                       ilens,
+                                       utterance_embedding=utterance_embedding.unsqueeze(0) if utterance_embedding is not None else None,
+                                       lang_ids=lang_id)
+        self.train(training)
+        return prediction
 
     @torch.no_grad()
     def forward(self,
@@ -225,7 +347,8 @@ class FastSpeech2(torch.nn.Module, ABC):
                 lang_id=None,
                 duration_scaling_factor=1.0,
                 pitch_variance_scale=1.0,
-                energy_variance_scale=1.0):
+                energy_variance_scale=1.0,
+                prediction=None):
         """
         Generate the sequence of spectrogram frames given the sequence of vectorized phonemes.
 
@@ -247,11 +370,14 @@ class FastSpeech2(torch.nn.Module, ABC):
             energy_variance_scale: reasonable values are 0.6 < scale < 1.4.
                                    1.0 means no scaling happens, higher values increase variance of the energy curve,
                                    lower values decrease variance of the energy curve.
+            prediction: the result of predict for the same text, utterance embedding and language id (optional,
+                        if provided, the encoder and the variance predictors are skipped)
 
         Returns:
             mel spectrogram
 
         """
+        training = self.training
         self.eval()
         # setup batch axis
         ilens = torch.tensor([text.shape[0]], dtype=torch.long, device=text.device)
@@ -268,33 +394,256 @@ class FastSpeech2(torch.nn.Module, ABC):
         if lang_id is not None:
             lang_id = lang_id.unsqueeze(0).to(text.device)
 
-        before_outs, after_outs, d_outs, pitch_predictions, energy_predictions = self._forward(text.unsqueeze(0),
-                                                                                               ilens,
-                                                                                               gold_speech=gold_speech,
-                                                                                               gold_durations=durations,
-                                                                                               is_inference=True,
-                                                                                               gold_pitch=pitch,
-                                                                                               gold_energy=energy,
-                                                                                               utterance_embedding=utterance_embedding.unsqueeze(0),
-                                                                                               lang_ids=lang_id,
-                                                                                               duration_scaling_factor=duration_scaling_factor,
-                                                                                               pitch_variance_scale=pitch_variance_scale,
-                                                                                               energy_variance_scale=energy_variance_scale)
-        self.train()
+        before_outs, after_outs, d_outs, pitch_predictions, energy_predictions, _ = self._forward(text.unsqueeze(0),
+                                                                                                  ilens,
+                                                                                                  gold_speech=gold_speech,
+                                                                                                  gold_durations=durations,
+                                                                                                  is_inference=True,
+                                                                                                  gold_pitch=pitch,
+                                                                                                  gold_energy=energy,
+                                                                                                  utterance_embedding=utterance_embedding.unsqueeze(0),
+                                                                                                  lang_ids=lang_id,
+                                                                                                  duration_scaling_factor=duration_scaling_factor,
+                                                                                                  pitch_variance_scale=pitch_variance_scale,
+                                                                                                  energy_variance_scale=energy_variance_scale,
+                                                                                                  prediction=prediction)
+        self.train(training)
         if return_duration_pitch_energy:
             return after_outs[0], d_outs[0], pitch_predictions[0], energy_predictions[0]
         return after_outs[0]
 
+    @torch.no_grad()
+    def stream_forward(self,
+                       text,
+                       durations=None,
+                       pitch=None,
+                       energy=None,
+                       utterance_embedding=None,
+                       lang_id=None,
+                       duration_scaling_factor=1.0,
+                       pitch_variance_scale=1.0,
+                       energy_variance_scale=1.0,
+                       chunk_size=100,
+                       left_context=50,
+                       right_context=50,
+                       prediction=None):
+        """
+        Generate the spectrogram chunk by chunk. The encoder and the variance adaptor run over the whole utterance,
+        but the decoder and the postnet only ever see a window of the upsampled sequence, so the latency until the
+        first chunk and the memory needed for the attention stay bounded, no matter how long the input is.
+
+        Args:
+            text: see forward
+            durations: see forward
+            pitch: see forward
+            energy: see forward
+            utterance_embedding: see forward
+            lang_id: see forward
+            duration_scaling_factor: see forward
+            pitch_variance_scale: see forward
+            energy_variance_scale: see forward
+            chunk_size: amount of frames that are yielded at once
+            left_context: amount of preceding frames that the decoder sees in addition to a chunk
+            right_context: amount of following frames that the decoder sees in addition to a chunk
+            prediction: see forward
+
+        Yields:
+            consecutive chunks of the mel spectrogram (chunk_size, odim), the last one may be shorter
+
+        """
+        training = self.training
+        self.eval()
+        encoded_texts = self._encode_utterance(text,
+                                               durations=durations,
+                                               pitch=pitch,
+                                               energy=energy,
+                                               utterance_embedding=utterance_embedding,
+                                               lang_id=lang_id,
+                                               duration_scaling_factor=duration_scaling_factor,
+                                               pitch_variance_scale=pitch_variance_scale,
+                                               energy_variance_scale=energy_variance_scale,
+                                               prediction=prediction)
+        total_frames = encoded_texts.size(1)
+        for start in range(0, total_frames, chunk_size):
+            end = min(start + chunk_size, total_frames)
+            window_start = max(start - left_context, 0)
+            window_end = min(end + right_context, total_frames)
+            self.eval()  # the consumer of the generator might have used the model in between
+            _, after_outs = self._decode(encoded_texts[:, window_start:window_end])
+            yield after_outs[0, start - window_start:end - window_start]
+        self.train(training)
+
+    @torch.no_grad()
+    def span_forward(self,
+                     text,
+                     start,
+                     end,
+                     durations=None,
+                     pitch=None,
+                     energy=None,
+                     utterance_embedding=None,
+                     lang_id=None,
+                     duration_scaling_factor=1.0,
+                     pitch_variance_scale=1.0,
+                     energy_variance_scale=1.0,
+                     context=50,
+                     prediction=None):
+        """
+        Generate only the frames from start to end of the spectrogram. Like for the chunks of stream_forward, the
+        decoder and the postnet only see a window around the span, so the cost depends on the length of the span
+        and not on the length of the utterance. This is meant for replacing a part of a spectrogram after an edit.
+
+        Args:
+            text: see forward
+            start: index of the first frame of the span
+            end: index of the frame after the last frame of the span
+            durations: see forward
+            pitch: see forward
+            energy: see forward
+            utterance_embedding: see forward
+            lang_id: see forward
+            duration_scaling_factor: see forward
+            pitch_variance_scale: see forward
+            energy_variance_scale: see forward
+            context: amount of frames on each side of the span that the decoder sees in addition to it
+            prediction: see forward
+
+        Returns:
+            the frames of the span (end - start, odim)
+
+        """
+        training = self.training
+        self.eval()
+        encoded_texts = self._encode_utterance(text,
+                                               durations=durations,
+                                               pitch=pitch,
+                                               energy=energy,
+                                               utterance_embedding=utterance_embedding,
+                                               lang_id=lang_id,
+                                               duration_scaling_factor=duration_scaling_factor,
+                                               pitch_variance_scale=pitch_variance_scale,
+                                               energy_variance_scale=energy_variance_scale,
+                                               prediction=prediction)
+        window_start = max(start - context, 0)
+        window_end = min(end + context, encoded_texts.size(1))
+        _, after_outs = self._decode(encoded_texts[:, window_start:window_end])
+        self.train(training)
+        return after_outs[0, start - window_start:end - window_start]
+
+    def _encode_utterance(self, text, durations=None, pitch=None, energy=None, utterance_embedding=None, lang_id=None,
+                          duration_scaling_factor=1.0, pitch_variance_scale=1.0, energy_variance_scale=1.0, prediction=None):
+        """
+        The frame level sequence that goes into the decoder for a single utterance (1, L, adim)
+        """
+        ilens = torch.tensor([text.shape[0]], dtype=torch.long, device=text.device)
+        if durations is not None:
+            durations = durations.unsqueeze(0).to(text.device)
+        if pitch is not None:
+            pitch = pitch.unsqueeze(0).to(text.device)
+        if energy is not None:
+            energy = energy.unsqueeze(0).to(text.device)
+        if lang_id is not None:
+            lang_id = lang_id.unsqueeze(0).to(text.device)
+
+        encoded_texts, *_ = self._encode(text.unsqueeze(0),
+                                         ilens,
+                                         gold_durations=durations,
+                                         is_inference=True,
+                                         gold_pitch=pitch,
+                                         gold_energy=energy,
+                                         utterance_embedding=utterance_embedding.unsqueeze(0),
+                                         lang_ids=lang_id,
+                                         duration_scaling_factor=duration_scaling_factor,
+                                         pitch_variance_scale=pitch_variance_scale,
+                                         energy_variance_scale=energy_variance_scale,
+                                         prediction=prediction)
+        return encoded_texts
+
+    @torch.no_grad()
+    def batch_forward(self,
+                      texts,
+                      utterance_embeddings=None,
+                      lang_ids=None,
+                      return_duration_pitch_energy=False,
+                      duration_scaling_factor=1.0,
+                      pitch_variance_scale=1.0,
+                      energy_variance_scale=1.0):
+        """
+        Generate the sequences of spectrogram frames for several utterances in a single forward pass.
+
+        Args:
+            texts: list of input sequences of vectorized phonemes, they may differ in length
+            utterance_embeddings: embeddings of speaker information, one row per utterance (B, utt_embed_dim)
+            lang_ids: ids to be fed into the embedding layer that contains language information, one per utterance (B,)
+            return_duration_pitch_energy: whether to return the lists of predicted durations, pitch and energy
+            duration_scaling_factor: see forward
+            pitch_variance_scale: see forward
+            energy_variance_scale: see forward
+
+        Returns:
+            list of mel spectrograms, each trimmed to the length of its utterance
+
+        Note:
+            the padded frames are zeroed before every convolution and left out of the group normalizations, so every
+            utterance gets the same durations, pitch and energy as on its own and a spectrogram that only differs
+            by rounding errors.
+
+        """
+        training = self.training
+        self.eval()
+        device = texts[0].device
+        ilens = torch.tensor([text.shape[0] for text in texts], dtype=torch.long, device=device)
+        text_tensors = pad_list(texts, 0.0)
+        if lang_ids is not None:
+            lang_ids = lang_ids.view(-1, 1).to(device)
+        if utterance_embeddings is not None:
+            utterance_embeddings = utterance_embeddings.to(device)
+
+        _, after_outs, d_outs, pitch_predictions, energy_predictions, speech_lens = self._forward(text_tensors,
+                                                                                                  ilens,
+                                                                                                  is_inference=True,
+                                                                                                  utterance_embedding=utterance_embeddings,
+                                                                                                  lang_ids=lang_ids,
+                                                                                                  duration_scaling_factor=duration_scaling_factor,
+                                                                                                  pitch_variance_scale=pitch_variance_scale,
+                                                                                                  energy_variance_scale=energy_variance_scale)
+        self.train(training)
+        mels = [after_outs[index, :speech_lens[index]] for index in range(len(texts))]
+        if return_duration_pitch_energy:
+            return mels, \
+                   [d_outs[index, :ilens[index]] for index in range(len(texts))], \
+                   [pitch_predictions[index, :ilens[index]] for index in range(len(texts))], \
+                   [energy_predictions[index, :ilens[index]] for index in range(len(texts))]
+        return mels
+
     def _source_mask(self, ilens):
         x_masks = make_non_pad_mask(ilens).to(next(self.parameters()).device)
         return x_masks.unsqueeze(-2)
 
 
-def _scale_variance(sequence, scale):
+def _scale_variance(sequence, scale: float):
+    # written so that it can be compiled with torch.jit.script, the exported models use it as well
     if scale == 1.0:
         return sequence
-    average = sequence[0][sequence[0] != 0.0].mean()
+    # every utterance in the batch is centered around its own average, padding and unvoiced parts are zero and are left out
+    average = torch.stack([utterance[utterance != 0.0].mean() for utterance in sequence]).view([-1] + [1] * (sequence.dim() - 1))
     sequence = sequence - average  # center sequence around 0
     sequence = sequence * scale  # scale the variance
     sequence = sequence + average  # move center back to original with changed variance
     return sequence
+
+
+def _frame_durations(durations, duration_scaling_factor):
+    """
+    the amount of frames each phone ends up with after the length regulator
+    """
+    if duration_scaling_factor != 1.0:
+        durations = torch.round(durations.float() * duration_scaling_factor).long()
+    return durations
+
+
+def _regulated_lengths(durations, duration_scaling_factor):
+    """
+    the amount of frames each utterance ends up with after the length regulator
+    """
+    return _frame_durations(durations, duration_scaling_factor).sum(dim=1)
@@ -1,12 +1,19 @@
+import itertools
+import math
+
 import torch
 
 from Layers.ResidualBlock import HiFiGANResidualBlock as ResidualBlock
+from Utility.deployment_checkpoint import load_hifigan_checkpoint
+from Utility.deployment_checkpoint import share_weights
+from Utility.quantization import quantize_convolutions
 
 
 class HiFiGANGenerator(torch.nn.Module):
 
     def __init__(self,
-                 path_to_weights,
+                 path_to_weights=None,
+                 weights=None,
                  in_channels=80,
                  out_channels=1,
                  channels=512,
@@ -21,11 +28,28 @@ class HiFiGANGenerator(torch.nn.Module):
                  nonlinear_activation_params={"negative_slope": 0.1},
                  use_weight_norm=True, ):
         super().__init__()
+        if weights is None:
+            config, weights = load_hifigan_checkpoint(path_to_weights)
+            use_weight_norm = config.get("use_weight_norm", use_weight_norm)
         assert kernel_size % 2 == 1, "Kernal size must be odd number."
         assert len(upsample_scales) == len(upsample_kernel_sizes)
         assert len(resblock_dilations) == len(resblock_kernel_sizes)
         self.num_upsamples = len(upsample_kernel_sizes)
         self.num_blocks = len(resblock_kernel_sizes)
+        self.bfloat16 = False
+        self.hop_length = 1  # amount of samples that are generated for each frame of the spectrogram
+        for upsample_scale in upsample_scales:
+            self.hop_length *= upsample_scale
+        # amount of frames on each side of a frame that have an influence on the samples generated for it
+        receptive_field = (kernel_size - 1) // 2
+        samples_per_frame = 1
+        for upsample_scale, upsample_kernel_size in zip(upsample_scales, upsample_kernel_sizes):
+            receptive_field += upsample_kernel_size / upsample_scale / samples_per_frame
+            samples_per_frame *= upsample_scale
+            receptive_field += max(sum((resblock_kernel_size - 1) // 2 * (dilation + (1 if use_additional_convs else 0)) for dilation in dilations)
+                                   for resblock_kernel_size, dilations in zip(resblock_kernel_sizes, resblock_dilations)) / samples_per_frame
+        receptive_field += (kernel_size - 1) // 2 / samples_per_frame
+        self.receptive_field = math.ceil(receptive_field)
         self.input_conv = torch.nn.Conv1d(in_channels,
                                           channels,
                                           kernel_size,
@@ -59,20 +83,109 @@ class HiFiGANGenerator(torch.nn.Module):
             torch.nn.Tanh(), )
         if use_weight_norm:
             self.apply_weight_norm()
-        self.load_state_dict(torch.load(path_to_weights, map_location='cpu')["generator"])
+        self.load_state_dict(weights)
+        share_weights(self, weights)
 
     def forward(self, c, normalize_before=False):
-        if normalize_before:
-            c = (c - self.mean) / self.scale
-        c = self.input_conv(c.unsqueeze(0))
-        for i in range(self.num_upsamples):
-            c = self.upsamples[i](c)
-            cs = 0.0  # initialize
-            for j in range(self.num_blocks):
-                cs = cs + self.blocks[i * self.num_blocks + j](c)
-            c = cs / self.num_blocks
-        c = self.output_conv(c)
-        return c.squeeze(0).squeeze(0)
+        return self._generate(c.unsqueeze(0), normalize_before=normalize_before).squeeze(0).squeeze(0)
+
+    def batch_forward(self, c, lengths, normalize_before=False):
+        """
+        Generate the waves for a batch of spectrograms in a single forward pass.
+
+        Args:
+            c: batch of padded spectrograms (B, in_channels, Tmax)
+            lengths: amount of frames in each of the spectrograms (B,)
+
+        Returns:
+            list of waves, each trimmed to the amount of samples that belong to its frames
+
+        Note:
+            the last few frames of the shorter spectrograms see the padding within their receptive field,
+            so the very end of their waves can differ slightly from unbatched vocoding.
+        """
+        waves = self._generate(c, normalize_before=normalize_before).squeeze(1)
+        return [waves[index, :int(length) * self.hop_length] for index, length in enumerate(lengths)]
+
+    def stream(self, c, chunk_size=32, crossfade=2, context=None, normalize_before=False):
+        """
+        Generate the wave chunk by chunk, so the first samples are available long before the whole spectrogram is vocoded.
+
+        Args:
+            c: either a whole spectrogram (in_channels, T) or an iterable that yields consecutive pieces of a spectrogram (in_channels, t)
+            chunk_size: amount of frames that are vocoded in one step
+            crossfade: amount of frames by which consecutive chunks overlap, the overlap is crossfaded
+            context: amount of frames on the left and on the right that are vocoded along with each chunk and then discarded.
+                     Defaults to the receptive field, which makes the result match vocoding the whole spectrogram at once.
+
+        Yields:
+            consecutive pieces of the wave
+        """
+        assert chunk_size > crossfade, "Chunks must be longer than the crossfade."
+        if context is None:
+            context = self.receptive_field
+        if isinstance(c, torch.Tensor):
+            c = [c]
+        buffer = None  # the frames that are still needed, starting at the frame with the index buffer_start
+        buffer_start = 0
+        position = 0  # index of the first frame for which the wave has not been yielded yet
+        tail = None  # wave of the frames that overlap with the next chunk
+        for piece in itertools.chain(c, [None]):
+            finished = piece is None
+            if not finished:
+                buffer = piece if buffer is None else torch.cat([buffer, piece], dim=1)
+            if buffer is None:
+                return
+            available = buffer_start + buffer.size(1)
+            while position < available:
+                end = min(position + chunk_size, available)
+                overlap_end = min(end + crossfade, available)
+                if not finished and overlap_end + context > available:
+                    break  # wait until enough frames for the right context have arrived
+                window_start = max(position - context, 0)
+                window_end = min(overlap_end + context, available)
+                with torch.inference_mode():
+                    window = buffer[:, window_start - buffer_start:window_end - buffer_start].unsqueeze(0)
+                    wave = self._generate(window, normalize_before=normalize_before).squeeze(0).squeeze(0)
+                    wave = wave[(position - window_start) * self.hop_length:(overlap_end - window_start) * self.hop_length]
+                    if tail is not None:
+                        fade_in = torch.linspace(0.0, 1.0, len(tail), device=wave.device)
+                        wave = torch.cat([tail * (1.0 - fade_in) + wave[:len(tail)] * fade_in, wave[len(tail):]])
+                    split = (end - position) * self.hop_length
+                    tail = wave[split:] if overlap_end > end else None
+                    wave = wave[:split]
+                position = end
+                no_longer_needed = max(position - context, 0) - buffer_start
+                if no_longer_needed > 0:
+                    buffer = buffer[:, no_longer_needed:]
+                    buffer_start += no_longer_needed
+                yield wave
+
+    def span_forward(self, c, start, end, context=None, normalize_before=False):
+        """
+        Generate only the samples that belong to the frames from start to end of a spectrogram (in_channels, T).
+        The frames are vocoded along with context frames on each side, which defaults to the receptive field,
+        so the samples match the ones of vocoding the whole spectrogram.
+        """
+        if context is None:
+            context = self.receptive_field
+        window_start = max(start - context, 0)
+        window_end = min(end + context, c.size(1))
+        wave = self._generate(c[:, window_start:window_end].unsqueeze(0), normalize_before=normalize_before).squeeze(0).squeeze(0)
+        return wave[(start - window_start) * self.hop_length:(end - window_start) * self.hop_length]
+
+    def _generate(self, c, normalize_before=False):
+        with torch.autocast(device_type=c.device.type, dtype=torch.bfloat16, enabled=self.bfloat16):
+            if normalize_before:
+                c = (c - self.mean) / self.scale
+            c = self.input_conv(c)
+            for i in range(self.num_upsamples):
+                c = self.upsamples[i](c)
+                cs = 0.0  # initialize
+                for j in range(self.num_blocks):
+                    cs = cs + self.blocks[i * self.num_blocks + j](c)
+                c = cs / self.num_blocks
+        return self.output_conv(c.float())
 
     def remove_weight_norm(self):
         def _remove_weight_norm(m):
@@ -89,3 +202,33 @@ class HiFiGANGenerator(torch.nn.Module):
                 torch.nn.utils.weight_norm(m)
 
         self.apply(_apply_weight_norm)
+
+    def optimize_for_inference(self):
+        """
+        Weight norm only helps the training. As long as it is applied, every forward pass recomputes
+        the weights of every convolution from their direction and magnitude, so it is removed here.
+        Deployment checkpoints already store the resulting weights, for them this does nothing.
+        """
+        self.remove_weight_norm()
+        return self
+
+    def quantize(self, calibration_mels):
+        """
+        Quantizes the weights and activations of all convolutions to int8, for inference on CPU.
+        The ranges of the activations are calibrated on the given spectrograms (in_channels, T).
+        """
+        self.optimize_for_inference()
+        quantize_convolutions(self, lambda generator: [generator(mel) for mel in calibration_mels])
+        return self
+
+    def to_bfloat16(self):
+        """
+        Stores the weights in bfloat16 and generates under autocast, which uses the bfloat16 matrix
+        multiplications of recent CPUs. The last convolution and the tanh that produce the samples stay
+        in float32, bfloat16 has too few bits of mantissa for the wave itself.
+        """
+        self.optimize_for_inference()
+        self.to(torch.bfloat16)
+        self.output_conv.float()
+        self.bfloat16 = True
+        return self
@@ -1,66 +1,220 @@
+import hashlib
 import itertools
 import os
+import queue
+import threading
 
-import librosa.display as lbd
-import matplotlib.pyplot as plt
-import noisereduce
-import sounddevice
 import soundfile
 import torch
 
 from InferenceInterfaces.InferenceArchitectures.InferenceFastSpeech2 import FastSpeech2
+from InferenceInterfaces.InferenceArchitectures.InferenceFastSpeech2 import _frame_durations
 from InferenceInterfaces.InferenceArchitectures.InferenceHiFiGAN import HiFiGANGenerator
-from Preprocessing.ProsodicConditionExtractor import ProsodicConditionExtractor
-from Preprocessing.TextFrontend import ArticulatoryCombinedTextFrontend
+from Layers.SpectralGate import SpectralGate
+from Preprocessing.ProsodicConditionExtractor import SpeakerEmbeddingCache
+from Preprocessing.ProsodicConditionExtractor import get_prosodic_condition_extractor
+from Preprocessing.TextFrontend import get_frontend
 from Preprocessing.TextFrontend import get_language_id
+from Preprocessing.TextFrontend import preload_frontends
+from Utility.audio_cache import AudioCache
+from Utility.deployment_checkpoint import find_checkpoint
+from Utility.deployment_checkpoint import load_fastspeech_checkpoint
+from Utility.utils import LRUCache
+from Utility.utils import pad_list
+
+# phonemes of a few sentences of different lengths and intonations, the quantized vocoder is calibrated on their spectrograms
+_calibration_phones = ["ɪt wʌz ɐ bɹˈaɪt kˈoʊld dˈeɪ ɪn ˈeɪpɹəl, ænd ðə klˈɑːks wɜː stɹˈaɪkɪŋ θˈɜːtiːn.",
+                       "hˈaʊ mˈʌtʃ wʊd wʊd ɐ wˈʊdtʃʌk tʃˈʌk?",
+                       "jˈɛs!",
+                       "ðə kwˈɪk bɹˈaʊn fˈɑːks dʒˈʌmps ˌoʊvɚ ðə lˈeɪzi dˈɑːɡ, ænd ðˈɛn ɪt ɹˈʌnz əwˈeɪ ɪntʊ ðə fˈɑːɹəst."]
 
 
 class InferenceFastSpeech2(torch.nn.Module):
 
-    def __init__(self, device="cpu", model_name="Meta", language="en", noise_reduce=False):
+    def __init__(self,
+                 device="cpu",
+                 model_name="Meta",
+                 language="en",
+                 noise_reduce=False,
+                 preload_languages=None,
+                 embedding_cache_path=None,
+                 warmup=False,
+                 quantize=None,
+                 dtype=torch.float32,
+                 encoder_cache_size=32,
+                 audio_cache_dir=None,
+                 audio_cache_max_bytes=1024 ** 3):
+        """
+        preload_languages is an optional list of language shorthands whose text frontends are built right away,
+        so that the first switch to one of them with set_language does not have to wait for espeak to start.
+
+        embedding_cache_path is an optional npz file in which the speaker embeddings of reference audios are
+        stored, so a voice that has been used before does not need to be extracted again.
+
+        warmup runs one tiny synthesis right away, so the first real request does not pay for initializations.
+
+        quantize="int8" quantizes the linear layers of FastSpeech2 and the convolutions of HiFiGAN for faster
+        inference on CPU. The vocoder is calibrated on the spectrograms of a few sentences, which takes a moment.
+
+        dtype=torch.bfloat16 stores the weights in bfloat16 and runs the models under autocast, for CPUs with
+        bfloat16 matrix multiplications. The durations, the scaling of the variances and the samples of the wave
+        are still computed in float32.
+
+        encoder_cache_size is the amount of sentences for which the output of the encoder and the variance predictors
+        is kept in a least recently used cache, keyed by the phones, the speaker and the language. Rendering one of
+        them again, e.g. with different scaling factors, then only runs the decoder and the vocoder. 0 disables it.
+        Code that times the synthesis by running the same sentence several times must disable it, otherwise every
+        run after the first one skips the encoder.
+
+        audio_cache_dir is an optional directory in which the synthesized waves are stored, keyed by the checkpoints,
+        the text, the speaker, the language and the scaling factors. A text that has been synthesized before is then
+        read from there without running the text frontend or any of the models. Several processes can share the
+        directory. audio_cache_max_bytes limits its size, the waves that were used the longest time ago are deleted first.
+        """
         super().__init__()
         self.device = device
-        self.text2phone = ArticulatoryCombinedTextFrontend(language=language, add_silence_to_end=True)
-        checkpoint = torch.load(os.path.join("Models", f"FastSpeech2_{model_name}", "best.pt"), map_location='cpu')
-        self.use_lang_id = True
-        try:
-            self.phone2mel = FastSpeech2(weights=checkpoint["model"]).to(torch.device(device))  # multi speaker multi language
-        except RuntimeError:
-            try:
-                self.use_lang_id = False
-                self.phone2mel = FastSpeech2(weights=checkpoint["model"], lang_embs=None).to(torch.device(device))  # multi speaker single language
-            except RuntimeError:
-                self.phone2mel = FastSpeech2(weights=checkpoint["model"], lang_embs=None, utt_embed_dim=None).to(torch.device(device))  # single speaker
-        self.mel2wav = HiFiGANGenerator(path_to_weights=os.path.join("Models", "HiFiGAN_combined", "best.pt")).to(torch.device(device))
-        self.default_utterance_embedding = checkpoint["default_emb"].to(self.device)
+        self.language = language
+        if preload_languages is not None:
+            preload_frontends(preload_languages, add_silence_to_end=True)
+        self.text2phone = get_frontend(language, add_silence_to_end=True)
+        fastspeech_checkpoint = find_checkpoint(os.path.join("Models", f"FastSpeech2_{model_name}"))
+        hifigan_checkpoint = find_checkpoint(os.path.join("Models", "HiFiGAN_combined"))
+        config, weights, default_emb = load_fastspeech_checkpoint(fastspeech_checkpoint)
+        self.use_lang_id = config["lang_embs"] is not None
+        self.phone2mel = FastSpeech2(weights=weights, **config).to(torch.device(device))
+        self.mel2wav = HiFiGANGenerator(path_to_weights=hifigan_checkpoint).optimize_for_inference().to(torch.device(device))
+        self.default_utterance_embedding = default_emb.to(self.device)
         self.phone2mel.eval()
         self.mel2wav.eval()
         if self.use_lang_id:
             self.lang_id = get_language_id(language)
         else:
             self.lang_id = None
+        self.spectral_gate = SpectralGate(sr=48000)
+        self.noise_thresholds = dict()
         self.to(torch.device(device))
+        if quantize is not None and dtype != torch.float32:
+            raise ValueError("Quantization and a reduced precision dtype cannot be combined.")
+        if quantize == "int8":
+            self._quantize()
+        elif quantize is not None:
+            raise ValueError(f"Unknown quantization {quantize}, the only one that is supported is int8.")
+        if dtype == torch.bfloat16:
+            self.phone2mel.to_bfloat16()
+            self.mel2wav.to_bfloat16()
+        elif dtype != torch.float32:
+            raise ValueError(f"Unsupported dtype {dtype}, the models can run in torch.float32 or torch.bfloat16.")
+        self.speaker_embedding_cache = SpeakerEmbeddingCache(path=embedding_cache_path)
+        self.encoder_cache = LRUCache(max_size=encoder_cache_size)
+        self.last_render = None  # what synthesize_edit needs to know about the previous version of the text
+        self.playback = None  # the _Playback of the last read_aloud that streamed
+        self.audio_cache = AudioCache(audio_cache_dir, max_bytes=audio_cache_max_bytes) if audio_cache_dir is not None else None
+        # a retrained checkpoint is a new file, and the reduced precisions change the waves as well
+        self.models_key = repr([(os.path.abspath(checkpoint), os.path.getsize(checkpoint), os.path.getmtime(checkpoint))
+                                for checkpoint in [fastspeech_checkpoint, hifigan_checkpoint]] + [quantize, str(dtype)])
+        self._cache_embedding_projection()
         self.noise_reduce = noise_reduce
         if self.noise_reduce:
-            self.prototypical_noise = None
+            self.noise_threshold = None
             self.update_noise_profile()
+        if warmup:
+            self.warmup()
+
+    def warmup(self):
+        """
+        Runs one tiny synthesis, so that everything torch initializes lazily on the first
+        forward pass is ready before the first real request comes in.
+        """
+        with torch.inference_mode():
+            self("~.", input_is_phones=True)
+
+    def _quantize(self):
+        if torch.device(self.device).type != "cpu":
+            raise ValueError("Quantized models can only run on the CPU.")
+        self.phone2mel.quantize()
+        with torch.inference_mode():
+            calibration_mels = [self.phone2mel(self.text2phone.string_to_tensor(phones, input_phonemes=True),
+                                               utterance_embedding=self.default_utterance_embedding,
+                                               lang_id=self.lang_id).transpose(0, 1) for phones in _calibration_phones]
+        self.mel2wav.quantize(calibration_mels)
 
     def set_utterance_embedding(self, path_to_reference_audio):
-        wave, sr = soundfile.read(path_to_reference_audio)
-        self.default_utterance_embedding = ProsodicConditionExtractor(sr=sr).extract_condition_from_reference_wave(wave).to(self.device)
+        with open(path_to_reference_audio, "rb") as audio_file:
+            audio_hash = hashlib.sha256(audio_file.read()).hexdigest()
+        utterance_embedding = self.speaker_embedding_cache.get(audio_hash)
+        if utterance_embedding is None:
+            wave, sr = soundfile.read(path_to_reference_audio)
+            utterance_embedding = get_prosodic_condition_extractor(device=self.device).extract_condition_from_reference_wave(wave, sr=sr)
+            self.speaker_embedding_cache.put(audio_hash, utterance_embedding)
+        self.default_utterance_embedding = utterance_embedding.to(self.device)
+        self._cache_embedding_projection()
         if self.noise_reduce:
             self.update_noise_profile()
 
+    def _cache_embedding_projection(self):
+        if hasattr(self.phone2mel.encoder, "embedding_projection"):
+            with self.phone2mel.autocast():
+                self.phone2mel.encoder.cache_embedding_projection(self.default_utterance_embedding.unsqueeze(0))
+
+    def _predict(self, phones, utterance_embedding=None, language=None):
+        """
+        The output of the encoder and the variance predictors for the phones with the given speaker and language,
+        or the ones that are currently set, taken from the encoder cache if they have been rendered before.
+        """
+        if utterance_embedding is None:
+            utterance_embedding = self.default_utterance_embedding
+        if language is None:
+            language = self.language
+        lang_id = get_language_id(language).to(self.device) if self.use_lang_id else None
+        if self.encoder_cache.max_size <= 0:
+            return self.phone2mel.predict(phones, utterance_embedding=utterance_embedding, lang_id=lang_id)
+        key = (hashlib.sha256(phones.cpu().numpy().tobytes()).hexdigest(), self._speaker_key(utterance_embedding), language)
+        prediction = self.encoder_cache.get(key)
+        if prediction is None:
+            prediction = self.phone2mel.predict(phones, utterance_embedding=utterance_embedding, lang_id=lang_id)
+            self.encoder_cache.put(key, prediction)
+        return prediction
+
+    def _audio_cache_key(self, text, input_is_phones, duration_scaling_factor, pitch_variance_scale, energy_variance_scale, durations, pitch, energy):
+        """
+        The key of the wave for the text in the audio cache, None if there is no audio cache.
+        """
+        if self.audio_cache is None:
+            return None
+        key = hashlib.sha256(repr([self.models_key, text, input_is_phones, self._speaker_key(), self.language, self.noise_reduce,
+                                   duration_scaling_factor, pitch_variance_scale, energy_variance_scale]).encode("utf8"))
+        for curve in [durations, pitch, energy]:
+            key.update(b"-" if curve is None else curve.cpu().numpy().tobytes())
+        return key.hexdigest()
+
+    def _speaker_key(self, utterance_embedding=None):
+        if utterance_embedding is None:
+            utterance_embedding = self.default_utterance_embedding
+        return hashlib.sha256(utterance_embedding.cpu().numpy().tobytes()).hexdigest()
+
     def update_noise_profile(self):
-        self.noise_reduce = False
-        self.prototypical_noise = self("~." * 100, input_is_phones=True).cpu().numpy()
-        self.noise_reduce = True
+        """
+        The noise profile is computed from an utterance of nothing but silence. Since it only depends
+        on the speaker, it is computed once per speaker embedding and then reused.
+        """
+        speaker = self._speaker_key()
+        if speaker not in self.noise_thresholds:
+            self.noise_reduce = False
+            with torch.inference_mode():
+                prototypical_noise = self("~." * 100, input_is_phones=True)
+                self.noise_thresholds[speaker] = self.spectral_gate.noise_threshold(prototypical_noise)
+            self.noise_reduce = True
+        self.noise_threshold = self.noise_thresholds[speaker]
+
+    def _reduce_noise(self, wave):
+        return self.spectral_gate(wave, self.noise_threshold)
 
     def set_language(self, lang_id):
         """
         The id parameter actually refers to the shorthand. This has become ambiguous with the introduction of the actual language IDs
         """
-        self.text2phone = ArticulatoryCombinedTextFrontend(language=lang_id, add_silence_to_end=True)
+        self.language = lang_id
+        self.text2phone = get_frontend(lang_id, add_silence_to_end=True)
         if self.use_lang_id:
             self.lang_id = get_language_id(lang_id).to(self.device)
         else:
@@ -87,6 +241,13 @@ class InferenceFastSpeech2(torch.nn.Module):
                                    1.0 means no scaling happens, higher values increase variance of the energy curve,
                                    lower values decrease variance of the energy curve.
         """
+        # the plot needs the spectrogram and the durations, which the audio cache does not have
+        audio_cache_key = None if view else self._audio_cache_key(text, input_is_phones, duration_scaling_factor, pitch_variance_scale,
+                                                                  energy_variance_scale, durations, pitch, energy)
+        if audio_cache_key is not None:
+            wave = self.audio_cache.get(audio_cache_key)
+            if wave is not None:
+                return wave.to(self.device)
         with torch.inference_mode():
             phones = self.text2phone.string_to_tensor(text, input_phonemes=input_is_phones).to(torch.device(self.device))
             mel, durations, pitch, energy = self.phone2mel(phones,
@@ -98,10 +259,15 @@ class InferenceFastSpeech2(torch.nn.Module):
                                                            lang_id=self.lang_id,
                                                            duration_scaling_factor=duration_scaling_factor,
                                                            pitch_variance_scale=pitch_variance_scale,
-                                                           energy_variance_scale=energy_variance_scale)
+                                                           energy_variance_scale=energy_variance_scale,
+                                                           prediction=self._predict(phones))
             mel = mel.transpose(0, 1)
             wave = self.mel2wav(mel)
         if view:
+            # plotting libraries take a while to import, so they are only loaded when they are needed
+            import librosa.display as lbd
+            import matplotlib.pyplot as plt
+
             from Utility.utils import cumsum_durations
             fig, ax = plt.subplots(nrows=2, ncols=1)
             ax[0].plot(wave.cpu().numpy())
@@ -123,9 +289,260 @@ class InferenceFastSpeech2(torch.nn.Module):
             plt.subplots_adjust(left=0.05, bottom=0.1, right=0.95, top=.9, wspace=0.0, hspace=0.0)
             plt.show()
         if self.noise_reduce:
-            wave = torch.tensor(noisereduce.reduce_noise(y=wave.cpu().numpy(), y_noise=self.prototypical_noise, sr=48000, stationary=True), device=self.device)
+            wave = self._reduce_noise(wave)
+        if audio_cache_key is not None:
+            self.audio_cache.put(audio_cache_key, wave)
+        return wave
+
+    def synthesize(self,
+                   text,
+                   utterance_embedding=None,
+                   language=None,
+                   duration_scaling_factor=1.0,
+                   pitch_variance_scale=1.0,
+                   energy_variance_scale=1.0,
+                   input_is_phones=False):
+        """
+        Like forward, but the speaker and the language are arguments instead of the state that set_utterance_embedding
+        and set_language change, and nothing about the interface is changed, so several threads can synthesize with
+        different speakers and languages at the same time, see InferenceWorkerPool.
+
+        Args:
+            text: the text to be read
+            utterance_embedding: embedding of the speaker, the default utterance embedding if it is None
+            language: shorthand of the language, the language that is currently set if it is None
+            duration_scaling_factor: see forward
+            pitch_variance_scale: see forward
+            energy_variance_scale: see forward
+            input_is_phones: whether the text is already a phoneme string
+        """
+        if utterance_embedding is None:
+            utterance_embedding = self.default_utterance_embedding
+        utterance_embedding = utterance_embedding.to(self.device)
+        if language is None:
+            language = self.language
+        if get_language_id(language) is None:
+            # the text frontend would end the whole process for an unknown language
+            raise ValueError(f"Language {language} is not supported.")
+        wave = self._synthesize(text, utterance_embedding, language, duration_scaling_factor, pitch_variance_scale, energy_variance_scale, input_is_phones)
+        if self.noise_reduce:
+            wave = self.spectral_gate(wave, self._speaker_noise_threshold(utterance_embedding, language))
+        return wave
+
+    def _speaker_noise_threshold(self, utterance_embedding, language):
+        speaker = self._speaker_key(utterance_embedding)
+        if speaker not in self.noise_thresholds:
+            # like in update_noise_profile, but without switching the speaker of the whole interface
+            prototypical_noise = self._synthesize("~." * 100, utterance_embedding, language, 1.0, 1.0, 1.0, input_is_phones=True)
+            self.noise_thresholds[speaker] = self.spectral_gate.noise_threshold(prototypical_noise)
+        return self.noise_thresholds[speaker]
+
+    def _synthesize(self, text, utterance_embedding, language, duration_scaling_factor, pitch_variance_scale, energy_variance_scale, input_is_phones):
+        with torch.inference_mode():
+            phones = get_frontend(language, add_silence_to_end=True).string_to_tensor(text, input_phonemes=input_is_phones).to(torch.device(self.device))
+            mel = self.phone2mel(phones,
+                                 utterance_embedding=utterance_embedding,
+                                 lang_id=get_language_id(language).to(self.device) if self.use_lang_id else None,
+                                 duration_scaling_factor=duration_scaling_factor,
+                                 pitch_variance_scale=pitch_variance_scale,
+                                 energy_variance_scale=energy_variance_scale,
+                                 prediction=self._predict(phones, utterance_embedding=utterance_embedding, language=language))
+            return self.mel2wav(mel.transpose(0, 1))
+
+    def stream(self,
+               text,
+               duration_scaling_factor=1.0,
+               pitch_variance_scale=1.0,
+               energy_variance_scale=1.0,
+               input_is_phones=False,
+               chunk_size=32,
+               decoder_chunk_size=None,
+               decoder_context=50):
+        """
+        Like forward, but the wave is vocoded in chunks of chunk_size frames and every chunk is yielded as soon as it
+        is ready. This makes the first audio available much earlier for long sentences.
+
+        If decoder_chunk_size is set, the decoder also runs chunk by chunk over windows with decoder_context frames
+        of context on each side instead of over the whole utterance. This bounds the latency and the memory even for
+        paragraph-length inputs, at the cost of an approximation.
+        """
+        with torch.inference_mode():
+            phones = self.text2phone.string_to_tensor(text, input_phonemes=input_is_phones).to(torch.device(self.device))
+            prediction = self._predict(phones)
+        if decoder_chunk_size is None:
+            with torch.inference_mode():
+                mel = self.phone2mel(phones,
+                                     utterance_embedding=self.default_utterance_embedding,
+                                     lang_id=self.lang_id,
+                                     duration_scaling_factor=duration_scaling_factor,
+                                     pitch_variance_scale=pitch_variance_scale,
+                                     energy_variance_scale=energy_variance_scale,
+                                     prediction=prediction)
+            mel_pieces = mel.transpose(0, 1)
+        else:
+            mel_pieces = (mel.transpose(0, 1) for mel in self.phone2mel.stream_forward(phones,
+                                                                                       utterance_embedding=self.default_utterance_embedding,
+                                                                                       lang_id=self.lang_id,
+                                                                                       duration_scaling_factor=duration_scaling_factor,
+                                                                                       pitch_variance_scale=pitch_variance_scale,
+                                                                                       energy_variance_scale=energy_variance_scale,
+                                                                                       chunk_size=decoder_chunk_size,
+                                                                                       left_context=decoder_context,
+                                                                                       right_context=decoder_context,
+                                                                                       prediction=prediction))
+        waves = self.mel2wav.stream(mel_pieces, chunk_size=chunk_size)
+        if self.noise_reduce:
+            # the loudest bin of the whole utterance is not known before its last chunk, so the floor of the gate is
+            # put at the lowest threshold of the noise profile instead, which no bin can pass. The chunks are gated
+            # with the context that they depend on, so there are no seams between them.
+            waves = self.spectral_gate.stream(waves, self.noise_threshold, floor_db=self.noise_threshold.min())
+        for wave in waves:
+            yield wave
+
+    def synthesize_edit(self,
+                        text,
+                        duration_scaling_factor=1.0,
+                        pitch_variance_scale=1.0,
+                        energy_variance_scale=1.0,
+                        input_is_phones=False,
+                        margin=8,
+                        decoder_context=50,
+                        crossfade=2):
+        """
+        Like forward, but meant for a text that is edited and synthesized again, e.g. by a narrator who fixes a word in a
+        long paragraph. The phones are compared to the ones of the previous call, and the encoder states, durations, pitch,
+        energy, spectrogram frames and samples of the unchanged beginning and end are kept. Only the frames of the edited
+        phones and margin frames on each side of them go through the decoder and the vocoder again, and the new part of
+        the wave is crossfaded into the old one. So the time this takes grows with the size of the edit and not with the
+        length of the text. The first call and every call with a different speaker, language or scaling than the previous
+        one synthesize the whole text.
+
+        Args:
+            text: the new version of the text
+            duration_scaling_factor: see forward
+            pitch_variance_scale: see forward
+            energy_variance_scale: see forward
+            input_is_phones: whether the text is already a phoneme string
+            margin: amount of unchanged frames on each side of the edit that are generated again, so the edit blends in
+            decoder_context: amount of frames on each side that the decoder sees in addition to the frames it generates
+            crossfade: amount of frames on each side over which the new part of the wave is faded in, at most the margin
+
+        Returns:
+            the wave of the whole new version of the text
+        """
+        assert crossfade <= margin, "The crossfade has to lie within the margin."
+        settings = (self._speaker_key(), self.language, duration_scaling_factor, pitch_variance_scale, energy_variance_scale)
+        with torch.inference_mode():
+            phones = self.text2phone.string_to_tensor(text, input_phonemes=input_is_phones).to(torch.device(self.device))
+            prediction = self._predict(phones)
+            if self.last_render is None or self.last_render["settings"] != settings:
+                mel = self.phone2mel(phones,
+                                     utterance_embedding=self.default_utterance_embedding,
+                                     lang_id=self.lang_id,
+                                     duration_scaling_factor=duration_scaling_factor,
+                                     pitch_variance_scale=pitch_variance_scale,
+                                     energy_variance_scale=energy_variance_scale,
+                                     prediction=prediction)
+                wave = self.mel2wav(mel.transpose(0, 1))
+            else:
+                old_phones = self.last_render["phones"]
+                prefix = _common_prefix_length(old_phones, phones)
+                suffix = min(_common_prefix_length(old_phones.flip(0), phones.flip(0)), len(old_phones) - prefix, len(phones) - prefix)
+                # the unchanged phones keep what was predicted for them before, so their frames stay exactly where they were
+                prediction = tuple(torch.cat([old[:, :prefix], new[:, prefix:len(phones) - suffix], old[:, len(old_phones) - suffix:]], dim=1)
+                                   for old, new in zip(self.last_render["prediction"], prediction))
+                frame_durations = _frame_durations(prediction[1][0], duration_scaling_factor)
+                edit_start = int(frame_durations[:prefix].sum())
+                edit_end = int(frame_durations[:len(phones) - suffix].sum())
+                total_frames = int(frame_durations.sum())
+                shift = len(self.last_render["mel"]) - total_frames  # how much later the frames after the edit were in the previous version
+                start = max(edit_start - margin, 0)
+                end = min(edit_end + margin, total_frames)
+                if prefix == len(phones) == len(old_phones):
+                    mel = self.last_render["mel"]
+                    wave = self.last_render["wave"]
+                else:
+                    mel_span = self.phone2mel.span_forward(phones,
+                                                           start,
+                                                           end,
+                                                           utterance_embedding=self.default_utterance_embedding,
+                                                           lang_id=self.lang_id,
+                                                           duration_scaling_factor=duration_scaling_factor,
+                                                           pitch_variance_scale=pitch_variance_scale,
+                                                           energy_variance_scale=energy_variance_scale,
+                                                           context=decoder_context,
+                                                           prediction=prediction)
+                    mel = torch.cat([self.last_render["mel"][:start], mel_span, self.last_render["mel"][end + shift:]])
+                    hop_length = self.mel2wav.hop_length
+                    wave = _crossfade_splice(self.last_render["wave"],
+                                             self.mel2wav.span_forward(mel.transpose(0, 1), start, end),
+                                             start=start * hop_length,
+                                             end=(end + shift) * hop_length,
+                                             fade_in=crossfade * hop_length if start > 0 else 0,
+                                             fade_out=crossfade * hop_length if end < total_frames else 0)
+            self.last_render = dict(settings=settings, phones=phones, prediction=prediction, mel=mel, wave=wave)
+        if self.noise_reduce:
+            wave = self._reduce_noise(wave)
         return wave
 
+    def synthesize_batch(self,
+                         texts,
+                         speaker_embeddings=None,
+                         lang_ids=None,
+                         duration_scaling_factor=1.0,
+                         pitch_variance_scale=1.0,
+                         energy_variance_scale=1.0,
+                         input_is_phones=False):
+        """
+        Synthesizes several utterances with a single forward pass through the acoustic model. Every utterance can have its own speaker and language.
+
+        Args:
+            texts: A list of strings to be read
+            speaker_embeddings: A list with one utterance embedding per text. If the list or one of its entries is None,
+                                the default utterance embedding is used.
+            lang_ids: A list with one language shorthand per text. If the list or one of its entries is None,
+                      the language that is currently set is used.
+            duration_scaling_factor: see forward
+            pitch_variance_scale: see forward
+            energy_variance_scale: see forward
+            input_is_phones: whether the texts are already phoneme strings
+
+        Returns:
+            A list with one waveform per text
+        """
+        if speaker_embeddings is None:
+            speaker_embeddings = [None] * len(texts)
+        if lang_ids is None:
+            lang_ids = [None] * len(texts)
+        languages = [self.language if lang is None else lang for lang in lang_ids]
+        text_frontends = {lang: get_frontend(lang, add_silence_to_end=True) for lang in set(languages)}
+
+        with torch.inference_mode():
+            phones = [text_frontends[lang].string_to_tensor(text, input_phonemes=input_is_phones).to(torch.device(self.device))
+                      for text, lang in zip(texts, languages)]
+            utterance_embeddings = torch.stack([self.default_utterance_embedding if emb is None else emb.to(self.device) for emb in speaker_embeddings])
+            if self.use_lang_id:
+                batch_lang_ids = torch.cat([get_language_id(lang) for lang in languages]).to(self.device)
+            else:
+                batch_lang_ids = None
+            mels = self.phone2mel.batch_forward(phones,
+                                                utterance_embeddings=utterance_embeddings,
+                                                lang_ids=batch_lang_ids,
+                                                duration_scaling_factor=duration_scaling_factor,
+                                                pitch_variance_scale=pitch_variance_scale,
+                                                energy_variance_scale=energy_variance_scale)
+            if torch.device(self.device).type == "cpu":
+                # on the CPU, the activations of the vocoder for a whole batch no longer fit into the caches,
+                # which makes vocoding a batch slower than vocoding its utterances one after the other
+                waves = [self.mel2wav(mel.transpose(0, 1)) for mel in mels]
+            else:
+                waves = self.mel2wav.batch_forward(pad_list(mels, 0.0).transpose(1, 2), lengths=[len(mel) for mel in mels])
+        if self.noise_reduce:
+            # every utterance is gated with the noise profile of its own speaker
+            waves = [self.spectral_gate(wave, self._speaker_noise_threshold(utterance_embedding, language))
+                     for wave, utterance_embedding, language in zip(waves, utterance_embeddings, languages)]
+        return waves
+
     def read_to_file(self,
                      text_list,
                      file_location,
@@ -135,7 +552,8 @@ class InferenceFastSpeech2(torch.nn.Module):
                      silent=False,
                      dur_list=None,
                      pitch_list=None,
-                     energy_list=None):
+                     energy_list=None,
+                     queue_size=4):
         """
         Args:
             silent: Whether to be verbose about the process
@@ -153,6 +571,7 @@ class InferenceFastSpeech2(torch.nn.Module):
             energy_variance_scale: reasonable values are 0.0 < scale < 2.0.
                                    1.0 means no scaling happens, higher values increase variance of the energy curve,
                                    lower values decrease variance of the energy curve.
+            queue_size: how many sentences may wait between two stages of the pipeline
         """
         if not dur_list:
             dur_list = []
@@ -160,37 +579,71 @@ class InferenceFastSpeech2(torch.nn.Module):
             pitch_list = []
         if not energy_list:
             energy_list = []
-        wav = None
         silence = torch.zeros([24000])
-        for (text, durations, pitch, energy) in itertools.zip_longest(text_list, dur_list, pitch_list, energy_list):
-            if text.strip() != "":
-                if not silent:
-                    print("Now synthesizing: {}".format(text))
-                if wav is None:
-                    if durations is not None:
-                        durations = durations.to(self.device)
-                    if pitch is not None:
-                        pitch = pitch.to(self.device)
-                    if energy is not None:
-                        energy = energy.to(self.device)
-                    wav = self(text,
-                               durations=durations,
-                               pitch=pitch,
-                               energy=energy,
-                               duration_scaling_factor=duration_scaling_factor,
-                               pitch_variance_scale=pitch_variance_scale,
-                               energy_variance_scale=energy_variance_scale).cpu()
-                    wav = torch.cat((wav, silence), 0)
-                else:
-                    wav = torch.cat((wav, self(text,
-                                               durations=durations.to(self.device),
-                                               pitch=pitch.to(self.device),
-                                               energy=energy.to(self.device),
-                                               duration_scaling_factor=duration_scaling_factor,
-                                               pitch_variance_scale=pitch_variance_scale,
-                                               energy_variance_scale=energy_variance_scale).cpu()), 0)
-                    wav = torch.cat((wav, silence), 0)
-        soundfile.write(file=file_location, data=wav.cpu().numpy(), samplerate=48000)
+        sentences = [(text, durations, pitch, energy) for (text, durations, pitch, energy) in
+                     itertools.zip_longest(text_list, dur_list, pitch_list, energy_list) if text.strip() != ""]
+
+        def text_frontend(sentence):
+            text, durations, pitch, energy = sentence
+            if not silent:
+                print("Now synthesizing: {}".format(text))
+            audio_cache_key = self._audio_cache_key(text, False, duration_scaling_factor, pitch_variance_scale, energy_variance_scale, durations, pitch, energy)
+            if audio_cache_key is not None:
+                wave = self.audio_cache.get(audio_cache_key)
+                if wave is not None:
+                    # the wave is passed on through the other stages as it is
+                    return audio_cache_key, wave, None, None, None, None
+            with torch.inference_mode():
+                return audio_cache_key, None, self.text2phone.string_to_tensor(text).to(torch.device(self.device)), durations, pitch, energy
+
+        def acoustic_model(item):
+            audio_cache_key, cached_wave, phones, durations, pitch, energy = item
+            if cached_wave is not None:
+                return audio_cache_key, cached_wave, None
+            with torch.inference_mode():
+                mel = self.phone2mel(phones,
+                                     utterance_embedding=self.default_utterance_embedding,
+                                     durations=durations.to(self.device) if durations is not None else None,
+                                     pitch=pitch.to(self.device) if pitch is not None else None,
+                                     energy=energy.to(self.device) if energy is not None else None,
+                                     lang_id=self.lang_id,
+                                     duration_scaling_factor=duration_scaling_factor,
+                                     pitch_variance_scale=pitch_variance_scale,
+                                     energy_variance_scale=energy_variance_scale,
+                                     prediction=self._predict(phones))
+            return audio_cache_key, None, mel
+
+        def vocoder(item):
+            audio_cache_key, cached_wave, mel = item
+            if cached_wave is not None:
+                return cached_wave
+            with torch.inference_mode():
+                wave = self.mel2wav(mel.transpose(0, 1))
+            if self.noise_reduce:
+                wave = self._reduce_noise(wave)
+            if audio_cache_key is not None:
+                self.audio_cache.put(audio_cache_key, wave)
+            return wave.cpu()
+
+        # the three stages run concurrently and hand their results on through bounded queues,
+        # so every stage stays busy while the memory needed stays the same, no matter how long the text is.
+        phone_queue = queue.Queue(maxsize=queue_size)
+        mel_queue = queue.Queue(maxsize=queue_size)
+        wave_queue = queue.Queue(maxsize=queue_size)
+        failures = list()
+        with soundfile.SoundFile(file_location, mode="w", samplerate=48000, channels=1) as audio_file:
+            stages = [threading.Thread(target=_pipeline_stage, args=(text_frontend, sentences, phone_queue, failures), daemon=True),
+                      threading.Thread(target=_pipeline_stage, args=(acoustic_model, iter(phone_queue.get, None), mel_queue, failures), daemon=True),
+                      threading.Thread(target=_pipeline_stage, args=(vocoder, iter(mel_queue.get, None), wave_queue, failures), daemon=True)]
+            for stage in stages:
+                stage.start()
+            for wave in iter(wave_queue.get, None):
+                audio_file.write(wave.numpy())
+                audio_file.write(silence.numpy())
+            for stage in stages:
+                stage.join()
+        if failures:
+            raise failures[0]
 
     def read_aloud(self,
                    text,
@@ -201,14 +654,113 @@ class InferenceFastSpeech2(torch.nn.Module):
                    blocking=False):
         if text.strip() == "":
             return
+        # a new text replaces what is still playing, like sounddevice.play does
+        self._stop_playback()
+        if not view:
+            # playback starts with the first chunk, the plot however needs the whole wave. The chunks are
+            # synthesized on this thread, since the models must not run on two threads at once, only the playback
+            # goes on in the background.
+            self.playback = _Playback(trailing_silence=36000 if blocking else 24000)
+            try:
+                for wave in self.stream(text,
+                                        duration_scaling_factor=duration_scaling_factor,
+                                        pitch_variance_scale=pitch_variance_scale,
+                                        energy_variance_scale=energy_variance_scale):
+                    self.playback.chunks.put(wave.unsqueeze(1).cpu().numpy())
+            finally:
+                self.playback.chunks.put(None)
+            if blocking:
+                self._stop_playback(finish=True)
+            return
         wav = self(text,
                    view,
                    duration_scaling_factor=duration_scaling_factor,
                    pitch_variance_scale=pitch_variance_scale,
                    energy_variance_scale=energy_variance_scale).cpu()
         wav = torch.cat((wav, torch.zeros([24000])), 0)
+        import sounddevice
         if not blocking:
             sounddevice.play(wav.numpy(), samplerate=48000)
         else:
             sounddevice.play(torch.cat((wav, torch.zeros([12000])), 0).numpy(), samplerate=48000)
             sounddevice.wait()
+
+    def _stop_playback(self, finish=False):
+        """
+        Stops the playback of the previous read_aloud, or waits until it is finished, and raises what went wrong in it.
+        """
+        playback, self.playback = self.playback, None
+        if playback is None:
+            return
+        if not finish:
+            playback.stopped.set()
+        playback.thread.join()
+        if playback.error is not None:
+            raise playback.error
+
+
+class _Playback:
+    """
+    Plays the chunks that are put into its queue on a thread of its own, until None is put into it or it is stopped.
+    An error of the playback is kept, so the next call of read_aloud can raise it.
+    """
+
+    def __init__(self, trailing_silence):
+        self.chunks = queue.Queue()
+        self.stopped = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._play, args=(trailing_silence,), daemon=True)
+        self.thread.start()
+
+    def _play(self, trailing_silence):
+        try:
+            import sounddevice
+            sounddevice.stop()  # what sounddevice.play still plays from an earlier call
+            with sounddevice.OutputStream(samplerate=48000, channels=1, dtype="float32") as output_stream:
+                while True:
+                    chunk = self.chunks.get()
+                    if self.stopped.is_set():
+                        output_stream.abort()
+                        break
+                    if chunk is None:
+                        output_stream.write(torch.zeros([trailing_silence, 1]).numpy())
+                        break
+                    output_stream.write(chunk)
+        except Exception as error:
+            self.error = error
+
+
+def _common_prefix_length(phones, other_phones):
+    """
+    amount of vectorized phones at the beginning of both sequences that are the same
+    """
+    length = min(len(phones), len(other_phones))
+    differences = (phones[:length] != other_phones[:length]).any(dim=1).nonzero()
+    return int(differences[0]) if len(differences) > 0 else length
+
+
+def _crossfade_splice(wave, piece, start, end, fade_in, fade_out):
+    """
+    Replaces the samples from start to end of the wave with the piece. The first fade_in samples of the piece are crossfaded
+    with the samples of the wave from start on and the last fade_out samples with the samples of the wave up to end.
+    """
+    fade = torch.linspace(0.0, 1.0, fade_in, device=piece.device)
+    beginning = wave[start:start + fade_in] * (1.0 - fade) + piece[:fade_in] * fade
+    fade = torch.linspace(1.0, 0.0, fade_out, device=piece.device)
+    ending = piece[len(piece) - fade_out:] * fade + wave[end - fade_out:end] * (1.0 - fade)
+    return torch.cat([wave[:start], beginning, piece[fade_in:len(piece) - fade_out], ending, wave[end:]])
+
+
+def _pipeline_stage(work, items, results, failures):
+    """
+    Applies work to every item and puts the results into the results queue, followed by None to signal the end.
+    After a failure, the remaining items are still consumed, so the stages before this one don't get stuck.
+    """
+    for item in items:
+        if failures:
+            continue
+        try:
+            results.put(work(item))
+        except Exception as error:
+            failures.append(error)
+    results.put(None)
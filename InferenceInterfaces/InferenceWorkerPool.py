@@ -0,0 +1,102 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+
+
+class InferenceWorkerPool:
+    """
+    Runs requests on several threads that share the weights of one InferenceFastSpeech2.
+
+    One instance that runs with all the cores of a large machine spends much of its time waiting for its threads
+    to synchronize, since the matrices of a single utterance are too small to keep many cores busy. Several workers
+    with a few threads each, every one of them working on a request of its own, make better use of the cores.
+    Every worker has its own budget of intra-op threads and can be pinned to cores of its own, so the workers
+    don't compete for the same caches. The speaker and the language are arguments of every request.
+    """
+
+    def __init__(self, tts, workers=None, threads_per_worker=None, pin_to_cores=False):
+        """
+        Args:
+            tts: the InferenceFastSpeech2 whose models the workers share
+            workers: amount of requests that run at the same time, defaults to one for every 8 available cores
+            threads_per_worker: intra-op threads of every worker, defaults to an equal share of the available cores
+            pin_to_cores: whether every worker is restricted to cores of its own, which needs workers * threads_per_worker
+                          available cores and only works on Linux
+        """
+        available_cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+        if workers is None:
+            workers = max(1, len(available_cores) // 8)
+        if threads_per_worker is None:
+            threads_per_worker = max(1, len(available_cores) // workers)
+        if pin_to_cores and workers * threads_per_worker > len(available_cores):
+            raise ValueError(f"{workers} workers with {threads_per_worker} threads each need more than the {len(available_cores)} available cores to be pinned.")
+        self.tts = tts
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._jobs = queue.Queue()
+        self._threads = list()
+        for index in range(workers):
+            cores = set(available_cores[index * threads_per_worker:(index + 1) * threads_per_worker]) if pin_to_cores else None
+            thread = threading.Thread(target=self._work, args=(cores,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self, cores):
+        # both only apply to the calling thread, and the threads that torch starts from it inherit them
+        torch.set_num_threads(self.threads_per_worker)
+        if cores is not None:
+            os.sched_setaffinity(0, cores)
+        for future, arguments in iter(self._jobs.get, None):
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.tts.synthesize(**arguments))
+            except Exception as error:
+                future.set_exception(error)
+
+    def submit(self,
+               text,
+               utterance_embedding=None,
+               language=None,
+               duration_scaling_factor=1.0,
+               pitch_variance_scale=1.0,
+               energy_variance_scale=1.0,
+               input_is_phones=False):
+        """
+        Queues a request, the arguments mean the same as for InferenceFastSpeech2.synthesize.
+
+        Returns:
+            a concurrent.futures.Future of the wave
+        """
+        future = Future()
+        self._jobs.put((future, dict(text=text,
+                                     utterance_embedding=utterance_embedding,
+                                     language=language,
+                                     duration_scaling_factor=duration_scaling_factor,
+                                     pitch_variance_scale=pitch_variance_scale,
+                                     energy_variance_scale=energy_variance_scale,
+                                     input_is_phones=input_is_phones)))
+        return future
+
+    def map(self, texts, utterance_embeddings=None, languages=None, **kwargs):
+        """
+        Synthesizes all the texts, every one of them with its own speaker and language if they are given, and
+        returns the waves in the same order. The keyword arguments apply to all of the texts.
+        """
+        utterance_embeddings = utterance_embeddings or [None] * len(texts)
+        languages = languages or [None] * len(texts)
+        futures = [self.submit(text, utterance_embedding=utterance_embedding, language=language, **kwargs)
+                   for text, utterance_embedding, language in zip(texts, utterance_embeddings, languages)]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        """
+        Lets the workers finish the requests that are queued already and waits for them.
+        """
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,94 @@
+import itertools
+import os
+
+import soundfile
+import torch
+
+from Preprocessing.TextFrontend import get_frontend
+from Preprocessing.TextFrontend import get_language_id
+
+
+class ScriptedFastSpeech2(torch.nn.Module):
+    """
+    Runs the TorchScript modules that run_torchscript_export.py produces. Only needs the text frontend,
+    none of the code of the models, so it can be deployed without the rest of the toolkit.
+    """
+
+    def __init__(self, device="cpu", model_name="Meta", language="en"):
+        super().__init__()
+        self.device = device
+        self.phone2mel = torch.jit.load(os.path.join("Models", f"FastSpeech2_{model_name}", "phone2mel.jit"), map_location=torch.device(device))
+        self.mel2wav = torch.jit.load(os.path.join("Models", "HiFiGAN_combined", "mel2wav.jit"), map_location=torch.device(device))
+        self.default_utterance_embedding = self.phone2mel.default_utterance_embedding
+        self.set_language(language)
+
+    def set_language(self, lang_id):
+        """
+        The id parameter actually refers to the shorthand. This has become ambiguous with the introduction of the actual language IDs
+        """
+        self.language = lang_id
+        self.text2phone = get_frontend(lang_id, add_silence_to_end=True)
+        # models without a language embedding ignore the id
+        self.lang_id = get_language_id(lang_id).to(self.device)
+
+    def set_utterance_embedding(self, utterance_embedding):
+        """
+        Takes an embedding that was extracted beforehand, e.g. with the ProsodicConditionExtractor,
+        since the extraction from audio needs libraries that the runtime does without.
+        """
+        self.default_utterance_embedding = utterance_embedding.to(self.device)
+
+    def forward(self,
+                text,
+                duration_scaling_factor=1.0,
+                pitch_variance_scale=1.0,
+                energy_variance_scale=1.0,
+                durations=None,
+                pitch=None,
+                energy=None,
+                input_is_phones=False):
+        """
+        The arguments mean the same as for InferenceFastSpeech2.forward
+        """
+        with torch.inference_mode():
+            phones = self.text2phone.string_to_tensor(text, input_phonemes=input_is_phones).to(torch.device(self.device))
+            mel, _, _, _ = self.phone2mel(phones,
+                                          self.default_utterance_embedding,
+                                          self.lang_id,
+                                          durations.to(self.device) if durations is not None else None,
+                                          pitch.to(self.device) if pitch is not None else None,
+                                          energy.to(self.device) if energy is not None else None,
+                                          float(duration_scaling_factor),
+                                          float(pitch_variance_scale),
+                                          float(energy_variance_scale))
+            return self.mel2wav(mel.transpose(0, 1))
+
+    def read_to_file(self,
+                     text_list,
+                     file_location,
+                     duration_scaling_factor=1.0,
+                     pitch_variance_scale=1.0,
+                     energy_variance_scale=1.0,
+                     silent=False,
+                     dur_list=None,
+                     pitch_list=None,
+                     energy_list=None):
+        """
+        The arguments mean the same as for InferenceFastSpeech2.read_to_file
+        """
+        silence = torch.zeros([24000])
+        with soundfile.SoundFile(file_location, mode="w", samplerate=48000, channels=1) as audio_file:
+            for (text, durations, pitch, energy) in itertools.zip_longest(text_list, dur_list or [], pitch_list or [], energy_list or []):
+                if text.strip() == "":
+                    continue
+                if not silent:
+                    print("Now synthesizing: {}".format(text))
+                wave = self(text,
+                            durations=durations,
+                            pitch=pitch,
+                            energy=energy,
+                            duration_scaling_factor=duration_scaling_factor,
+                            pitch_variance_scale=pitch_variance_scale,
+                            energy_variance_scale=energy_variance_scale)
+                audio_file.write(wave.cpu().numpy())
+                audio_file.write(silence.numpy())
@@ -0,0 +1,307 @@
+"""
+HTTP server around InferenceFastSpeech2 that synthesizes concurrent requests in batches.
+
+The requests that arrive within a short window are grouped by their scaling factors and by the
+length of their phoneme sequences, and every group goes through the acoustic model and the vocoder
+as one padded batch. Grouping by length keeps the padding, and with it the wasted computation and
+the difference to unbatched synthesis, small. The group with the most urgent request runs first.
+A request that cannot be answered before its deadline anymore is dropped, and new requests are
+turned away while too many are waiting already, so the latency stays bounded under overload.
+
+    POST /synthesize  {"text": "...", "language": "en", "deadline": 2.0, "duration_scaling_factor": 1.0,
+                       "pitch_variance_scale": 1.0, "energy_variance_scale": 1.0}
+                      everything but the text is optional, the deadline is in seconds after the request arrived.
+                      200 with the wave as 16 bit wav, 400 for a bad request or a text that cannot be phonemized,
+                      413 for a body of more than a megabyte, 500 if the synthesis failed, 503 if the queue is full,
+                      504 if the synthesis could not be finished before the deadline anymore when its turn came
+    GET /health       200 with the state of the queue as JSON
+
+Only needs the standard library on top of the toolkit itself, so it runs without a connection to the internet.
+"""
+
+import asyncio
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile
+
+from Preprocessing.TextFrontend import get_frontend
+from Preprocessing.TextFrontend import get_language_id
+
+_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+            504: "Gateway Timeout"}
+_max_body_size = 1024 ** 2  # much more than any text that is read in one request
+
+
+class _MalformedRequest(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _Request:
+
+    def __init__(self, text, language, scales, arrival, deadline, length, future):
+        self.text = text
+        self.language = language
+        self.scales = scales  # duration_scaling_factor, pitch_variance_scale and energy_variance_scale
+        self.arrival = arrival
+        self.deadline = deadline  # in the time of the event loop, None if there is none
+        self.length = length  # amount of phones
+        self.future = future
+
+    def urgency(self):
+        # requests with a deadline come first, then the ones that have been waiting the longest
+        return (self.deadline is None, self.deadline or 0.0, self.arrival)
+
+
+class SynthesisServer:
+
+    def __init__(self, tts, max_batch_size=8, batch_window=0.02, max_queue_depth=32, max_length_ratio=1.5):
+        """
+        Args:
+            tts: the InferenceFastSpeech2 that synthesizes the requests
+            max_batch_size: largest amount of requests that are synthesized together
+            batch_window: seconds that the first request of a batch waits for more requests to join it
+            max_queue_depth: amount of requests that may wait or be synthesized at the same time, more are rejected
+            max_length_ratio: how much longer the longest phoneme sequence in a batch may be than the shortest one
+        """
+        self.tts = tts
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.max_queue_depth = max_queue_depth
+        self.max_length_ratio = max_length_ratio
+        self.pending = list()  # requests that are phonemized and wait for their batch
+        self.admitted = 0  # requests that have been accepted and not answered yet
+        self.batch_count = 0
+        self.batched_requests = 0
+        self.rejected = 0
+        self.expired = 0
+        self.seconds_per_phone = 0.0  # moving average of how long the synthesis takes, to tell which deadlines cannot be met anymore
+        self._arrived = None
+        # the text frontend gets a thread of its own, so the phonemization of new requests overlaps with the synthesis
+        self._frontend_executor = ThreadPoolExecutor(max_workers=1)
+        self._model_executor = ThreadPoolExecutor(max_workers=1)
+
+    async def serve(self, host="127.0.0.1", port=8000, sock=None):
+        """
+        Serves until the task is cancelled. Listens on the socket if one is given, otherwise on the host and the port.
+        """
+        self._arrived = asyncio.Event()
+        batch_loop = asyncio.ensure_future(self._batch_loop())
+        if sock is not None:
+            server = await asyncio.start_server(self._handle_connection, sock=sock)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host=host, port=port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batch_loop.cancel()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            try:
+                method, path, body = await _read_request(reader)
+            except _MalformedRequest as error:
+                await _respond(writer, error.status, "text/plain", str(error).encode("utf8"))
+                return
+            if method == "GET" and path == "/health":
+                await _respond(writer, 200, "application/json", json.dumps(self.health()).encode("utf8"))
+            elif method == "POST" and path == "/synthesize":
+                status, content_type, content = await self._synthesize_request(body)
+                await _respond(writer, status, content_type, content)
+            else:
+                await _respond(writer, 404, "text/plain", b"Unknown endpoint")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # the client went away
+        finally:
+            writer.close()
+
+    async def _synthesize_request(self, body):
+        loop = asyncio.get_running_loop()
+        try:
+            arguments = json.loads(body)
+            text = arguments["text"]
+            language = arguments.get("language", self.tts.language)
+            scales = (float(arguments.get("duration_scaling_factor", 1.0)),
+                      float(arguments.get("pitch_variance_scale", 1.0)),
+                      float(arguments.get("energy_variance_scale", 1.0)))
+            deadline = float(arguments["deadline"]) if arguments.get("deadline") is not None else None
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            return 400, "text/plain", f"Malformed request: {error!r}".encode("utf8")
+        if not isinstance(text, str) or text.strip() == "":
+            return 400, "text/plain", b"The text must be a string that is not empty."
+        if get_language_id(language) is None:
+            return 400, "text/plain", f"Unsupported language {language}".encode("utf8")
+        if self.admitted >= self.max_queue_depth:
+            self.rejected += 1
+            return 503, "text/plain", b"Too many requests are waiting, try again later."
+        arrival = loop.time()
+        request = _Request(text=text,
+                           language=language,
+                           scales=scales,
+                           arrival=arrival,
+                           deadline=arrival + deadline if deadline is not None else None,
+                           length=None,
+                           future=loop.create_future())
+        self.admitted += 1
+        try:
+            try:
+                request.length = await loop.run_in_executor(self._frontend_executor, _phone_count, text, language)
+            except (ValueError, KeyError, IndexError) as error:
+                return 400, "text/plain", f"The text could not be phonemized: {error!r}".encode("utf8")
+            except Exception as error:
+                return 500, "text/plain", f"The phonemization failed: {error!r}".encode("utf8")
+            self.pending.append(request)
+            self._arrived.set()
+            try:
+                wave = await request.future
+            except Exception as error:
+                return 500, "text/plain", f"The synthesis failed: {error!r}".encode("utf8")
+            if wave is None:
+                return 504, "text/plain", b"The deadline passed before the synthesis could start."
+            return 200, "audio/wav", await loop.run_in_executor(self._frontend_executor, _to_wav, wave)
+        finally:
+            self.admitted -= 1
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.pending:
+                self._arrived.clear()
+                await self._arrived.wait()
+            # the oldest request waits for others to join it for at most the batch window
+            oldest = min(request.arrival for request in self.pending)
+            while len(self.pending) < self.max_batch_size and loop.time() < oldest + self.batch_window:
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), timeout=oldest + self.batch_window - loop.time())
+                except asyncio.TimeoutError:
+                    break
+            # the requests whose connection was closed in the meantime have been cancelled
+            self.pending = [request for request in self.pending if not request.future.done()]
+            if not self.pending:
+                continue
+            now = loop.time()
+            # even on its own, the synthesis of these would not be finished before their deadline
+            for request in [request for request in self.pending if request.deadline is not None and now + request.length * self.seconds_per_phone > request.deadline]:
+                self.pending.remove(request)
+                self.expired += 1
+                request.future.set_result(None)
+            if not self.pending:
+                continue
+            batch = self._next_batch()
+            for request in batch:
+                self.pending.remove(request)
+            self.batch_count += 1
+            self.batched_requests += len(batch)
+            start = loop.time()
+            try:
+                waves = await loop.run_in_executor(self._model_executor, self._synthesize, batch)
+            except Exception as error:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(error)
+                continue
+            seconds_per_phone = (loop.time() - start) / sum(request.length for request in batch)
+            self.seconds_per_phone = seconds_per_phone if self.batch_count == 1 else 0.8 * self.seconds_per_phone + 0.2 * seconds_per_phone
+            for request, wave in zip(batch, waves):
+                # setting the result of a request that was cancelled while it was synthesized would raise and end this loop
+                if not request.future.done():
+                    request.future.set_result(wave)
+
+    def _next_batch(self):
+        """
+        Groups the waiting requests that can share a batch and returns the group with the most urgent request.
+        Requests with the same scaling factors are sorted by their length and split into groups whenever a group
+        is full or the next request is too much longer than the shortest one in the group.
+        """
+        groups = list()
+        for scales in {request.scales for request in self.pending}:
+            group = list()
+            for request in sorted([request for request in self.pending if request.scales == scales], key=lambda request: request.length):
+                if len(group) == self.max_batch_size or (group and request.length > group[0].length * self.max_length_ratio):
+                    groups.append(group)
+                    group = list()
+                group.append(request)
+            groups.append(group)
+        return min(groups, key=lambda group: min(request.urgency() for request in group))
+
+    def _synthesize(self, batch):
+        duration_scaling_factor, pitch_variance_scale, energy_variance_scale = batch[0].scales
+        return [wave.cpu() for wave in self.tts.synthesize_batch([request.text for request in batch],
+                                                                 lang_ids=[request.language for request in batch],
+                                                                 duration_scaling_factor=duration_scaling_factor,
+                                                                 pitch_variance_scale=pitch_variance_scale,
+                                                                 energy_variance_scale=energy_variance_scale)]
+
+    def health(self):
+        return {"queued": len(self.pending),
+                "admitted": self.admitted,
+                "batches": self.batch_count,
+                "average_batch_size": self.batched_requests / self.batch_count if self.batch_count else None,
+                "rejected": self.rejected,
+                "expired": self.expired}
+
+
+def _phone_count(text, language):
+    return len(get_frontend(language, add_silence_to_end=True).string_to_tensor(text))
+
+
+def _to_wav(wave):
+    wav_file = io.BytesIO()
+    soundfile.write(wav_file, wave.numpy(), samplerate=48000, format="WAV", subtype="PCM_16")
+    return wav_file.getvalue()
+
+
+async def _read_request(reader):
+    """
+    Reads a request with HTTP/1.1 framing and returns its method, its path and its body.
+    Raises _MalformedRequest for anything that is not such a request.
+    """
+    request_line = await _read_line(reader)
+    if not request_line:
+        raise ConnectionResetError("The client closed the connection without sending a request.")
+    request_line = request_line.strip().split(" ")
+    if len(request_line) != 3:
+        raise _MalformedRequest(400, "Malformed request line")
+    method, path, _ = request_line
+    content_length = 0
+    while True:
+        line = (await _read_line(reader)).strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            try:
+                content_length = int(value)
+            except ValueError:
+                content_length = -1
+            if content_length < 0:
+                raise _MalformedRequest(400, f"Malformed Content-Length {value.strip()}")
+    if content_length > _max_body_size:
+        raise _MalformedRequest(413, f"The body may be at most {_max_body_size} bytes long")
+    body = await reader.readexactly(content_length) if content_length else b""
+    return method, path, body
+
+
+async def _read_line(reader):
+    try:
+        return (await reader.readline()).decode("latin-1")
+    except ValueError:
+        # longer than the limit of the reader
+        raise _MalformedRequest(400, "Line too long")
+
+
+async def _respond(writer, status, content_type, content):
+    headers = [f"HTTP/1.1 {status} {_reasons[status]}",
+               f"Content-Type: {content_type}",
+               f"Content-Length: {len(content)}",
+               "Connection: close"]  # every connection carries a single request, which keeps the framing trivial
+    if status == 503:
+        headers.append("Retry-After: 1")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + content)
+    await writer.drain()
@@ -43,13 +43,14 @@ class Conformer(torch.nn.Module):
         use_cnn_module (bool): Whether to use convolution module.
         cnn_module_kernel (int): Kernerl size of convolution module.
         padding_idx (int): Padding idx for input_layer=embed.
+        mask_padding (bool): Whether the convolution modules keep the padded frames out, for batched inference.
 
     """
 
     def __init__(self, idim, attention_dim=256, attention_heads=4, linear_units=2048, num_blocks=6, dropout_rate=0.1, positional_dropout_rate=0.1,
                  attention_dropout_rate=0.0, input_layer="conv2d", normalize_before=True, concat_after=False, positionwise_conv_kernel_size=1,
                  macaron_style=False, use_cnn_module=False, cnn_module_kernel=31, zero_triu=False, utt_embed=None, connect_utt_emb_at_encoder_out=True,
-                 spk_emb_bottleneck_size=128, lang_embs=None):
+                 spk_emb_bottleneck_size=128, lang_embs=None, mask_padding=False):
         super(Conformer, self).__init__()
 
         activation = Swish()
@@ -72,6 +73,7 @@ class Conformer(torch.nn.Module):
             # embedding projection derived from https://arxiv.org/pdf/1705.08947.pdf
             self.embedding_projection = torch.nn.Sequential(torch.nn.Linear(utt_embed, spk_emb_bottleneck_size),
                                                             torch.nn.Softsign())
+            self.cached_projection = None
         if lang_embs is not None:
             self.language_embedding = torch.nn.Embedding(num_embeddings=lang_embs, embedding_dim=attention_dim)
 
@@ -85,7 +87,7 @@ class Conformer(torch.nn.Module):
 
         # convolution module definition
         convolution_layer = ConvolutionModule
-        convolution_layer_args = (attention_dim, cnn_module_kernel, activation)
+        convolution_layer_args = (attention_dim, cnn_module_kernel, activation, True, mask_padding)
 
         self.encoders = repeat(num_blocks, lambda lnum: EncoderLayer(attention_dim, encoder_selfattn_layer(*encoder_selfattn_layer_args),
                                                                      positionwise_layer(*positionwise_layer_args),
@@ -132,10 +134,26 @@ class Conformer(torch.nn.Module):
 
         return xs, masks
 
+    def cache_embedding_projection(self, utt_embeddings):
+        """
+        Precomputes the projection of an utterance embedding, e.g. the one of the speaker that is currently set
+        during inference. It is reused whenever the same embedding comes in again while the model is in eval mode
+        and gradients are disabled. Has to be called again if the weights change.
+        """
+        with torch.no_grad():
+            self.cached_projection = (utt_embeddings.detach().clone(), F.normalize(self.embedding_projection(utt_embeddings)))
+
     def _integrate_with_utt_embed(self, hs, utt_embeddings):
-        # project embedding into smaller space
-        speaker_embeddings_projected = self.embedding_projection(utt_embeddings)
+        cached_projection = self.cached_projection  # read only once, another thread might cache a different embedding in the meantime
+        if (not self.training and not torch.is_grad_enabled() and cached_projection is not None
+                and cached_projection[0].shape == utt_embeddings.shape
+                and cached_projection[0].device == utt_embeddings.device
+                and torch.equal(cached_projection[0], utt_embeddings)):
+            speaker_embeddings_projected = cached_projection[1]
+        else:
+            # project embedding into smaller space
+            speaker_embeddings_projected = F.normalize(self.embedding_projection(utt_embeddings))
         # concat hidden states with spk embeds and then apply projection
-        speaker_embeddings_expanded = F.normalize(speaker_embeddings_projected).unsqueeze(1).expand(-1, hs.size(1), -1)
+        speaker_embeddings_expanded = speaker_embeddings_projected.unsqueeze(1).expand(-1, hs.size(1), -1)
         hs = self.hs_emb_projection(torch.cat([hs, speaker_embeddings_expanded], dim=-1))
         return hs
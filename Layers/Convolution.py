@@ -6,6 +6,8 @@
 
 from torch import nn
 
+from Utility.utils import masked_group_norm
+
 
 class ConvolutionModule(nn.Module):
     """
@@ -14,10 +16,12 @@ class ConvolutionModule(nn.Module):
     Args:
         channels (int): The number of channels of conv layers.
         kernel_size (int): Kernel size of conv layers.
+        mask_padding (bool): Whether the padded frames are kept out of the convolution and the normalization.
+                             Only batched inference needs this, training keeps the statistics of the padded batch.
 
     """
 
-    def __init__(self, channels, kernel_size, activation=nn.ReLU(), bias=True):
+    def __init__(self, channels, kernel_size, activation=nn.ReLU(), bias=True, mask_padding=False):
         super(ConvolutionModule, self).__init__()
         # kernel_size should be an odd number for 'SAME' padding
         assert (kernel_size - 1) % 2 == 0
@@ -27,13 +31,16 @@ class ConvolutionModule(nn.Module):
         self.norm = nn.GroupNorm(num_groups=32, num_channels=channels)
         self.pointwise_conv2 = nn.Conv1d(channels, channels, kernel_size=1, stride=1, padding=0, bias=bias, )
         self.activation = activation
+        self.mask_padding = mask_padding
 
-    def forward(self, x):
+    def forward(self, x, mask=None):
         """
         Compute convolution module.
 
         Args:
             x (torch.Tensor): Input tensor (#batch, time, channels).
+            mask (torch.Tensor): Mask tensor that is True for the frames which are not padding (#batch, 1, time).
+                                 With mask_padding, padded frames are then neither convolved nor normalized with the others.
 
         Returns:
             torch.Tensor: Output tensor (#batch, time, channels).
@@ -47,8 +54,13 @@ class ConvolutionModule(nn.Module):
         x = nn.functional.glu(x, dim=1)  # (batch, channel, dim)
 
         # 1D Depthwise Conv
-        x = self.depthwise_conv(x)
-        x = self.activation(self.norm(x))
+        if self.mask_padding and mask is not None:
+            x = x.masked_fill(~mask, 0.0)
+            x = self.depthwise_conv(x)
+            x = self.activation(masked_group_norm(self.norm, x, mask))
+        else:
+            x = self.depthwise_conv(x)
+            x = self.activation(self.norm(x))
 
         x = self.pointwise_conv2(x)
 
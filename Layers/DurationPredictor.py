@@ -28,7 +28,7 @@ class DurationPredictor(torch.nn.Module):
 
     """
 
-    def __init__(self, idim, n_layers=2, n_chans=384, kernel_size=3, dropout_rate=0.1, offset=1.0):
+    def __init__(self, idim, n_layers=2, n_chans=384, kernel_size=3, dropout_rate=0.1, offset=1.0, mask_padding=False):
         """
         Initialize duration predictor module.
 
@@ -39,10 +39,12 @@ class DurationPredictor(torch.nn.Module):
             kernel_size (int, optional): Kernel size of convolutional layers.
             dropout_rate (float, optional): Dropout rate.
             offset (float, optional): Offset value to avoid nan in log domain.
+            mask_padding (bool, optional): Whether the padding is zeroed before every convolution, for batched inference.
 
         """
         super(DurationPredictor, self).__init__()
         self.offset = offset
+        self.mask_padding = mask_padding
         self.conv = torch.nn.ModuleList()
         for idx in range(n_layers):
             in_chans = idim if idx == 0 else n_chans
@@ -53,6 +55,9 @@ class DurationPredictor(torch.nn.Module):
     def _forward(self, xs, x_masks=None, is_inference=False):
         xs = xs.transpose(1, -1)  # (B, idim, Tmax)
         for f in self.conv:
+            if self.mask_padding and x_masks is not None:
+                # the kernels must not read the padding, otherwise the frames next to it depend on the length of the batch
+                xs = xs.masked_fill(x_masks.unsqueeze(1), 0.0)
             xs = f(xs)  # (B, C, Tmax)
 
         # NOTE: calculate in log domain
@@ -4,6 +4,8 @@ Taken from ESPNet
 
 import torch
 
+from Utility.utils import masked_group_norm
+
 
 class PostNet(torch.nn.Module):
     """
@@ -59,16 +61,27 @@ class PostNet(torch.nn.Module):
             self.postnet += [torch.nn.Sequential(torch.nn.Conv1d(ichans, odim, n_filts, stride=1, padding=(n_filts - 1) // 2, bias=False, ),
                                                  torch.nn.Dropout(dropout_rate), )]
 
-    def forward(self, xs):
+    def forward(self, xs, masks=None):
         """
         Calculate forward propagation.
 
         Args:
             xs (Tensor): Batch of the sequences of padded input tensors (B, idim, Tmax).
+            masks (BoolTensor, optional): Batch of masks that are True for the frames which are not padding (B, 1, Tmax).
+                                          Padded frames are then neither convolved nor normalized with the others.
 
         Returns:
             Tensor: Batch of padded output tensor. (B, odim, Tmax).
         """
         for i in range(len(self.postnet)):
-            xs = self.postnet[i](xs)
+            if masks is None:
+                xs = self.postnet[i](xs)
+                continue
+            for module in self.postnet[i]:
+                if isinstance(module, torch.nn.Conv1d):
+                    xs = module(xs.masked_fill(~masks, 0.0))
+                elif isinstance(module, torch.nn.GroupNorm):
+                    xs = masked_group_norm(module, xs, masks)
+                else:
+                    xs = module(xs)
         return xs
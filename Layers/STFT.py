@@ -115,7 +115,7 @@ class STFT(torch.nn.Module):
         if isinstance(input, ComplexTensor):
             input = torch.stack([input.real, input.imag], dim=-1)
         assert input.shape[-1] == 2
-        input = input.transpose(1, 2)
+        input = torch.view_as_complex(input.transpose(1, 2).contiguous())
 
         wavs = istft(input, n_fft=self.n_fft, hop_length=self.hop_length, win_length=self.win_length, window=window, center=self.center,
                      normalized=self.normalized, onesided=self.onesided, length=ilens.max() if ilens is not None else ilens)
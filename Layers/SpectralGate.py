@@ -0,0 +1,113 @@
+"""
+Stationary spectral gating as in https://github.com/timsainb/noisereduce
+but in torch, so it runs on the device of the model.
+"""
+
+import itertools
+
+import torch
+
+from Layers.STFT import STFT
+
+
+class SpectralGate(torch.nn.Module):
+
+    def __init__(self,
+                 sr=48000,
+                 n_fft=1024,
+                 hop_length=256,
+                 n_std_thresh=1.5,
+                 prop_decrease=1.0,
+                 freq_mask_smooth_hz=500,
+                 time_mask_smooth_ms=50,
+                 top_db=80.0):
+        """
+        The defaults match noisereduce.reduce_noise(stationary=True).
+        The statistics of the noise are computed once with noise_threshold
+        and can then be reused for any amount of waves.
+        """
+        super().__init__()
+        self.stft = STFT(n_fft=n_fft, hop_length=hop_length)
+        self.n_std_thresh = n_std_thresh
+        self.prop_decrease = prop_decrease
+        self.top_db = top_db
+        self.hop_length = hop_length
+        n_grad_freq = int(freq_mask_smooth_hz / (sr / (n_fft / 2)))
+        n_grad_time = int(time_mask_smooth_ms / ((hop_length / sr) * 1000))
+        # triangular filter that smooths the mask, laid out as (frames, freq) like the output of the STFT
+        ramp_time = torch.cat([torch.linspace(0, 1, n_grad_time + 2)[:-1], torch.linspace(1, 0, n_grad_time + 2)])[1:-1]
+        ramp_freq = torch.cat([torch.linspace(0, 1, n_grad_freq + 2)[:-1], torch.linspace(1, 0, n_grad_freq + 2)])[1:-1]
+        smoothing_filter = torch.outer(ramp_time, ramp_freq)
+        self.register_buffer("smoothing_filter", (smoothing_filter / smoothing_filter.sum()).unsqueeze(0).unsqueeze(0), persistent=False)
+        # how far the gating of a sample reaches: half a window to the frames that contain it, the smoothing of the mask
+        # over time to the frames that those depend on, and another half a window to the samples of these frames
+        self.receptive_field = n_fft + n_grad_time * hop_length
+
+    def noise_threshold(self, noise_wave):
+        """
+        Args:
+            noise_wave: a wave that contains nothing but the noise (samples)
+        Returns:
+            the threshold in dB above which a frequency bin counts as signal (freq)
+        """
+        noise_db = self._to_db(self._magnitude(self.stft(noise_wave.unsqueeze(0))[0]))[0]
+        return noise_db.mean(dim=0) + noise_db.std(dim=0, unbiased=False) * self.n_std_thresh
+
+    def forward(self, wave, noise_threshold, floor_db=None):
+        """
+        Args:
+            wave: the wave to denoise (samples)
+            noise_threshold: the result of noise_threshold for the noise of this wave
+            floor_db: the level in dB that quieter bins are raised to, top_db below the loudest bin of the wave if None.
+                      The chunks of one utterance need the same floor, otherwise every chunk is gated differently.
+        Returns:
+            the denoised wave (samples)
+        """
+        spec, _ = self.stft(wave.unsqueeze(0))
+        mask = (self._to_db(self._magnitude(spec), floor_db) > noise_threshold).to(spec.dtype)
+        mask = mask * self.prop_decrease + (1.0 - self.prop_decrease)
+        mask = torch.nn.functional.conv2d(mask.unsqueeze(1),
+                                          self.smoothing_filter.to(spec.dtype),
+                                          padding=(self.smoothing_filter.size(2) // 2, self.smoothing_filter.size(3) // 2)).squeeze(1)
+        denoised_wave, _ = self.stft.inverse(spec * mask.unsqueeze(-1), ilens=torch.LongTensor([wave.size(0)]))
+        return denoised_wave.squeeze(0)
+
+    def stream(self, waves, noise_threshold, floor_db):
+        """
+        Gates consecutive pieces of a wave like forward would gate the whole wave with the same floor, the result is
+        delayed by the receptive field, so that every sample has the context on its right that it depends on.
+
+        Args:
+            waves: an iterable that yields consecutive pieces of a wave (samples)
+            noise_threshold: the result of noise_threshold for the noise of this wave
+            floor_db: see forward, the loudest bin of the whole wave is not known before its last piece
+        Yields:
+            consecutive pieces of the denoised wave
+        """
+        buffer = None  # the samples that are still needed, starting at the sample with the index buffer_start
+        buffer_start = 0
+        position = 0  # index of the first sample that has not been yielded yet
+        for piece in itertools.chain(waves, [None]):
+            finished = piece is None
+            if not finished:
+                buffer = piece if buffer is None else torch.cat([buffer, piece])
+            if buffer is None:
+                return
+            available = buffer_start + buffer.size(0)
+            end = available if finished else available - self.receptive_field
+            if end <= position:
+                continue
+            yield self(buffer, noise_threshold, floor_db=floor_db)[position - buffer_start:end - buffer_start]
+            position = end
+            # the frames of the STFT have to stay on the grid of the whole wave, so the buffer starts at a multiple of the hop length
+            new_start = max(position - self.receptive_field, 0) // self.hop_length * self.hop_length
+            buffer = buffer[new_start - buffer_start:]
+            buffer_start = new_start
+
+    @staticmethod
+    def _magnitude(spec):
+        return torch.sqrt(spec[..., 0] ** 2 + spec[..., 1] ** 2)
+
+    def _to_db(self, magnitude, floor_db=None):
+        db = 20.0 * torch.log10(torch.clamp(magnitude, min=1e-20))
+        return torch.maximum(db, db.max() - self.top_db if floor_db is None else floor_db)
@@ -21,7 +21,7 @@ class VariancePredictor(torch.nn.Module, ABC):
 
     """
 
-    def __init__(self, idim, n_layers=2, n_chans=384, kernel_size=3, bias=True, dropout_rate=0.5, ):
+    def __init__(self, idim, n_layers=2, n_chans=384, kernel_size=3, bias=True, dropout_rate=0.5, mask_padding=False):
         """
         Initilize duration predictor module.
 
@@ -31,8 +31,10 @@ class VariancePredictor(torch.nn.Module, ABC):
             n_chans (int, optional): Number of channels of convolutional layers.
             kernel_size (int, optional): Kernel size of convolutional layers.
             dropout_rate (float, optional): Dropout rate.
+            mask_padding (bool, optional): Whether the padding is zeroed before every convolution, for batched inference.
         """
         super().__init__()
+        self.mask_padding = mask_padding
         self.conv = torch.nn.ModuleList()
         for idx in range(n_layers):
             in_chans = idim if idx == 0 else n_chans
@@ -55,6 +57,9 @@ class VariancePredictor(torch.nn.Module, ABC):
         """
         xs = xs.transpose(1, -1)  # (B, idim, Tmax)
         for f in self.conv:
+            if self.mask_padding and x_masks is not None:
+                # the kernels must not read the padding, otherwise the frames next to it depend on the length of the batch
+                xs = xs.masked_fill(x_masks.transpose(1, 2), 0.0)
             xs = f(xs)  # (B, C, Tmax)
 
         xs = self.linear(xs.transpose(1, 2))  # (B, Tmax, 1)
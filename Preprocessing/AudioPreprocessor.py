@@ -1,7 +1,3 @@
-import librosa
-import librosa.core as lb
-import librosa.display as lbd
-import matplotlib.pyplot as plt
 import numpy
 import numpy as np
 import pyloudnorm as pyln
@@ -71,6 +67,7 @@ class AudioPreprocessor:
         make sure we deal with a 1D array
         """
         if len(x.shape) == 2:
+            import librosa.core as lb  # librosa takes a while to import and is only needed for some of the features
             return lb.to_mono(numpy.transpose(x))
         else:
             return x
@@ -97,6 +94,7 @@ class AudioPreprocessor:
         compatibility, this is kept for now. If there is ever a reason to completely re-train
         all models, this would be a good opportunity to make the switch.
         """
+        import librosa  # librosa takes a while to import and is only needed for some of the features
         if fmax is None:
             fmax = self.fmax_for_spec
         if isinstance(audio, torch.Tensor):
@@ -130,6 +128,8 @@ class AudioPreprocessor:
         and then displays Mel Spectrogram of the
         cleaned version.
         """
+        import librosa.display as lbd
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots(nrows=2, ncols=1)
         unclean_audio_mono = self.to_mono(unclean_audio)
         unclean_spec = self.audio_to_mel_spec_tensor(unclean_audio_mono, normalize=False).numpy()
@@ -1,9 +1,12 @@
+import os
+import threading
+
+import numpy
 import soundfile as sf
 import torch
 import torch.multiprocessing
 import torch.multiprocessing
 from numpy import trim_zeros
-from speechbrain.pretrained import EncoderClassifier
 
 from Preprocessing.AudioPreprocessor import AudioPreprocessor
 
@@ -11,7 +14,9 @@ from Preprocessing.AudioPreprocessor import AudioPreprocessor
 class ProsodicConditionExtractor:
 
     def __init__(self, sr, device=torch.device("cpu")):
+        from speechbrain.pretrained import EncoderClassifier  # speechbrain takes a while to import, so it's only loaded when it's needed
         self.ap = AudioPreprocessor(input_sr=sr, output_sr=16000, melspec_buckets=80, hop_length=256, n_fft=1024, cut_silence=False)
+        self.sr_to_ap = {sr: self.ap}
         # https://huggingface.co/speechbrain/spkrec-ecapa-voxceleb
         self.speaker_embedding_func_ecapa = EncoderClassifier.from_hparams(source="speechbrain/spkrec-ecapa-voxceleb",
                                                                            run_opts={"device": str(device)},
@@ -21,11 +26,17 @@ class ProsodicConditionExtractor:
                                                                              run_opts={"device": str(device)},
                                                                              savedir="Models/SpeakerEmbedding/speechbrain_speaker_embedding_xvector")
 
-    def extract_condition_from_reference_wave(self, wave, already_normalized=False):
+    def extract_condition_from_reference_wave(self, wave, already_normalized=False, sr=None):
+        """
+        sr is the sampling rate of the wave, if it differs from the one this extractor was created for.
+        """
         if already_normalized:
             norm_wave = wave
         else:
-            norm_wave = self.ap.audio_to_wave_tensor(normalize=True, audio=wave)
+            if sr is not None and sr not in self.sr_to_ap:
+                self.sr_to_ap[sr] = AudioPreprocessor(input_sr=sr, output_sr=16000, melspec_buckets=80, hop_length=256, n_fft=1024, cut_silence=False)
+            ap = self.ap if sr is None else self.sr_to_ap[sr]
+            norm_wave = ap.audio_to_wave_tensor(normalize=True, audio=wave)
             norm_wave = torch.tensor(trim_zeros(norm_wave.numpy()))
         spk_emb_ecapa = self.speaker_embedding_func_ecapa.encode_batch(wavs=norm_wave.unsqueeze(0)).squeeze()
         spk_emb_xvector = self.speaker_embedding_func_xvector.encode_batch(wavs=norm_wave.unsqueeze(0)).squeeze()
@@ -34,6 +45,52 @@ class ProsodicConditionExtractor:
         return combined_utt_condition
 
 
+_extractors = dict()
+_extractors_lock = threading.Lock()
+
+
+def get_prosodic_condition_extractor(device="cpu"):
+    """
+    One long-lived extractor per device, created on first use, so the speaker
+    embedding models are only loaded from disk once per process.
+    Pass the sampling rate of the audio to extract_condition_from_reference_wave.
+    """
+    with _extractors_lock:
+        if str(device) not in _extractors:
+            _extractors[str(device)] = ProsodicConditionExtractor(sr=16000, device=torch.device(device))
+        return _extractors[str(device)]
+
+
+class SpeakerEmbeddingCache:
+    """
+    Speaker embeddings keyed on a hash of the content of the reference audio, so the same voice is only
+    ever extracted once. If a path is given, the embeddings are also stored in an npz file there and
+    loaded again when the next process starts.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.embeddings = dict()
+        if path is not None and os.path.exists(path):
+            with numpy.load(path) as store:
+                self.embeddings = {key: torch.from_numpy(store[key]) for key in store.files}
+
+    def get(self, key):
+        with self._lock:
+            return self.embeddings.get(key)
+
+    def put(self, key, embedding):
+        with self._lock:
+            self.embeddings[key] = embedding.detach().cpu()
+            if self.path is not None:
+                # write to a temporary file first, so a crash can never leave a broken store behind
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                temporary_path = f"{self.path}.{os.getpid()}.tmp.npz"
+                numpy.savez(temporary_path, **{key: embedding.numpy() for key, embedding in self.embeddings.items()})
+                os.replace(temporary_path, self.path)
+
+
 if __name__ == '__main__':
     wave, sr = sf.read("../audios/1.wav")
     ext = ProsodicConditionExtractor(sr=sr)
@@ -1,15 +1,21 @@
 # -*- coding: utf-8 -*-
 
 
+import hashlib
+import os
 import re
+import sqlite3
 import sys
+import threading
 
+import numpy
 import torch
 from phonemizer.backend import EspeakBackend
-from pypinyin import pinyin
 
-from Preprocessing.articulatory_features import generate_feature_table
+from Preprocessing.articulatory_features import encode_phones
+from Preprocessing.articulatory_features import get_feature_matrix
 from Preprocessing.articulatory_features import get_phone_to_id
+from Utility.utils import LRUCache
 
 
 class ArticulatoryCombinedTextFrontend:
@@ -20,14 +26,24 @@ class ArticulatoryCombinedTextFrontend:
                  use_lexical_stress=True,
                  silent=True,
                  allow_unknown=False,
-                 add_silence_to_end=True):
+                 add_silence_to_end=True,
+                 cache_size=2000,
+                 lexicon_dir=None):
         """
         Mostly preparing ID lookups
+
+        cache_size is the amount of phonemizations, phone strings and phone tensors that are kept
+        in a least recently used cache, so repeated texts skip espeak. 0 disables the cache.
+
+        If a lexicon_dir is given, texts are phonemized word by word and the phonemization of every
+        word is stored in a persistent lexicon in that directory, so espeak only ever sees new words.
+        Since espeak then no longer sees the context of a word, the result can differ slightly.
         """
         self.allow_unknown = allow_unknown
         self.use_explicit_eos = use_explicit_eos
         self.use_stress = use_lexical_stress
         self.add_silence_to_end = add_silence_to_end
+        self.cache = LRUCache(max_size=cache_size)
 
         if language == "en":
             self.g2p_lang = "en-us"
@@ -137,13 +153,37 @@ class ArticulatoryCombinedTextFrontend:
             print("Language not supported yet")
             sys.exit()
 
-        self.phonemizer_backend = EspeakBackend(language=self.g2p_lang,
-                                                punctuation_marks=';:,.!?¡¿—…"«»“”~/。【】、‥،؟“”؛',
-                                                preserve_punctuation=True,
-                                                language_switch='remove-flags',
-                                                with_stress=self.use_stress)
-
-        self.phone_to_vector = generate_feature_table()
+        phonemizer_options = dict(language=self.g2p_lang,
+                                  punctuation_marks=_punctuation_marks,
+                                  preserve_punctuation=True,
+                                  language_switch='remove-flags',
+                                  with_stress=self.use_stress)
+        self.phonemizer_backend = EspeakBackend(**phonemizer_options)
+
+        # frontends are shared between threads, but espeak is not thread-safe
+        self._phonemizer_lock = threading.Lock()
+
+        if lexicon_dir is not None:
+            # every set of options that changes the phonemization gets a lexicon of its own, so e.g. a frontend
+            # without lexical stress never reads the phonemizations of one with stress
+            options_key = hashlib.sha256(repr(sorted(phonemizer_options.items())).encode("utf8")).hexdigest()[:12]
+            self.lexicon = PhonemizationLexicon(os.path.join(lexicon_dir, f"{self.g2p_lang}-{options_key}.sqlite"))
+        else:
+            self.lexicon = None
+
+        tone_replacements = _tone_replacements.get("cmn" if self.g2p_lang == "cmn-latn-pinyin" else self.g2p_lang, [])
+        self.phone_normalizers = {
+            True: PhoneNormalizer(tone_replacements + _phone_replacements),
+            False: PhoneNormalizer(tone_replacements + _phone_replacements + _prosody_replacements)
+        }
+
+        self.phone_to_row, feature_matrix = get_feature_matrix()
+        self.phone_to_vector = {phone: feature_matrix[row].astype(int).tolist() for phone, row in self.phone_to_row.items()}
+        # the encoding sets the modifiers in the feature table, so every frontend gets a copy of its own
+        self.feature_matrix = feature_matrix.copy()
+        # the amount of features that are set in the table, cached tensors are only valid as long as it does not change
+        self.feature_version = numpy.count_nonzero(self.feature_matrix)
+        self._feature_lock = threading.Lock()
         self.phone_to_id = get_phone_to_id()
         self.id_to_phone = {v: k for k, v in self.phone_to_id.items()}
 
@@ -153,175 +193,134 @@ class ArticulatoryCombinedTextFrontend:
         turns graphemes into phonemes and then vectorizes
         the sequence as articulatory features
         """
+        cached_tensor = self.cache.get(self._tensor_cache_key(text, device, handle_missing, input_phonemes))
+        if cached_tensor is not None:
+            if view:
+                print("Phonemes: \n{}\n".format(text if input_phonemes else
+                                                  self.get_phone_string(text=text, include_eos_symbol=True, for_feature_extraction=True)))
+            return cached_tensor.clone()
         if input_phonemes:
             phones = text
         else:
             phones = self.get_phone_string(text=text, include_eos_symbol=True, for_feature_extraction=True)
         if view:
             print("Phonemes: \n{}\n".format(phones))
-        phones_vector = list()
-        # turn into numeric vectors
-        stressed_flag = False
-
-        for char in phones:
-            if char == '\u02C8':
-                # primary stress
-                # affects following phoneme
-                stressed_flag = True
-            elif char == '\u02D0':
-                # lengthened
-                # affects previous phoneme
-                phones_vector[-1][8] = 1
-            elif char == '\u02D1':
-                # half length
-                # affects previous phoneme
-                phones_vector[-1][9] = 1
-            elif char == '\u0306':
-                # shortened
-                # affects previous phoneme
-                phones_vector[-1][10] = 1
-            elif char == "˥":
-                # very high tone
-                # affects previous phoneme
-                phones_vector[-1][1] = 1
-            elif char == "˦":
-                # high tone
-                # affects previous phoneme
-                phones_vector[-1][2] = 1
-            elif char == "˧":
-                # mid tone
-                # affects previous phoneme
-                phones_vector[-1][3] = 1
-            elif char == "˨":
-                # low tone
-                # affects previous phoneme
-                phones_vector[-1][4] = 1
-            elif char == "˩":
-                # very low tone
-                # affects previous phoneme
-                phones_vector[-1][5] = 1
-            elif char == '\u030C':
-                # rising tone
-                # affects previous phoneme
-                phones_vector[-1][6] = 1
-            elif char == '\u0302':
-                # falling tone
-                # affects previous phoneme
-                phones_vector[-1][7] = 1
+        phones_tensor = self._phones_to_tensor(phones, handle_missing=handle_missing, device=device)
+        self.cache.put(self._tensor_cache_key(text, device, handle_missing, input_phonemes), phones_tensor.clone())
+        return phones_tensor
+
+    def string_to_tensor_batch(self, texts, device="cpu", handle_missing=True, input_phonemes=False, njobs=1):
+        """
+        Like string_to_tensor, but for a list of texts. All texts that are not in the cache
+        are phonemized with a single call to the phonemizer, which can be split across njobs processes.
+        """
+        missing = [index for index, text in enumerate(texts) if self._tensor_cache_key(text, device, handle_missing, input_phonemes) not in self.cache]
+        if input_phonemes:
+            phone_strings = [texts[index] for index in missing]
+        else:
+            phone_strings = self.get_phone_string_batch([texts[index] for index in missing], include_eos_symbol=True, for_feature_extraction=True, njobs=njobs)
+        index_to_phones = dict(zip(missing, phone_strings))
+        phones_tensors = list()
+        # the texts are encoded in order, since encoding one of them can change the encoding of the ones that follow
+        for index, text in enumerate(texts):
+            cached_tensor = self.cache.get(self._tensor_cache_key(text, device, handle_missing, input_phonemes))
+            if cached_tensor is not None:
+                phones_tensors.append(cached_tensor.clone())
+                continue
+            if index in index_to_phones:
+                phones = index_to_phones[index]
             else:
-                if handle_missing:
-                    try:
-                        phones_vector.append(self.phone_to_vector[char])
-                    except KeyError:
-                        print("unknown phoneme: {}".format(char))
-                else:
-                    phones_vector.append(self.phone_to_vector[char])  # leave error handling to elsewhere
+                # the tensor was in the cache, but an encoding before it changed the feature table
+                phones = text if input_phonemes else self.get_phone_string(text=text, include_eos_symbol=True, for_feature_extraction=True)
+            phones_tensor = self._phones_to_tensor(phones, handle_missing=handle_missing, device=device)
+            self.cache.put(self._tensor_cache_key(text, device, handle_missing, input_phonemes), phones_tensor.clone())
+            phones_tensors.append(phones_tensor)
+        return phones_tensors
+
+    def _tensor_cache_key(self, text, device, handle_missing, input_phonemes):
+        return "tensor", self.g2p_lang, self.feature_version, text, str(device), handle_missing, input_phonemes
+
+    def _phones_to_tensor(self, phones, handle_missing=True, device="cpu"):
+        # turn into numeric vectors by gathering the rows of the feature table, the modifiers are set in the table itself
+        with self._feature_lock:
+            phones_vector = encode_phones(phones, self.phone_to_row, self.feature_matrix, handle_missing=handle_missing)
+            self.feature_version = numpy.count_nonzero(self.feature_matrix)
+        return torch.from_numpy(phones_vector).to(device)
 
-                if stressed_flag:
-                    stressed_flag = False
-                    phones_vector[-1][0] = 1
+    def get_phone_string(self, text, include_eos_symbol=True, for_feature_extraction=False, for_plot_labels=False):
+        return self.get_phone_string_batch([text],
+                                           include_eos_symbol=include_eos_symbol,
+                                           for_feature_extraction=for_feature_extraction,
+                                           for_plot_labels=for_plot_labels)[0]
 
-        return torch.Tensor(phones_vector, device=device)
+    def get_phone_string_batch(self, texts, include_eos_symbol=True, for_feature_extraction=False, for_plot_labels=False, njobs=1):
+        """
+        Like get_phone_string, but for a list of texts. All texts that are not in the cache
+        are phonemized with a single call to the phonemizer, which can be split across njobs processes.
+        """
+        cache_keys = [("phone_string", self.g2p_lang, text, include_eos_symbol, for_feature_extraction, for_plot_labels) for text in texts]
+        phone_strings = [self.cache.get(cache_key) for cache_key in cache_keys]
+        missing = [index for index, phones in enumerate(phone_strings) if phones is None]
+        phonemizations = self._phonemize([self.expand_abbreviations(texts[index]) for index in missing], njobs=njobs)
+        for index, phones in zip(missing, phonemizations):
+            phone_strings[index] = self._postprocess_phones(phones, include_eos_symbol, for_feature_extraction, for_plot_labels)
+            self.cache.put(cache_keys[index], phone_strings[index])
+        return phone_strings
+
+    def cache_info(self):
+        """
+        Hits and misses of the lookups in the cache and its size, to help with choosing a cache_size.
+        """
+        return {"hits": self.cache.hits, "misses": self.cache.misses, "size": len(self.cache), "max_size": self.cache.max_size}
 
-    def get_phone_string(self, text, include_eos_symbol=True, for_feature_extraction=False, for_plot_labels=False):
-        # expand abbreviations
-        utt = self.expand_abbreviations(text)
-        # phonemize
-        phones = self.phonemizer_backend.phonemize([utt], strip=True)[0]
-
-        # Unfortunately tonal languages don't agree on the tone, most tonal
-        # languages use different tones denoted by different numbering
-        # systems. At this point in the script, it is attempted to unify
-        # them all to the tones in the IPA standard.
-        if self.g2p_lang == "cmn-latn-pinyin" or self.g2p_lang == "cmn":
-            phones = phones.replace(".", "")  # no idea why espeak puts dots everywhere for Chinese
-            phones = phones.replace('1', "˥")
-            phones = phones.replace('2', "˧\u030C")
-            phones = phones.replace('ɜ', "˨\u0302\u030C")  # I'm fairly certain that this is a bug in espeak and ɜ is meant to be 3
-            phones = phones.replace('3', "˨\u0302\u030C")  # I'm fairly certain that this is a bug in espeak and ɜ is meant to be 3
-            phones = phones.replace('4', "˦\u0302")
-            phones = phones.replace('5', "˧")
-            phones = phones.replace('0', "˧")
-        if self.g2p_lang == "vi":
-            phones = phones.replace('1', "˧")
-            phones = phones.replace('2', "˩\u0302")
-            phones = phones.replace('ɜ', "˧\u030C")  # I'm fairly certain that this is a bug in espeak and ɜ is meant to be 3
-            phones = phones.replace('3', "˧\u030C")  # I'm fairly certain that this is a bug in espeak and ɜ is meant to be 3
-            phones = phones.replace('4', "˧\u0302\u030C")
-            phones = phones.replace('5', "˧\u030C")
-            phones = phones.replace('6', "˧\u0302")
-            phones = phones.replace('7', "˧")
-        replacements = [
-            # punctuation in languages with non-latin script
-            ("。", "."),
-            ("【", '"'),
-            ("】", '"'),
-            ("、", ","),
-            ("‥", "…"),
-            ("؟", "?"),
-            ("،", ","),
-            ("“", '"'),
-            ("”", '"'),
-            ("؛", ","),
-            # latin script punctuation
-            ("/", " "),
-            ("—", ""),
-            ("...", "…"),
-            ("\n", " "),
-            ("\t", " "),
-            ("¡", ""),
-            ("¿", ""),
-            # unifying some phoneme representations
-            ("ɫ", "l"),  # alveolopalatal
-            ("ɚ", "ə"),
-            ('ᵻ', 'ɨ'),
-            ("ɧ", "ç"),  # velopalatal
-            ("ɥ", "j"),  # labiopalatal
-            ("ɬ", "s"),  # lateral
-            ("ɮ", "z"),  # lateral
-            ('ɺ', 'ɾ'),  # lateral
-            ('\u02CC', ""),  # secondary stress
-            ('\u030B', "˥"),
-            ('\u0301', "˦"),
-            ('\u0304', "˧"),
-            ('\u0300', "˨"),
-            ('\u030F', "˩"),
-            # symbols that indicate a pause or silence
-            ('"', "~"),
-            ("-", "~"),
-            ("-", "~"),
-            ("…", "."),
-            (":", "~"),
-            (";", "~"),
-            (",", "~")  # make sure this remains the final one when adding new ones
-        ]
-        unsupported_ipa_characters = {'̹', '̙', '̞', '̯', '̤', '̪', '̩', '̠', '̟', 'ꜜ',
-                                      '̃', '̬', '̽', 'ʰ', '|', '̝', '•', 'ˠ', '↘',
-                                      '‖', '̰', '‿', 'ᷝ', '̈', 'ᷠ', '̜', 'ʷ', 'ʲ',
-                                      '̚', '↗', 'ꜛ', '̻', '̥', 'ˁ', '̘', '͡', '̺'}
-        for char in unsupported_ipa_characters:
-            replacements.append((char, ""))
-
-        if not for_feature_extraction:
-            # in case we want to plot etc., we only need the segmental units, so we remove everything else.
-            replacements = replacements + [
-                ('\u02C8', ""),  # primary stress
-                ('\u02D0', ""),  # lengthened
-                ('\u02D1', ""),  # half length
-                ('\u0306', ""),  # shortened
-                ("˥", ""),  # very high tone
-                ("˦", ""),  # high tone
-                ("˧", ""),  # mid tone
-                ("˨", ""),  # low tone
-                ("˩", ""),  # very low tone
-                ('\u030C', ""),  # rising tone
-                ('\u0302', "")  # falling tone
-            ]
-        for replacement in replacements:
-            phones = phones.replace(replacement[0], replacement[1])
-        phones = re.sub("~+", "~", phones)
-        phones = re.sub(r"\s+", " ", phones)
-        phones = re.sub(r"\.+", ".", phones)
+    def _phonemize(self, utts, njobs=1):
+        """
+        Raw phonemization of already expanded texts. The raw results are cached separately,
+        since they are shared by all variants of the post-processing.
+        """
+        cache_keys = [("phonemes", self.g2p_lang, utt) for utt in utts]
+        phonemizations = [self.cache.get(cache_key) for cache_key in cache_keys]
+        missing_utts = list(dict.fromkeys(utt for utt, phones in zip(utts, phonemizations) if phones is None))
+        if missing_utts:
+            if self.lexicon is not None:
+                new_phonemizations = self._phonemize_with_lexicon(missing_utts, njobs=njobs)
+            else:
+                with self._phonemizer_lock:
+                    new_phonemizations = self.phonemizer_backend.phonemize(missing_utts, strip=True, njobs=njobs)
+            utt_to_phones = dict(zip(missing_utts, new_phonemizations))
+            for index, (cache_key, utt) in enumerate(zip(cache_keys, utts)):
+                if phonemizations[index] is None:
+                    phonemizations[index] = utt_to_phones[utt]
+                    self.cache.put(cache_key, phonemizations[index])
+        return phonemizations
+
+    def _phonemize_with_lexicon(self, utts, njobs=1):
+        """
+        Phonemizes word by word. Words that are not in the lexicon yet are phonemized in a single
+        call to espeak and then added to the lexicon. Punctuation and spacing are kept as they are.
+        """
+        utt_tokens = [[(match.group(), match.start() > 0 and utt[match.start() - 1].isspace()) for match in _word_or_punctuation.finditer(utt)]
+                      for utt in utts]
+        words = {token for tokens in utt_tokens for token, _ in tokens if not _punctuation.fullmatch(token)}
+        word_to_phones = self.lexicon.lookup(words)
+        unknown_words = sorted(words - word_to_phones.keys())
+        if unknown_words:
+            with self._phonemizer_lock:
+                new_entries = dict(zip(unknown_words, self.phonemizer_backend.phonemize(unknown_words, strip=True, njobs=njobs)))
+            self.lexicon.add(new_entries)
+            word_to_phones.update(new_entries)
+        phonemizations = list()
+        for tokens in utt_tokens:
+            phones = ""
+            for token, follows_space in tokens:
+                if follows_space and phones != "":
+                    phones += " "
+                phones += token if _punctuation.fullmatch(token) else word_to_phones[token]
+            phonemizations.append(phones)
+        return phonemizations
+
+    def _postprocess_phones(self, phones, include_eos_symbol, for_feature_extraction, for_plot_labels):
+        phones = self.phone_normalizers[for_feature_extraction](phones)
         phones = phones.lstrip("~").rstrip("~")
 
         if self.add_silence_to_end:
@@ -333,22 +332,239 @@ class ArticulatoryCombinedTextFrontend:
             phones = phones.replace(" ", "|")
 
         phones = "~" + phones
-        phones = re.sub("~+", "~", phones)
+        phones = _silences.sub("~", phones)
         return phones
 
 
+# Unfortunately tonal languages don't agree on the tone, most tonal
+# languages use different tones denoted by different numbering
+# systems. Before anything else, it is attempted to unify
+# them all to the tones in the IPA standard.
+_tone_replacements = {
+    "cmn": [
+        (".", ""),  # no idea why espeak puts dots everywhere for Chinese
+        ('1', "˥"),
+        ('2', "˧\u030C"),
+        ('ɜ', "˨\u0302\u030C"),  # I'm fairly certain that this is a bug in espeak and ɜ is meant to be 3
+        ('3', "˨\u0302\u030C"),  # I'm fairly certain that this is a bug in espeak and ɜ is meant to be 3
+        ('4', "˦\u0302"),
+        ('5', "˧"),
+        ('0', "˧")
+    ],
+    "vi": [
+        ('1', "˧"),
+        ('2', "˩\u0302"),
+        ('ɜ', "˧\u030C"),  # I'm fairly certain that this is a bug in espeak and ɜ is meant to be 3
+        ('3', "˧\u030C"),  # I'm fairly certain that this is a bug in espeak and ɜ is meant to be 3
+        ('4', "˧\u0302\u030C"),
+        ('5', "˧\u030C"),
+        ('6', "˧\u0302"),
+        ('7', "˧")
+    ]
+}
+
+_phone_replacements = [
+    # punctuation in languages with non-latin script
+    ("。", "."),
+    ("【", '"'),
+    ("】", '"'),
+    ("、", ","),
+    ("‥", "…"),
+    ("؟", "?"),
+    ("،", ","),
+    ("“", '"'),
+    ("”", '"'),
+    ("؛", ","),
+    # latin script punctuation
+    ("/", " "),
+    ("—", ""),
+    ("...", "…"),
+    ("\n", " "),
+    ("\t", " "),
+    ("¡", ""),
+    ("¿", ""),
+    # unifying some phoneme representations
+    ("ɫ", "l"),  # alveolopalatal
+    ("ɚ", "ə"),
+    ('ᵻ', 'ɨ'),
+    ("ɧ", "ç"),  # velopalatal
+    ("ɥ", "j"),  # labiopalatal
+    ("ɬ", "s"),  # lateral
+    ("ɮ", "z"),  # lateral
+    ('ɺ', 'ɾ'),  # lateral
+    ('\u02CC', ""),  # secondary stress
+    ('\u030B', "˥"),
+    ('\u0301', "˦"),
+    ('\u0304', "˧"),
+    ('\u0300', "˨"),
+    ('\u030F', "˩"),
+    # symbols that indicate a pause or silence
+    ('"', "~"),
+    ("-", "~"),
+    ("-", "~"),
+    ("…", "."),
+    (":", "~"),
+    (";", "~"),
+    (",", "~")  # make sure this remains the final one when adding new ones
+]
+# unsupported IPA characters
+_phone_replacements += [(char, "") for char in ['̹', '̙', '̞', '̯', '̤', '̪', '̩', '̠', '̟', 'ꜜ',
+                                                '̃', '̬', '̽', 'ʰ', '|', '̝', '•', 'ˠ', '↘',
+                                                '‖', '̰', '‿', 'ᷝ', '̈', 'ᷠ', '̜', 'ʷ', 'ʲ',
+                                                '̚', '↗', 'ꜛ', '̻', '̥', 'ˁ', '̘', '͡', '̺']]
+
+# in case we want to plot etc., we only need the segmental units, so we remove everything else.
+_prosody_replacements = [
+    ('\u02C8', ""),  # primary stress
+    ('\u02D0', ""),  # lengthened
+    ('\u02D1', ""),  # half length
+    ('\u0306', ""),  # shortened
+    ("˥", ""),  # very high tone
+    ("˦", ""),  # high tone
+    ("˧", ""),  # mid tone
+    ("˨", ""),  # low tone
+    ("˩", ""),  # very low tone
+    ('\u030C', ""),  # rising tone
+    ('\u0302', "")  # falling tone
+]
+
+# runs of silences, whitespace and full stops, which are each collapsed into a single symbol
+_repetitions = re.compile(r"(?=[~.\s])(?:~~+|\.\.+|\s\s+|[^\S ])")
+_silences = re.compile("~+")
+
+
+def _collapse_repetition(match):
+    return " " if match.group()[0].isspace() else match.group()[0]
+
+_punctuation_marks = ';:,.!?¡¿—…"«»“”~/。【】、‥،؟“”؛'
+_punctuation = re.compile("[{}]".format(re.escape(_punctuation_marks)))
+_word_or_punctuation = re.compile("[^\\s{0}]+|[{0}]".format(re.escape(_punctuation_marks)))
+
+
+class PhoneNormalizer:
+    """
+    Applies a list of (old, new) replacements one after the other, like a chain of str.replace calls would,
+    and then collapses runs of silences, whitespace and full stops.
+
+    The list is compiled once: every run of consecutive single character deletions becomes one character class
+    regex. All other replacements stay plain str.replace calls, on IPA strings those are faster than str.translate.
+    """
+
+    def __init__(self, replacements):
+        self.steps = list()
+        deletions = list()
+        for old, new in replacements + [("", "")]:  # the empty sentinel flushes the last deletions
+            if len(old) == 1 and new == "":
+                deletions.append(old)
+                continue
+            if deletions:
+                self.steps.append((re.compile("[{}]".format("".join(re.escape(char) for char in deletions))), ""))
+                deletions = list()
+            if old != "":
+                self.steps.append((old, new))
+
+    def __call__(self, text):
+        for old, new in self.steps:
+            if isinstance(old, str):
+                text = text.replace(old, new)
+            else:
+                text = old.sub(new, text)
+        return _repetitions.sub(_collapse_repetition, text)
+
+
+class PhonemizationLexicon:
+    """
+    Persistent store that maps words to their phonemization, one file per language.
+
+    It is backed by sqlite in WAL mode, so the worker processes that build a dataset cache can all read
+    from and write to the same lexicon at the same time. Every process opens its own connection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._connect()
+
+    def _connect(self):
+        # sqlite connections must not be shared across a fork, so a forked process opens its own
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=120, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS lexicon (word TEXT PRIMARY KEY, phones TEXT NOT NULL)")
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def lookup(self, words):
+        """
+        Returns a dict with the phonemization of all of the words that are in the lexicon.
+        """
+        words = list(words)
+        word_to_phones = dict()
+        with self._lock:
+            connection = self._connect()
+            for index in range(0, len(words), 500):  # sqlite limits the amount of variables in a query
+                batch = words[index:index + 500]
+                rows = connection.execute("SELECT word, phones FROM lexicon WHERE word IN ({})".format(",".join("?" * len(batch))), batch)
+                word_to_phones.update(rows.fetchall())
+        return word_to_phones
+
+    def add(self, word_to_phones):
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany("INSERT OR IGNORE INTO lexicon (word, phones) VALUES (?, ?)", word_to_phones.items())
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM lexicon").fetchone()[0]
+
+
+_abbreviations = [(re.compile('\\b%s\\.' % x[0], re.IGNORECASE), x[1]) for x in
+                  [('Mrs.', 'misess'), ('Mr.', 'mister'), ('Dr.', 'doctor'), ('St.', 'saint'), ('Co.', 'company'), ('Jr.', 'junior'), ('Maj.', 'major'),
+                   ('Gen.', 'general'), ('Drs.', 'doctors'), ('Rev.', 'reverend'), ('Lt.', 'lieutenant'), ('Hon.', 'honorable'), ('Sgt.', 'sergeant'),
+                   ('Capt.', 'captain'), ('Esq.', 'esquire'), ('Ltd.', 'limited'), ('Col.', 'colonel'), ('Ft.', 'fort')]]
+
+
+_frontends = dict()
+_frontends_lock = threading.Lock()
+
+
+def get_frontend(language, **kwargs):
+    """
+    Process-wide registry of text frontends. The frontend for a language and a set of
+    keyword arguments to the constructor is only built once and then shared, so switching
+    between languages does not start a new espeak backend every time.
+    """
+    key = (language, tuple(sorted(kwargs.items())))
+    frontend = _frontends.get(key)
+    if frontend is None:
+        with _frontends_lock:
+            if key not in _frontends:
+                _frontends[key] = ArticulatoryCombinedTextFrontend(language=language, **kwargs)
+            frontend = _frontends[key]
+    return frontend
+
+
+def preload_frontends(languages, **kwargs):
+    """
+    Builds the frontends for all the given languages right away, e.g. at the start of a server.
+    """
+    for language in languages:
+        get_frontend(language, **kwargs)
+
+
 def english_text_expansion(text):
     """
     Apply as small part of the tacotron style text cleaning pipeline, suitable for e.g. LJSpeech.
     See https://github.com/keithito/tacotron/
     Careful: Only apply to english datasets. Different languages need different cleaners.
     """
-    _abbreviations = [(re.compile('\\b%s\\.' % x[0], re.IGNORECASE), x[1]) for x in
-                      [('Mrs.', 'misess'), ('Mr.', 'mister'), ('Dr.', 'doctor'), ('St.', 'saint'), ('Co.', 'company'), ('Jr.', 'junior'), ('Maj.', 'major'),
-                       ('Gen.', 'general'), ('Drs.', 'doctors'), ('Rev.', 'reverend'), ('Lt.', 'lieutenant'), ('Hon.', 'honorable'), ('Sgt.', 'sergeant'),
-                       ('Capt.', 'captain'), ('Esq.', 'esquire'), ('Ltd.', 'limited'), ('Col.', 'colonel'), ('Ft.', 'fort')]]
     for regex, replacement in _abbreviations:
-        text = re.sub(regex, replacement, text)
+        text = regex.sub(replacement, text)
     return text
 
 
@@ -358,6 +574,7 @@ def convert_kanji_to_pinyin_mandarin(text):
     # we need a better conversion from pinyin to IPA that
     # includes tone symbols if espeak-ng doesn't do a good job
     # on this.
+    from pypinyin import pinyin  # takes a while to import and is only needed for Mandarin
     return " ".join([x[0] for x in pinyin(text)])
 
 
@@ -21,6 +21,8 @@ had such a combination, which does not warrant a new
 dimension.
 """
 
+import numpy
+
 
 def generate_feature_lookup():
     return {
@@ -942,3 +944,84 @@ def generate_feature_table():
     # print(f"{sum([len(values) for values in [feat_to_val_set[feat] for feat in feat_to_val_set]])} should be 42")
 
     return phone_to_vector
+
+
+_feature_matrix = None
+
+
+def get_feature_matrix():
+    """
+    The feature table as a contiguous (num_symbols, 60) array, together with a mapping from each symbol
+    to its row. The rows follow the IDs of get_phone_to_id, symbols without an ID are appended at the end.
+    It is only built once per process and shared between all frontends, so it is read-only, every frontend
+    encodes with its own copy of it.
+    """
+    global _feature_matrix
+    if _feature_matrix is None:
+        phone_to_vector = generate_feature_table()
+        symbols = list(get_phone_to_id()) + [phone for phone in phone_to_vector if phone not in get_phone_to_id()]
+        feature_matrix = numpy.zeros((len(symbols), len(next(iter(phone_to_vector.values())))), dtype=numpy.float32)
+        symbol_to_row = dict()
+        for row, symbol in enumerate(symbols):
+            if symbol in phone_to_vector:
+                feature_matrix[row] = phone_to_vector[symbol]
+                symbol_to_row[symbol] = row
+        feature_matrix.flags.writeable = False
+        _feature_matrix = (symbol_to_row, feature_matrix)
+    return _feature_matrix
+
+
+_modifier_to_dimension = {
+    '\u02C8': 0,  # primary stress
+    "˥": 1,  # very high tone
+    "˦": 2,  # high tone
+    "˧": 3,  # mid tone
+    "˨": 4,  # low tone
+    "˩": 5,  # very low tone
+    '\u030C': 6,  # rising tone
+    '\u0302': 7,  # falling tone
+    '\u02D0': 8,  # lengthened
+    '\u02D1': 9,  # half length
+    '\u0306': 10,  # shortened
+}
+
+
+def encode_phones(phones, phone_to_row, feature_table, handle_missing=True):
+    """
+    Turns a string of phones into a (num_phones, 60) array of articulatory features.
+
+    Primary stress affects the following phone, all other modifiers affect the previous phone. Like the
+    encoders that the models were trained with, the modifiers are set in the rows of the feature table
+    itself and not only in the rows of this string, so they apply to every occurrence of the phone in
+    this string and in all strings that are encoded with the same table later on.
+
+    Args:
+        phones: the string of phones
+        phone_to_row: mapping from each known phone to its row in the feature table
+        feature_table: writable copy of the feature matrix of get_feature_matrix, the modifiers are set in it
+        handle_missing: whether unknown phones are skipped with a warning instead of raising a KeyError
+    """
+    rows = numpy.array([phone_to_row.get(char, -1) for char in phones], dtype=numpy.int64)
+    modifiers = numpy.array([_modifier_to_dimension.get(char, -1) for char in phones], dtype=numpy.int64)
+    is_phone = modifiers == -1
+    is_known = rows != -1
+    for position in numpy.flatnonzero(is_phone & ~is_known):
+        if not handle_missing:
+            raise KeyError(phones[position])  # leave error handling to elsewhere
+        print("unknown phoneme: {}".format(phones[position]))
+    known_rows = rows[is_known]
+    # the index of the latest known phone at each position of the string
+    latest_phone = numpy.cumsum(is_known) - 1
+    is_stress = modifiers == _modifier_to_dimension['\u02C8']
+    modifier_positions = numpy.flatnonzero(~is_phone & ~is_stress)
+    target_phones = latest_phone[modifier_positions]
+    target_dimensions = modifiers[modifier_positions]
+    phone_positions = numpy.flatnonzero(is_phone)
+    following_phone = numpy.searchsorted(phone_positions, numpy.flatnonzero(is_stress), side="right")
+    following_phone = phone_positions[following_phone[following_phone < len(phone_positions)]]
+    target_phones = numpy.concatenate([target_phones, latest_phone[following_phone]])
+    target_dimensions = numpy.concatenate([target_dimensions, numpy.zeros(len(following_phone), dtype=numpy.int64)])
+    if (target_phones == -1).any():
+        raise IndexError("There is a modifier before the first known phone of {}".format(phones))
+    feature_table[known_rows[target_phones], target_dimensions] = 1
+    return feature_table[known_rows]
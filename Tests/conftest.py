@@ -0,0 +1,50 @@
+import os
+
+import pytest
+import torch
+
+from InferenceInterfaces.InferenceArchitectures.InferenceFastSpeech2 import FastSpeech2
+from InferenceInterfaces.InferenceArchitectures.InferenceHiFiGAN import HiFiGANGenerator
+from TrainingInterfaces.Spectrogram_to_Wave.HiFIGAN.HiFiGAN import HiFiGANGenerator as TrainableHiFiGANGenerator
+from TrainingInterfaces.Text_to_Spectrogram.FastSpeech2.FastSpeech2 import FastSpeech2 as TrainableFastSpeech2
+
+
+@pytest.fixture(scope="session")
+def fastspeech():
+    """
+    FastSpeech2 with random weights, the output layer of the duration predictor is changed so that every phone
+    gets a few frames, like with trained weights.
+    """
+    torch.manual_seed(0)
+    weights = TrainableFastSpeech2().state_dict()
+    weights["duration_predictor.linear.weight"].mul_(0.25)
+    weights["duration_predictor.linear.bias"].fill_(2.0)
+    return FastSpeech2(weights=weights).eval()
+
+
+@pytest.fixture(scope="session")
+def hifigan():
+    """
+    HiFiGAN generator with random weights.
+    """
+    torch.manual_seed(0)
+    return HiFiGANGenerator(weights=TrainableHiFiGANGenerator().state_dict()).eval()
+
+
+@pytest.fixture
+def inference_interface(fastspeech, hifigan, tmp_path, monkeypatch):
+    """
+    InferenceFastSpeech2, set up to load the random FastSpeech2 and HiFiGAN from a Models directory in a temporary working directory.
+    """
+    from phonemizer.backend import EspeakBackend
+
+    if not EspeakBackend.is_available():
+        pytest.skip("espeak is not installed")
+    InferenceFastSpeech2 = pytest.importorskip("InferenceInterfaces.InferenceFastSpeech2").InferenceFastSpeech2
+    torch.manual_seed(1)
+    os.makedirs(tmp_path / "Models" / "FastSpeech2_Meta")
+    os.makedirs(tmp_path / "Models" / "HiFiGAN_combined")
+    torch.save({"model": fastspeech.state_dict(), "default_emb": torch.randn(704)}, tmp_path / "Models" / "FastSpeech2_Meta" / "best.pt")
+    torch.save({"generator": hifigan.state_dict()}, tmp_path / "Models" / "HiFiGAN_combined" / "best.pt")
+    monkeypatch.chdir(tmp_path)
+    return InferenceFastSpeech2
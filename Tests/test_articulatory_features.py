@@ -0,0 +1,101 @@
+import random
+
+import pytest
+import torch
+from phonemizer.backend import EspeakBackend
+
+from Preprocessing.TextFrontend import ArticulatoryCombinedTextFrontend
+from Preprocessing.articulatory_features import encode_phones
+from Preprocessing.articulatory_features import generate_feature_table
+from Preprocessing.articulatory_features import get_feature_matrix
+
+_modifiers = ['ˈ', 'ː', 'ˑ', '̆', "˥", "˦", "˧", "˨", "˩", '̌', '̂']
+
+_sentences = {
+    "en": ["Hello world, this is a test.", "Dr. Smith went home early, didn't he?"],
+    "de": ["Hallo Welt, das ist ein Test.", "Die Straße war lang und schmal."],
+    "el": ["Γειά σου κόσμε, αυτό είναι μια δοκιμή."],
+    "es": ["Hola mundo, esto es una prueba.", "¿Dónde está la estación?"],
+    "fi": ["Hei maailma, tämä on testi."],
+    "ru": ["Привет, мир, это проверка."],
+    "hu": ["Helló világ, ez egy próba."],
+    "nl": ["Hallo wereld, dit is een test."],
+    "fr": ["Bonjour le monde, ceci est un essai.", "Où est la gare?"],
+    "it": ["Ciao mondo, questa è una prova."],
+    "pt": ["Olá mundo, isto é um teste."],
+    "pl": ["Witaj świecie, to jest test."],
+    "cmn": ["你好世界，这是一个测试。"],
+    "vi": ["Xin chào thế giới, đây là một bài kiểm tra."],
+    "uk": ["Привіт, світе, це перевірка."],
+    "fa": ["سلام دنیا، این یک آزمایش است."],
+    "chr": ["ᎣᏏᏲ ᎡᎶᎯ"],
+}
+
+
+def _reference_encoding(phones, phone_to_vector, handle_missing=True):
+    """
+    The loop that the models were trained with, it sets the modifiers in the lists of the feature table itself.
+    """
+    phones_vector = list()
+    stressed_flag = False
+    modifier_to_dimension = {'ː': 8, 'ˑ': 9, '̆': 10, "˥": 1, "˦": 2, "˧": 3, "˨": 4, "˩": 5, '̌': 6, '̂': 7}
+    for char in phones:
+        if char == 'ˈ':
+            stressed_flag = True
+        elif char in modifier_to_dimension:
+            phones_vector[-1][modifier_to_dimension[char]] = 1
+        else:
+            if handle_missing:
+                try:
+                    phones_vector.append(phone_to_vector[char])
+                except KeyError:
+                    pass
+            else:
+                phones_vector.append(phone_to_vector[char])
+            if stressed_flag:
+                stressed_flag = False
+                phones_vector[-1][0] = 1
+    return torch.Tensor(phones_vector)
+
+
+def test_encoding_matches_reference_over_many_strings():
+    random.seed(0)
+    phone_to_vector = generate_feature_table()
+    phone_to_row, feature_matrix = get_feature_matrix()
+    feature_table = feature_matrix.copy()
+    symbols = list(phone_to_vector) * 3 + _modifiers + ["?"]  # ? stands for a phone that is not known
+    for _ in range(2000):
+        # a modifier before the first known phone is an error, so every string starts with a known phone
+        phones = random.choice(list(phone_to_vector)) + "".join(random.choice(symbols) for _ in range(random.randint(0, 40)))
+        encoded = torch.from_numpy(encode_phones(phones, phone_to_row, feature_table))
+        assert torch.equal(encoded, _reference_encoding(phones, phone_to_vector))
+    # the modifiers end up in the same rows of the tables, so later strings are encoded the same way as well
+    for phone, row in phone_to_row.items():
+        assert feature_table[row].tolist() == phone_to_vector[phone]
+
+
+def test_modifier_before_the_first_phone_is_an_error():
+    phone_to_row, feature_matrix = get_feature_matrix()
+    with pytest.raises(IndexError):
+        _reference_encoding("ːa", generate_feature_table())
+    with pytest.raises(IndexError):
+        encode_phones("ːa", phone_to_row, feature_matrix.copy())
+
+
+@pytest.fixture(params=sorted(_sentences))
+def language(request):
+    if not EspeakBackend.is_available():
+        pytest.skip("espeak is not installed")
+    return request.param
+
+
+def test_frontend_matches_reference_for_every_language(language):
+    frontend = ArticulatoryCombinedTextFrontend(language=language)
+    phone_to_vector = generate_feature_table()
+    # every sentence is encoded twice, so the second time comes from the cache of the frontend
+    for text in _sentences[language] * 2:
+        phones = frontend.get_phone_string(text, include_eos_symbol=True, for_feature_extraction=True)
+        assert torch.equal(frontend.string_to_tensor(text), _reference_encoding(phones, phone_to_vector))
+    texts = _sentences[language] + [text.upper() for text in _sentences[language]]
+    expected = [_reference_encoding(frontend.get_phone_string(text, include_eos_symbol=True, for_feature_extraction=True), phone_to_vector) for text in texts]
+    assert all(torch.equal(encoded, reference) for encoded, reference in zip(frontend.string_to_tensor_batch(texts), expected))
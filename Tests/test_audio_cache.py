@@ -0,0 +1,53 @@
+import os
+import time
+
+import numpy
+import torch
+
+from Utility.audio_cache import AudioCache
+
+
+def test_damaged_wave_is_a_miss_and_deleted(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    cache.put("ab01", torch.ones(1000))
+    path = cache._path("ab01")
+    with open(path, "r+b") as wave_file:
+        wave_file.truncate(os.path.getsize(path) // 2)
+    assert cache.get("ab01") is None
+    assert not os.path.exists(path)
+    for content in [b"", b"PK\x03\x04 not really an archive", b"\x93NUMPY garbage"]:
+        with open(path, "wb") as wave_file:
+            wave_file.write(content)
+        assert cache.get("ab01") is None
+        assert not os.path.exists(path)
+    assert cache.misses == 4
+
+
+def test_failed_utime_still_returns_the_wave(tmp_path, monkeypatch):
+    cache = AudioCache(str(tmp_path))
+    cache.put("cd02", torch.arange(10.0))
+
+    def utime(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", utime)
+    assert torch.equal(cache.get("cd02"), torch.arange(10.0))
+    assert cache.hits == 1
+
+
+def test_eviction_sweeps_temporary_files_that_were_left_behind(tmp_path):
+    AudioCache(str(tmp_path)).put("ef03", torch.zeros(1000))
+    shard = os.path.join(str(tmp_path), "ef")
+    left_behind = os.path.join(shard, "ef04.npy.123.456.tmp")
+    being_written = os.path.join(shard, "ef05.npy.123.789.tmp")
+    for path in (left_behind, being_written):
+        with open(path, "wb") as temporary_file:
+            numpy.save(temporary_file, numpy.zeros(10000, dtype=numpy.float32))
+    os.utime(left_behind, (time.time() - 3600, time.time() - 3600))
+    cache = AudioCache(str(tmp_path), max_bytes=80000)
+    assert len(cache) == 1
+    # the temporary files count towards the size, so this exceeds the limit
+    cache.put("ef06", torch.zeros(1000))
+    assert not os.path.exists(left_behind)
+    assert os.path.exists(being_written)
+    assert len(cache) == 2
@@ -0,0 +1,52 @@
+import torch
+
+from Layers.Convolution import ConvolutionModule
+from Layers.DurationPredictor import DurationPredictor
+from Layers.VariancePredictor import VariancePredictor
+from TrainingInterfaces.Text_to_Spectrogram.FastSpeech2.FastSpeech2 import FastSpeech2 as TrainableFastSpeech2
+from Utility.utils import make_non_pad_mask
+from Utility.utils import make_pad_mask
+
+
+def test_batch_forward_matches_unbatched(fastspeech):
+    torch.manual_seed(1)
+    texts = [torch.rand(length, 60) for length in (7, 23, 12, 30)]
+    utterance_embeddings = torch.randn(len(texts), 704)
+    lang_ids = torch.LongTensor([12, 1, 3, 5])
+    mels, durations, pitch, energy = fastspeech.batch_forward(texts,
+                                                              utterance_embeddings=utterance_embeddings,
+                                                              lang_ids=lang_ids,
+                                                              return_duration_pitch_energy=True)
+    for index, text in enumerate(texts):
+        mel, single_durations, single_pitch, single_energy = fastspeech(text,
+                                                                        utterance_embedding=utterance_embeddings[index],
+                                                                        lang_id=lang_ids[index:index + 1],
+                                                                        return_duration_pitch_energy=True)
+        assert torch.equal(durations[index], single_durations)
+        assert torch.allclose(pitch[index], single_pitch, atol=1e-4)
+        assert torch.allclose(energy[index], single_energy, atol=1e-4)
+        assert torch.allclose(mels[index], mel, atol=1e-4)
+
+
+def test_training_layers_keep_the_padding():
+    # the layers are shared with training, which must compute on the padded batch exactly like before
+    torch.manual_seed(2)
+    xs = torch.randn(2, 20, 384)
+    lengths = torch.LongTensor([20, 11])
+    convolution = ConvolutionModule(384, 7).eval()
+    masked_convolution = ConvolutionModule(384, 7, mask_padding=True).eval()
+    masked_convolution.load_state_dict(convolution.state_dict())
+    non_pad_masks = make_non_pad_mask(lengths).unsqueeze(1)
+    assert torch.equal(convolution(xs, non_pad_masks), convolution(xs))
+    assert not torch.allclose(masked_convolution(xs, non_pad_masks)[1, :11], convolution(xs)[1, :11])
+    for predictor, masked_predictor in [(VariancePredictor(384), VariancePredictor(384, mask_padding=True)),
+                                        (DurationPredictor(384), DurationPredictor(384, mask_padding=True))]:
+        predictor.eval()
+        masked_predictor.eval().load_state_dict(predictor.state_dict())
+        pad_masks = make_pad_mask(lengths)
+        if isinstance(predictor, VariancePredictor):
+            pad_masks = pad_masks.unsqueeze(-1)
+        assert torch.equal(predictor(xs, pad_masks), predictor(xs).masked_fill(pad_masks, 0.0))
+        assert not torch.allclose(masked_predictor(xs, pad_masks), predictor(xs, pad_masks))
+    model = TrainableFastSpeech2()
+    assert not any(getattr(module, "mask_padding", False) for module in model.modules())
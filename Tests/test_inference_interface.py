@@ -0,0 +1,90 @@
+import sys
+import threading
+import time
+import types
+
+import pytest
+import torch
+
+
+def test_batch_is_gated_with_the_noise_profile_of_every_speaker(inference_interface):
+    tts = inference_interface(model_name="Meta", language="en", noise_reduce=True)
+    torch.manual_seed(2)
+    speakers = [None, torch.randn(704)]
+    texts = ["hˈaʊ mˈʌtʃ wʊd wʊd ɐ wˈʊdtʃʌk tʃˈʌk?", "jˈɛs!"]
+    waves = tts.synthesize_batch(texts, speaker_embeddings=speakers, input_is_phones=True)
+    tts.noise_reduce = False
+    raw_waves = tts.synthesize_batch(texts, speaker_embeddings=speakers, input_is_phones=True)
+    for wave, raw_wave, speaker in zip(waves, raw_waves, speakers):
+        noise_threshold = tts.noise_thresholds[tts._speaker_key(speaker)]
+        assert torch.equal(wave, tts.spectral_gate(raw_wave, noise_threshold))
+    # the profile of the second speaker is not the one of the default speaker, which it used to be gated with
+    assert not torch.equal(tts.noise_thresholds[tts._speaker_key(speakers[1])], tts.noise_threshold)
+
+
+def test_quantization_accepts_every_spelling_of_the_cpu(inference_interface):
+    for device in ["cpu:0", torch.device("cpu")]:
+        tts = inference_interface(model_name="Meta", language="en", device=device, quantize="int8")
+        assert torch.isfinite(tts("jˈɛs!", input_is_phones=True)).all()
+    with pytest.raises(ValueError):
+        inference_interface._quantize(types.SimpleNamespace(device="cuda:0"))
+
+
+class _FakeOutputStream:
+    """
+    Stands in for sounddevice.OutputStream, it takes its time for every chunk like a sound card would.
+    """
+
+    streams = list()
+    fail = False
+
+    def __init__(self, **kwargs):
+        self.written = list()
+        self.aborted = False
+        _FakeOutputStream.streams.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def write(self, chunk):
+        if _FakeOutputStream.fail:
+            raise RuntimeError("the sound card went away")
+        time.sleep(0.05)
+        self.written.append(chunk)
+
+    def abort(self):
+        self.aborted = True
+
+
+def test_read_aloud_replaces_the_previous_playback_and_reports_its_errors(inference_interface, monkeypatch):
+    monkeypatch.setitem(sys.modules, "sounddevice", types.SimpleNamespace(OutputStream=_FakeOutputStream, stop=lambda: None))
+    tts = inference_interface(model_name="Meta", language="en")
+    synthesizing_threads = set()
+    stream = tts.stream
+
+    def recording_stream(*args, **kwargs):
+        for wave in stream(*args, **kwargs):
+            synthesizing_threads.add(threading.get_ident())
+            yield wave
+
+    monkeypatch.setattr(tts, "stream", recording_stream)
+    text = "hˈaʊ mˈʌtʃ wʊd wʊd ɐ wˈʊdtʃʌk tʃˈʌk? hˈaʊ mˈʌtʃ wʊd wʊd ɐ wˈʊdtʃʌk tʃˈʌk?"
+    tts.read_aloud(text)
+    first_stream = _FakeOutputStream.streams[-1]
+    tts.read_aloud(text, blocking=True)
+    assert synthesizing_threads == {threading.get_ident()}
+    assert first_stream.aborted
+    second_stream = _FakeOutputStream.streams[-1]
+    assert not second_stream.aborted
+    assert sum(len(chunk) for chunk in second_stream.written) == len(tts(text)) + 36000
+
+    _FakeOutputStream.fail = True
+    try:
+        tts.read_aloud(text)
+        with pytest.raises(RuntimeError):
+            tts.read_aloud(text)
+    finally:
+        _FakeOutputStream.fail = False
@@ -0,0 +1,63 @@
+import os
+
+import numpy
+import pytest
+import torch
+
+from Layers.SpectralGate import SpectralGate
+
+
+def _hash_noise(start, length):
+    # noise that is the same with every version of numpy, unlike its random generators
+    n = numpy.arange(start, start + length, dtype=numpy.float64)
+    x = numpy.sin(n * 12.9898) * 43758.5453
+    return x - numpy.floor(x) - 0.5
+
+
+def _noisy_wave_and_noise():
+    n = numpy.arange(24000, dtype=numpy.float64)
+    speech = 0.5 * numpy.sin(2 * numpy.pi * 440 * n / 48000) * numpy.sin(numpy.pi * n / 24000) ** 2 + 0.2 * numpy.sin(2 * numpy.pi * 3100 * n / 48000) * (n > 12000)
+    wave = (speech + 0.05 * _hash_noise(0, 24000)).astype(numpy.float32)
+    noise = (0.05 * _hash_noise(100000, 24000)).astype(numpy.float32)
+    return torch.from_numpy(wave), torch.from_numpy(noise)
+
+
+def test_matches_noisereduce():
+    # recorded with noisereduce 2.0.0 (and librosa 0.11.0), which the gate replaces:
+    # noisereduce.reduce_noise(y=wave.numpy(), y_noise=noise.numpy(), sr=48000, stationary=True)
+    reference = torch.from_numpy(numpy.load(os.path.join(os.path.dirname(__file__), "data", "noisereduce_reference.npy")))
+    wave, noise = _noisy_wave_and_noise()
+    gate = SpectralGate()
+    denoised = gate(wave, gate.noise_threshold(noise))
+    assert denoised.shape == reference.shape
+    # the padding of the STFT is not the same as in librosa, so the first and the last frames differ more
+    interior = slice(2048, len(reference) - 2048)
+    assert float(torch.linalg.norm(denoised[interior] - reference[interior]) / torch.linalg.norm(reference[interior])) < 0.03
+    # the reference differs from the input by much more than that
+    assert float(torch.linalg.norm(wave[interior] - reference[interior]) / torch.linalg.norm(reference[interior])) > 0.2
+
+
+@pytest.mark.parametrize("piece_size", [1000, 4097, 16384, 30000])
+def test_streamed_gating_matches_whole_wave(piece_size):
+    wave, noise = _noisy_wave_and_noise()
+    wave = torch.cat([wave, wave * 0.3, wave])
+    gate = SpectralGate()
+    noise_threshold = gate.noise_threshold(noise)
+    floor_db = noise_threshold.min()
+    streamed = torch.cat(list(gate.stream(iter(torch.split(wave, piece_size)), noise_threshold, floor_db=floor_db)))
+    assert streamed.shape == wave.shape
+    assert torch.allclose(streamed, gate(wave, noise_threshold, floor_db=floor_db), atol=1e-6)
+
+
+def test_chunks_are_gated_against_the_same_floor():
+    torch.manual_seed(0)
+    gate = SpectralGate()
+    unclamped_gate = SpectralGate(top_db=float("inf"))
+    noise_threshold = gate.noise_threshold(torch.randn(48000) * 0.01)
+    quiet_chunk = torch.randn(8192) * 0.02
+    loud_chunk = torch.sin(torch.arange(8192) * 0.05) * 100.0 + torch.randn(8192) * 0.02
+    for chunk in (quiet_chunk, loud_chunk):
+        # with the floor at the lowest threshold, the mask no longer depends on the loudest bin of the chunk
+        assert torch.allclose(gate(chunk, noise_threshold, floor_db=noise_threshold.min()), unclamped_gate(chunk, noise_threshold), atol=1e-6)
+    # without a shared floor, the floor of the loud chunk opens the gate wherever it is above the threshold
+    assert not torch.allclose(gate(loud_chunk, noise_threshold), unclamped_gate(loud_chunk, noise_threshold), atol=1e-6)
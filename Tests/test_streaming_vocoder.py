@@ -0,0 +1,19 @@
+import pytest
+import torch
+
+
+@pytest.mark.parametrize("chunk_size, crossfade", [(8, 2), (16, 4), (32, 2), (50, 10)])
+def test_stream_matches_forward(hifigan, chunk_size, crossfade):
+    torch.manual_seed(1)
+    spectrogram = torch.randn(80, 90)
+    streamed = torch.cat(list(hifigan.stream(spectrogram, chunk_size=chunk_size, crossfade=crossfade)))
+    assert torch.allclose(streamed, hifigan(spectrogram), atol=1e-6)
+
+
+@pytest.mark.parametrize("piece_size", [1, 7, 40])
+def test_stream_of_pieces_matches_forward(hifigan, piece_size):
+    torch.manual_seed(1)
+    spectrogram = torch.randn(80, 90)
+    pieces = torch.split(spectrogram, piece_size, dim=1)
+    streamed = torch.cat(list(hifigan.stream(pieces, chunk_size=16, crossfade=4)))
+    assert torch.allclose(streamed, hifigan(spectrogram), atol=1e-6)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import threading
+
+import torch
+
+from InferenceInterfaces import SynthesisServer as synthesis_server
+from InferenceInterfaces.SynthesisServer import SynthesisServer
+
+
+class _SlowTTS:
+    """
+    Stands in for InferenceFastSpeech2, every batch waits until it is released.
+    """
+
+    language = "en"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def synthesize_batch(self, texts, lang_ids, **scales):
+        self.started.set()
+        self.release.wait(timeout=10)
+        return [torch.zeros(480) for _ in texts]
+
+
+def _body(text):
+    return json.dumps({"text": text}).encode("utf8")
+
+
+def _phone_count(text, language):
+    if text == "unphonemizable":
+        raise ValueError("no phones in this text")
+    return len(text)
+
+
+def _run(test, tts, monkeypatch):
+    monkeypatch.setattr(synthesis_server, "_phone_count", _phone_count)
+
+    async def main():
+        server = SynthesisServer(tts, batch_window=0.01)
+        server._arrived = asyncio.Event()
+        batch_loop = asyncio.ensure_future(server._batch_loop())
+        try:
+            await test(server, batch_loop)
+        finally:
+            batch_loop.cancel()
+
+    asyncio.run(main())
+
+
+def test_failed_phonemization_is_answered(monkeypatch):
+    tts = _SlowTTS()
+    tts.release.set()
+
+    async def test(server, batch_loop):
+        status, _, _ = await asyncio.wait_for(server._synthesize_request(_body("unphonemizable")), timeout=5)
+        assert status == 400
+        assert server.admitted == 0
+        status, content_type, _ = await asyncio.wait_for(server._synthesize_request(_body("fine")), timeout=5)
+        assert (status, content_type) == (200, "audio/wav")
+
+    _run(test, tts, monkeypatch)
+
+
+def test_cancelled_request_does_not_stop_the_batch_loop(monkeypatch):
+    tts = _SlowTTS()
+
+    async def test(server, batch_loop):
+        loop = asyncio.get_running_loop()
+        cancelled = asyncio.ensure_future(server._synthesize_request(_body("the client of this one goes away")))
+        answered = asyncio.ensure_future(server._synthesize_request(_body("this one is still waiting")))
+        await loop.run_in_executor(None, tts.started.wait, 5)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        tts.release.set()
+        status, _, _ = await asyncio.wait_for(answered, timeout=5)
+        assert status == 200
+        assert not batch_loop.done()
+        status, _, _ = await asyncio.wait_for(server._synthesize_request(_body("and the next one is served")), timeout=5)
+        assert status == 200
+
+    _run(test, tts, monkeypatch)
+
+
+def test_malformed_requests_are_answered(monkeypatch):
+    tts = _SlowTTS()
+    tts.release.set()
+
+    async def test(server, batch_loop):
+        listener = await asyncio.start_server(server._handle_connection, host="127.0.0.1", port=0)
+        port = listener.sockets[0].getsockname()[1]
+
+        async def send(request):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            writer.close()
+            return status_line.split(b" ")[1]
+
+        async with listener:
+            assert await send(b"garbage\r\n\r\n") == b"400"
+            assert await send(b"POST /synthesize HTTP/1.1\r\nContent-Length: many\r\n\r\n") == b"400"
+            assert await send(b"POST /synthesize HTTP/1.1\r\nContent-Length: -5\r\n\r\n") == b"400"
+            assert await send(b"POST /synthesize HTTP/1.1\r\nContent-Length: 1000000000000\r\n\r\n") == b"413"
+            assert await send(b"GET /" + b"a" * 100000 + b" HTTP/1.1\r\n\r\n") == b"400"
+            assert await send(b"GET /health HTTP/1.1\r\n\r\n") == b"200"
+
+    _run(test, tts, monkeypatch)
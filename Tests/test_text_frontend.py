@@ -0,0 +1,15 @@
+import pytest
+from phonemizer.backend import EspeakBackend
+
+from Preprocessing.TextFrontend import ArticulatoryCombinedTextFrontend
+
+
+def test_lexicon_is_not_shared_across_phonemizer_options(tmp_path):
+    if not EspeakBackend.is_available():
+        pytest.skip("espeak is not installed")
+    stressed = ArticulatoryCombinedTextFrontend(language="en", use_lexical_stress=True, lexicon_dir=str(tmp_path))
+    unstressed = ArticulatoryCombinedTextFrontend(language="en", use_lexical_stress=False, lexicon_dir=str(tmp_path))
+    assert stressed.lexicon.path != unstressed.lexicon.path
+    assert ArticulatoryCombinedTextFrontend(language="en", use_lexical_stress=True, lexicon_dir=str(tmp_path)).lexicon.path == stressed.lexicon.path
+    assert "ˈ" in stressed._phonemize(["hello world"])[0]
+    assert "ˈ" not in unstressed._phonemize(["hello world"])[0]
@@ -0,0 +1,74 @@
+import copy
+
+import pytest
+import torch
+
+from InferenceInterfaces.InferenceArchitectures.InferenceHiFiGAN import HiFiGANGenerator
+from Utility.torchscript_export import export_fastspeech2
+from Utility.torchscript_export import export_hifigan
+
+
+@pytest.mark.parametrize("scales", [dict(), dict(duration_scaling_factor=1.2, pitch_variance_scale=0.8, energy_variance_scale=1.1)])
+def test_phone2mel_matches_eager(fastspeech, tmp_path, scales):
+    fastspeech = copy.deepcopy(fastspeech)
+    torch.manual_seed(1)
+    utterance_embedding = torch.randn(704)
+    lang_id = torch.LongTensor([3])
+    export_fastspeech2(fastspeech, utterance_embedding, str(tmp_path / "phone2mel.jit"), lang_id=lang_id)
+    phone2mel = torch.jit.load(str(tmp_path / "phone2mel.jit"))
+    # lengths that differ from the one that the encoder and the decoder were traced with
+    for length in (7, 35, 120):
+        text = (torch.rand(length, 60) > 0.8).float()
+        with torch.no_grad():
+            mel, durations, pitch, energy = fastspeech(text, utterance_embedding=utterance_embedding, lang_id=lang_id, return_duration_pitch_energy=True, **scales)
+            scripted_mel, scripted_durations, scripted_pitch, scripted_energy = phone2mel(text, utterance_embedding, lang_id, **scales)
+        assert torch.equal(durations, scripted_durations)
+        assert torch.allclose(pitch, scripted_pitch, atol=1e-4)
+        assert torch.allclose(energy, scripted_energy, atol=1e-4)
+        assert torch.allclose(mel, scripted_mel, atol=1e-4)
+
+
+def test_phone2mel_with_given_durations_pitch_and_energy_matches_eager(fastspeech, tmp_path):
+    fastspeech = copy.deepcopy(fastspeech)
+    torch.manual_seed(1)
+    utterance_embedding = torch.randn(704)
+    lang_id = torch.LongTensor([3])
+    phone2mel = export_fastspeech2(fastspeech, utterance_embedding, str(tmp_path / "phone2mel.jit"), lang_id=lang_id)
+    text = (torch.rand(15, 60) > 0.8).float()
+    durations = torch.randint(1, 5, (15,))
+    pitch = torch.randn(15, 1)
+    energy = torch.randn(15, 1)
+    with torch.no_grad():
+        mel = fastspeech(text, utterance_embedding=utterance_embedding, lang_id=lang_id, durations=durations, pitch=pitch, energy=energy, pitch_variance_scale=0.5)
+        scripted_mel = phone2mel(text, utterance_embedding, lang_id, durations, pitch, energy, 1.0, 0.5, 1.0)[0]
+    assert torch.allclose(mel, scripted_mel, atol=1e-4)
+
+
+def test_mel2wav_matches_eager(hifigan, tmp_path):
+    # the export removes the weight norm, which must not change the vocoder that the other tests share
+    hifigan = HiFiGANGenerator(weights=hifigan.state_dict()).eval()
+    export_hifigan(hifigan, str(tmp_path / "mel2wav.jit"))
+    mel2wav = torch.jit.load(str(tmp_path / "mel2wav.jit"))
+    torch.manual_seed(1)
+    for length in (7, 35):
+        mel = torch.randn(80, length)
+        with torch.no_grad():
+            assert torch.allclose(hifigan(mel), mel2wav(mel), atol=1e-5)
+
+
+def test_scripted_runtime_matches_inference_interface(inference_interface):
+    ScriptedFastSpeech2 = pytest.importorskip("InferenceInterfaces.ScriptedFastSpeech2").ScriptedFastSpeech2
+    from run_torchscript_export import export_model
+    from run_torchscript_export import export_vocoder
+
+    export_model("Meta")
+    export_vocoder()
+
+    tts = inference_interface(model_name="Meta", language="en")
+    scripted = ScriptedFastSpeech2(model_name="Meta", language="en")
+    for phones in ["hˈaʊ mˈʌtʃ wʊd wʊd ɐ wˈʊdtʃʌk tʃˈʌk?", "jˈɛs!"]:
+        for scales in [dict(), dict(duration_scaling_factor=1.2, pitch_variance_scale=0.8, energy_variance_scale=1.1)]:
+            wave = tts(phones, input_is_phones=True, **scales)
+            scripted_wave = scripted(phones, input_is_phones=True, **scales)
+            assert wave.shape == scripted_wave.shape
+            assert torch.allclose(wave, scripted_wave, atol=1e-4)
@@ -1,7 +1,6 @@
 """
 taken and adapted from https://github.com/as-ideas/DeepForcedAligner
 """
-import matplotlib.pyplot as plt
 import numpy as np
 import torch
 import torch.multiprocessing
@@ -96,6 +95,8 @@ class Aligner(torch.nn.Module):
 
     @torch.inference_mode()
     def inference(self, mel, tokens, save_img_for_debug=None, train=False, pathfinding="MAS", return_ctc=False):
+        if save_img_for_debug is not None:
+            import matplotlib.pyplot as plt  # only needed for the debug plots and slow to import
         if not train:
             tokens_indexed = list()  # first we need to convert the articulatory vectors to IDs, so we can apply dijkstra or viterbi
             for vector in tokens:
@@ -28,7 +28,8 @@ class AlignerDataset(Dataset):
                  rebuild_cache=False,
                  verbose=False,
                  device="cpu",
-                 phone_input=False):
+                 phone_input=False,
+                 lexicon_dir=None):  # directory of a persistent lexicon that lets the phonemizer skip words it has seen before
         os.makedirs(cache_dir, exist_ok=True)
         if not os.path.exists(os.path.join(cache_dir, "aligner_train_cache.pt")) or rebuild_cache:
             if cut_silences:
@@ -63,7 +64,8 @@ class AlignerDataset(Dataset):
                                   cut_silences,
                                   verbose,
                                   "cpu",
-                                  phone_input),
+                                  phone_input,
+                                  lexicon_dir),
                             daemon=True))
                 process_list[-1].start()
             for process in process_list:
@@ -114,11 +116,19 @@ class AlignerDataset(Dataset):
                               cut_silences,
                               verbose,
                               device,
-                              phone_input):
+                              phone_input,
+                              lexicon_dir):
         process_internal_dataset_chunk = list()
-        tf = ArticulatoryCombinedTextFrontend(language=lang)
+        tf = ArticulatoryCombinedTextFrontend(language=lang, lexicon_dir=lexicon_dir)
         _, sr = sf.read(path_list[0])
         ap = AudioPreprocessor(input_sr=sr, output_sr=16000, melspec_buckets=80, hop_length=256, n_fft=1024, cut_silence=cut_silences, device=device)
+        # phonemize all transcripts of this chunk at once, calling the phonemizer once per sentence is much slower
+        if phone_input:
+            path_to_phones = {path: self.path_to_transcript_dict[path] for path in path_list}
+        else:
+            path_to_phones = dict(zip(path_list, tf.get_phone_string_batch([self.path_to_transcript_dict[path] for path in path_list],
+                                                                           include_eos_symbol=True,
+                                                                           for_feature_extraction=True)))
 
         for path in tqdm(path_list):
             if self.path_to_transcript_dict[path].strip() == "":
@@ -143,11 +153,11 @@ class AlignerDataset(Dataset):
                 continue
             norm_wave = torch.tensor(trim_zeros(norm_wave.numpy()))
             # raw audio preprocessing is done
-            transcript = self.path_to_transcript_dict[path]
+            phones = path_to_phones[path]
             try:
-                cached_text = tf.string_to_tensor(transcript, handle_missing=False, input_phonemes=phone_input).squeeze(0).cpu().numpy()
+                cached_text = tf.string_to_tensor(phones, handle_missing=False, input_phonemes=True).squeeze(0).cpu().numpy()
             except KeyError:
-                tf.string_to_tensor(transcript, handle_missing=True, input_phonemes=phone_input).squeeze(0).cpu().numpy()
+                tf.string_to_tensor(phones, handle_missing=True, input_phonemes=True).squeeze(0).cpu().numpy()
                 continue  # we skip sentences with unknown symbols
 
             cached_text_len = torch.LongTensor([len(cached_text)]).numpy()
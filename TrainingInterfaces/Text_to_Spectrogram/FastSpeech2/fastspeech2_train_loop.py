@@ -12,7 +12,7 @@ from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data.dataloader import DataLoader
 from tqdm import tqdm
 
-from Preprocessing.TextFrontend import ArticulatoryCombinedTextFrontend
+from Preprocessing.TextFrontend import get_frontend
 from Preprocessing.TextFrontend import get_language_id
 from Utility.WarmupScheduler import WarmupScheduler
 from Utility.utils import cumsum_durations
@@ -22,7 +22,7 @@ from Utility.utils import get_most_recent_checkpoint
 
 @torch.no_grad()
 def plot_progress_spec(net, device, save_dir, step, lang, default_emb):
-    tf = ArticulatoryCombinedTextFrontend(language=lang)
+    tf = get_frontend(lang)
     sentence = ""
     if lang == "en":
         sentence = "This is a complex sentence, it even has a pause!"
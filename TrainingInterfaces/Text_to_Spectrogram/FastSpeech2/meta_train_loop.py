@@ -10,7 +10,7 @@ from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data.dataloader import DataLoader
 from tqdm import tqdm
 
-from Preprocessing.TextFrontend import ArticulatoryCombinedTextFrontend
+from Preprocessing.TextFrontend import get_frontend
 from Preprocessing.TextFrontend import get_language_id
 from Utility.WarmupScheduler import WarmupScheduler
 from Utility.path_to_transcript_dicts import *
@@ -146,7 +146,7 @@ def train_loop(net,
 
 @torch.inference_mode()
 def plot_progress_spec(net, device, save_dir, step, lang, utt_embeds):
-    tf = ArticulatoryCombinedTextFrontend(language=lang)
+    tf = get_frontend(lang)
     sentence = ""
     default_embed = utt_embeds[lang]
     if lang == "en":
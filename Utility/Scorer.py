@@ -14,6 +14,7 @@ from tqdm import tqdm
 from Preprocessing.TextFrontend import get_language_id
 from TrainingInterfaces.Text_to_Spectrogram.AutoAligner.Aligner import Aligner
 from TrainingInterfaces.Text_to_Spectrogram.FastSpeech2.FastSpeech2 import FastSpeech2
+from Utility.deployment_checkpoint import load_fastspeech_checkpoint
 
 
 class AlignmentScorer:
@@ -75,17 +76,9 @@ class TTSScorer:
         self.path_to_score = dict()
         self.device = device
         self.nans = list()
-        self.tts = FastSpeech2()
-        weights = torch.load(path_to_fastspeech_model, map_location='cpu')["model"]
-        try:
-            self.tts.load_state_dict(weights)
-        except RuntimeError:
-            try:
-                self.tts = FastSpeech2(lang_embs=None)
-                self.tts.load_state_dict(weights)
-            except RuntimeError:
-                self.tts = FastSpeech2(lang_embs=None, utt_embed_dim=None)
-                self.tts.load_state_dict(weights)
+        config, weights, _ = load_fastspeech_checkpoint(path_to_fastspeech_model)
+        self.tts = FastSpeech2(**config)
+        self.tts.load_state_dict(weights)
         self.tts.to(self.device)
 
     def score(self, path_to_fastspeech_dataset, lang_id):
@@ -0,0 +1,124 @@
+"""
+Content addressed cache of synthesized waves on disk, which several processes can share.
+
+Every wave is stored as an npy file under the hex digest of its key, in one of 256 subdirectories
+named after the first two characters of the digest, so no directory gets too large. The files
+are written to a temporary file first and then moved into place, so a reader never sees half a
+wave, no matter which process wrote it. Reading a wave updates its modification time, and when
+the cache grows beyond its size limit, the files that were used the longest time ago are deleted.
+Temporary files that a crashed process left behind count towards the size and are deleted then as well,
+and a file that cannot be read as a wave is deleted when it is read.
+"""
+
+import os
+import pickle
+import threading
+import time
+import zipfile
+
+import numpy
+import torch
+
+_temporary_lifetime = 600  # seconds after which a temporary file is considered left behind by a process that crashed while writing it
+
+
+class AudioCache:
+
+    def __init__(self, directory, max_bytes=1024 ** 3):
+        """
+        Args:
+            directory: where the waves are stored, processes that use the same directory share the cache
+            max_bytes: size limit for all of the waves together, a tenth of the limit is freed up at once when it is reached
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())  # other processes add to the cache as well, so this is an estimate
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npy")
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".npy") or entry.name.endswith(".tmp"):
+                    try:
+                        status = entry.stat()
+                    except FileNotFoundError:
+                        continue  # evicted by another process in the meantime
+                    yield entry.path, status.st_size, status.st_mtime
+
+    def get(self, key):
+        """
+        Returns the wave that is stored under the key, or None.
+        """
+        path = self._path(key)
+        try:
+            wave = numpy.load(path, allow_pickle=False)
+            if not isinstance(wave, numpy.ndarray):
+                raise ValueError(f"{path} is an archive, not a wave")
+        except FileNotFoundError:
+            # the file was evicted by another process
+            with self._lock:
+                self.misses += 1
+            return None
+        except (ValueError, EOFError, OSError, zipfile.BadZipFile, pickle.UnpicklingError):
+            # the file is damaged, e.g. it was cut off when the disk was full, so it would fail every time
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # evicted by another process since it was loaded, the wave is fine nonetheless
+        with self._lock:
+            self.hits += 1
+        return torch.from_numpy(wave)
+
+    def put(self, key, wave):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "wb") as wave_file:
+                numpy.save(wave_file, wave.detach().cpu().float().numpy())
+            os.replace(temporary_path, path)
+        except BaseException:
+            self._remove(temporary_path)
+            raise
+        with self._lock:
+            self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        now = time.time()
+        for path, size, modification_time in entries:
+            if path.endswith(".tmp") and now - modification_time > _temporary_lifetime:
+                self._remove(path)
+                self._size -= size
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            if path.endswith(".tmp"):
+                continue  # swept above if it was left behind, otherwise another process is still writing it
+            self._remove(path)
+            self._size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # removed by another process already
+
+    def __len__(self):
+        return sum(1 for path, _, _ in self._entries() if path.endswith(".npy"))
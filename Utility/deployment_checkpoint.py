@@ -0,0 +1,189 @@
+"""
+A checkpoint format for deployment: the architecture config is stored explicitly,
+everything that is only needed for training is stripped, and the weights are read
+through a memory map, so all the worker processes on a machine share one copy of them.
+
+Layout of the file: 8 magic bytes, 8 bytes with the length of a JSON header, the JSON
+header, then the raw weights. The header contains the architecture, its config and the
+dtype, shape and offset of every tensor. Every tensor starts at a multiple of 64 bytes.
+"""
+
+import json
+import os
+
+import numpy
+import torch
+
+MAGIC = b"TTSDPLOY"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+def infer_fastspeech_config(state_dict):
+    """
+    The FastSpeech2 variants only differ in whether they have a language embedding and an
+    utterance embedding, which can be read off the shapes of the weights.
+    """
+    config = {"lang_embs": None, "utt_embed_dim": None}
+    if "encoder.language_embedding.weight" in state_dict:
+        config["lang_embs"] = state_dict["encoder.language_embedding.weight"].shape[0]
+    if "encoder.embedding_projection.0.weight" in state_dict:
+        config["utt_embed_dim"] = state_dict["encoder.embedding_projection.0.weight"].shape[1]
+    return config
+
+
+def fold_weight_norm(state_dict):
+    """
+    Replaces the direction and magnitude that weight norm keeps for a weight by the weight itself,
+    like torch.nn.utils.remove_weight_norm does for a module (with the default dim of 0).
+    """
+    folded = dict()
+    for name, tensor in state_dict.items():
+        if name.endswith("weight_g"):
+            direction = state_dict[f"{name[:-2]}_v"]
+            norm = direction.norm(dim=tuple(range(1, direction.dim())), keepdim=True)
+            folded[name[:-2]] = direction * (tensor / norm)
+        elif not name.endswith("weight_v"):
+            folded[name] = tensor
+    return folded
+
+
+def save_deployment_checkpoint(path, architecture, config, state_dict, default_emb=None, fp16=False):
+    """
+    Args:
+        path: where to write the checkpoint
+        architecture: name of the architecture, e.g. FastSpeech2 or HiFiGANGenerator
+        config: the keyword arguments that are needed to build the architecture
+        state_dict: the weights
+        default_emb: the default utterance embedding, if there is one
+        fp16: store floating point weights in half precision. This halves the size of the
+              file, but they have to be converted back when loading, so they are no longer shared.
+    """
+    tensors = dict(state_dict)
+    if default_emb is not None:
+        tensors["default_emb"] = default_emb
+    header = {"format_version": FORMAT_VERSION, "architecture": architecture, "config": config, "tensors": dict()}
+    arrays = list()
+    offset = 0
+    for name, tensor in tensors.items():
+        tensor = tensor.detach().cpu()
+        if fp16 and tensor.is_floating_point() and name != "default_emb":
+            tensor = tensor.half()
+        array = tensor.contiguous().numpy()
+        offset = (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+        header["tensors"][name] = {"dtype": str(array.dtype), "shape": list(array.shape), "offset": offset}
+        arrays.append((offset, array))
+        offset += array.nbytes
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = (16 + len(header_bytes) + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as checkpoint_file:
+        checkpoint_file.write(MAGIC)
+        checkpoint_file.write(len(header_bytes).to_bytes(8, "little"))
+        checkpoint_file.write(header_bytes)
+        for tensor_offset, array in arrays:
+            checkpoint_file.seek(data_start + tensor_offset)
+            checkpoint_file.write(array.tobytes())
+    os.replace(temporary_path, path)
+
+
+def load_deployment_checkpoint(path):
+    """
+    Returns:
+        the architecture, its config, the weights and the default utterance embedding (or None).
+        The weights are backed by a copy-on-write memory map of the file, half precision weights
+        are converted back to single precision.
+    """
+    with open(path, "rb") as checkpoint_file:
+        if checkpoint_file.read(8) != MAGIC:
+            raise ValueError(f"{path} is not a deployment checkpoint.")
+        header_length = int.from_bytes(checkpoint_file.read(8), "little")
+        header = json.loads(checkpoint_file.read(header_length).decode("utf-8"))
+    if header["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"{path} has version {header['format_version']} of the deployment format, but version {FORMAT_VERSION} is expected.")
+    data_start = (16 + header_length + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+    data = numpy.memmap(path, dtype=numpy.uint8, mode="c", offset=data_start)
+    state_dict = dict()
+    for name, description in header["tensors"].items():
+        dtype = numpy.dtype(description["dtype"])
+        count = int(numpy.prod(description["shape"]))
+        array = data[description["offset"]:description["offset"] + count * dtype.itemsize].view(dtype).reshape(description["shape"])
+        tensor = torch.from_numpy(array)
+        if tensor.dtype == torch.float16:
+            tensor = tensor.float()
+        state_dict[name] = tensor
+    default_emb = state_dict.pop("default_emb", None)
+    return header["architecture"], header["config"], state_dict, default_emb
+
+
+def find_checkpoint(model_dir):
+    """
+    Prefers the deployment checkpoint of a model over its regular best.pt
+    """
+    if os.path.exists(os.path.join(model_dir, "best.deploy")):
+        return os.path.join(model_dir, "best.deploy")
+    return os.path.join(model_dir, "best.pt")
+
+
+def is_deployment_checkpoint(path):
+    with open(path, "rb") as checkpoint_file:
+        return checkpoint_file.read(8) == MAGIC
+
+
+def load_fastspeech_checkpoint(path):
+    """
+    Loads either a deployment checkpoint or a regular checkpoint of a FastSpeech2 model.
+
+    Returns:
+        the config that is needed to build the right variant of FastSpeech2, the weights and the default utterance embedding
+    """
+    if is_deployment_checkpoint(path):
+        _, config, state_dict, default_emb = load_deployment_checkpoint(path)
+        return config, state_dict, default_emb
+    checkpoint = torch.load(path, map_location="cpu")
+    return infer_fastspeech_config(checkpoint["model"]), checkpoint["model"], checkpoint.get("default_emb")
+
+
+def load_hifigan_checkpoint(path):
+    """
+    Loads either a deployment checkpoint or a regular checkpoint of a HiFiGAN generator.
+
+    Returns:
+        the config of the generator and its weights
+    """
+    if is_deployment_checkpoint(path):
+        _, config, state_dict, _ = load_deployment_checkpoint(path)
+        return config, state_dict
+    return dict(), torch.load(path, map_location="cpu")["generator"]
+
+
+def share_weights(module, state_dict):
+    """
+    Makes the parameters and buffers of a module that already holds these weights point to the tensors of the
+    state dict. When those come from a memory map, the pages of the weights are shared between all processes
+    instead of every process keeping its own copy.
+    """
+    for name, tensor in module.state_dict(keep_vars=True).items():
+        if name in state_dict and state_dict[name].dtype == tensor.dtype and state_dict[name].shape == tensor.shape:
+            tensor.data = state_dict[name]
+
+
+def convert_checkpoint(path_to_checkpoint, path_to_output, fp16=False):
+    """
+    Converts a best.pt of FastSpeech2 or HiFiGAN into a deployment checkpoint.
+    The weight norm of HiFiGAN is folded into the weights, so they can be shared as they are.
+    """
+    checkpoint = torch.load(path_to_checkpoint, map_location="cpu")
+    if "generator" in checkpoint:
+        save_deployment_checkpoint(path_to_output,
+                                   architecture="HiFiGANGenerator",
+                                   config={"use_weight_norm": False},
+                                   state_dict=fold_weight_norm(checkpoint["generator"]),
+                                   fp16=fp16)
+    else:
+        save_deployment_checkpoint(path_to_output,
+                                   architecture="FastSpeech2",
+                                   config=infer_fastspeech_config(checkpoint["model"]),
+                                   state_dict=checkpoint["model"],
+                                   default_emb=checkpoint.get("default_emb"),
+                                   fp16=fp16)
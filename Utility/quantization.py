@@ -0,0 +1,87 @@
+"""
+Int8 quantization of the inference models for serving on CPU.
+
+Linear layers are quantized dynamically: their weights are stored in int8 and their inputs are
+quantized on the fly, so they need no calibration. Convolutions are quantized statically: the
+ranges of their inputs and outputs are observed on a few representative inputs first. Everything
+between the quantized layers (activations, residual connections, normalizations) stays in float.
+"""
+
+import torch
+
+
+def select_quantized_engine():
+    """
+    fbgemm on x86, qnnpack on ARM. The x86 engine that newer versions of torch pick by default
+    runs the dilated 1d convolutions of HiFiGAN orders of magnitude slower than fbgemm.
+    """
+    for engine in ["fbgemm", "qnnpack"]:
+        if engine in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError("This build of torch does not support quantized inference.")
+
+
+def quantize_linears(module, submodule_names):
+    """
+    Dynamic int8 quantization of all linear layers within the given submodules of the module, in place.
+    """
+    select_quantized_engine()
+    # the linear layers are named one by one, since other layers like embeddings would need a different qconfig
+    linear_layers = [f"{name}.{child_name}" if child_name else name
+                     for name in submodule_names
+                     for child_name, child in module.get_submodule(name).named_modules() if isinstance(child, torch.nn.Linear)]
+    torch.quantization.quantize_dynamic(module,
+                                        qconfig_spec={name: torch.quantization.default_dynamic_qconfig for name in linear_layers},
+                                        dtype=torch.qint8,
+                                        inplace=True)
+    return module
+
+
+class _QuantizedConvolution(torch.nn.Module):
+    """
+    Quantizes the input of a convolution and dequantizes its output, so it can sit among float layers.
+    """
+
+    def __init__(self, conv):
+        super().__init__()
+        self.quant = torch.quantization.QuantStub()
+        self.conv = conv
+        self.dequant = torch.quantization.DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.conv(self.quant(x)))
+
+
+def _wrap_convolutions(module, engine):
+    for name, child in module.named_children():
+        if isinstance(child, torch.nn.ConvTranspose1d):
+            wrapper = _QuantizedConvolution(child)
+            # per channel quantization of the weights is not supported for transposed convolutions
+            wrapper.qconfig = torch.quantization.QConfig(activation=torch.quantization.HistogramObserver.with_args(reduce_range=True),
+                                                         weight=torch.quantization.default_weight_observer)
+            setattr(module, name, wrapper)
+        elif isinstance(child, torch.nn.Conv1d):
+            wrapper = _QuantizedConvolution(child)
+            wrapper.qconfig = torch.quantization.get_default_qconfig(engine)
+            setattr(module, name, wrapper)
+        else:
+            _wrap_convolutions(child, engine)
+
+
+def quantize_convolutions(module, calibrate):
+    """
+    Static int8 quantization of all 1d convolutions within the module, in place.
+
+    Args:
+        module: the module to quantize
+        calibrate: a function that runs the module on representative inputs, it gets the module as its argument
+    """
+    engine = select_quantized_engine()
+    module.eval()
+    _wrap_convolutions(module, engine)
+    torch.quantization.prepare(module, inplace=True)
+    with torch.no_grad():
+        calibrate(module)
+    torch.quantization.convert(module, inplace=True)
+    return module
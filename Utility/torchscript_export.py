@@ -0,0 +1,187 @@
+"""
+Export of the inference models to TorchScript, so they can be run with
+InferenceInterfaces/ScriptedFastSpeech2.py without any of the model code.
+
+The parts of FastSpeech2 whose control flow does not depend on the data (the encoder with the
+variance predictors and the decoder with the postnet) are traced. The glue between them, which
+applies the optional gold durations, pitch and energy, scales the variances and expands the
+phones to frames, depends on the data and is scripted. HiFiGAN is traced as a whole.
+
+The traced parts work for any length of input up to the length of the positional encodings
+(5000 phones or frames, which is more than a minute of speech).
+"""
+
+from typing import Optional
+from typing import Tuple
+
+import torch
+
+from InferenceInterfaces.InferenceArchitectures.InferenceFastSpeech2 import _scale_variance
+
+
+class _Encoder(torch.nn.Module):
+    """
+    text (1, T, idim), utterance embedding (1, utt_embed_dim) and language id (1, 1)
+    to the encoded texts, the durations, the pitch and the energy that are predicted for them
+    """
+
+    def __init__(self, fastspeech):
+        super().__init__()
+        self.encoder = fastspeech.encoder
+        self.duration_predictor = fastspeech.duration_predictor
+        self.pitch_predictor = fastspeech.pitch_predictor
+        self.energy_predictor = fastspeech.energy_predictor
+        self.multilingual_model = fastspeech.multilingual_model
+        self.multispeaker_model = fastspeech.multispeaker_model
+
+    def forward(self, text, utterance_embedding, lang_id):
+        # a single utterance has no padding, so no masks are needed
+        encoded_texts, _ = self.encoder(text,
+                                        None,
+                                        utterance_embedding=utterance_embedding if self.multispeaker_model else None,
+                                        lang_ids=lang_id if self.multilingual_model else None)
+        return (encoded_texts,
+                self.duration_predictor.inference(encoded_texts),
+                self.pitch_predictor(encoded_texts),
+                self.energy_predictor(encoded_texts))
+
+
+class _Decoder(torch.nn.Module):
+    """
+    frame level sequence (1, L, adim) to the spectrogram (L, odim)
+    """
+
+    def __init__(self, fastspeech):
+        super().__init__()
+        self.decoder = fastspeech.decoder
+        self.feat_out = fastspeech.feat_out
+        self.postnet = fastspeech.postnet
+        self.odim = fastspeech.odim
+
+    def forward(self, frames):
+        zs, _ = self.decoder(frames, None)
+        before_outs = self.feat_out(zs).view(zs.size(0), -1, self.odim)
+        after_outs = before_outs + self.postnet(before_outs.transpose(1, 2)).transpose(1, 2)
+        return after_outs[0]
+
+
+class _Phone2Mel(torch.nn.Module):
+    """
+    Does the same as the forward of the inference FastSpeech2 with return_duration_pitch_energy=True.
+    """
+
+    def __init__(self, encoder, pitch_embed, energy_embed, decoder, default_utterance_embedding):
+        super().__init__()
+        self.encoder = encoder
+        self.pitch_embed = pitch_embed
+        self.energy_embed = energy_embed
+        self.decoder = decoder
+        self.register_buffer("default_utterance_embedding", default_utterance_embedding)
+
+    def forward(self,
+                text,
+                utterance_embedding,
+                lang_id,
+                durations: Optional[torch.Tensor] = None,
+                pitch: Optional[torch.Tensor] = None,
+                energy: Optional[torch.Tensor] = None,
+                duration_scaling_factor: float = 1.0,
+                pitch_variance_scale: float = 1.0,
+                energy_variance_scale: float = 1.0) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        encoded_texts, predicted_durations, predicted_pitch, predicted_energy = self.encoder(text.unsqueeze(0),
+                                                                                             utterance_embedding.unsqueeze(0),
+                                                                                             lang_id.unsqueeze(0))
+        durations = predicted_durations if durations is None else durations.unsqueeze(0)
+        pitch = predicted_pitch if pitch is None else pitch.unsqueeze(0)
+        energy = predicted_energy if energy is None else energy.unsqueeze(0)
+        pitch = _scale_variance(pitch, pitch_variance_scale)
+        energy = _scale_variance(energy, energy_variance_scale)
+        encoded_texts = encoded_texts + self.energy_embed(energy.transpose(1, 2)).transpose(1, 2) + self.pitch_embed(pitch.transpose(1, 2)).transpose(1, 2)
+        # length regulation, like the LengthRegulator does it for a batch
+        frame_durations = durations
+        if duration_scaling_factor != 1.0:
+            frame_durations = torch.round(durations.float() * duration_scaling_factor).long()
+        if int(frame_durations.sum()) == 0:
+            frame_durations = torch.ones_like(frame_durations)
+        frames = torch.repeat_interleave(encoded_texts[0], frame_durations[0], dim=0).unsqueeze(0)
+        return self.decoder(frames), durations[0], pitch[0], energy[0]
+
+
+def export_fastspeech2(fastspeech, default_utterance_embedding, path, lang_id=None):
+    """
+    Args:
+        fastspeech: the inference FastSpeech2
+        default_utterance_embedding: the default embedding that comes with the checkpoint
+        path: where to save the TorchScript module
+        lang_id: a language id to trace the encoder with, only matters for multilingual models
+    Returns:
+        the exported module
+    """
+    fastspeech.eval()
+    if lang_id is None:
+        lang_id = torch.LongTensor([12])
+    if fastspeech.multispeaker_model:
+        # the projection that is cached for the current speaker would otherwise end up in the trace as a constant
+        fastspeech.encoder.cached_projection = None
+    if default_utterance_embedding is None:
+        default_utterance_embedding = torch.zeros(1)
+    text = torch.zeros(20, fastspeech.idim)
+    text[:, 13] = 1.0
+    with torch.no_grad():
+        encoder = torch.jit.trace(_Encoder(fastspeech), (text.unsqueeze(0), default_utterance_embedding.unsqueeze(0), lang_id.unsqueeze(0)))
+        encoded_texts = encoder(text.unsqueeze(0), default_utterance_embedding.unsqueeze(0), lang_id.unsqueeze(0))[0]
+        decoder = torch.jit.trace(_Decoder(fastspeech), torch.repeat_interleave(encoded_texts, 3, dim=1))
+    phone2mel = torch.jit.script(_Phone2Mel(encoder, fastspeech.pitch_embed, fastspeech.energy_embed, decoder, default_utterance_embedding).eval())
+    phone2mel = torch.jit.freeze(phone2mel, preserved_attrs=["default_utterance_embedding"])
+    torch.jit.save(phone2mel, path)
+    return phone2mel
+
+
+def export_hifigan(hifigan, path):
+    """
+    Args:
+        hifigan: the inference HiFiGANGenerator
+        path: where to save the TorchScript module
+    Returns:
+        the exported module
+    """
+    hifigan.optimize_for_inference().eval()
+    with torch.no_grad():
+        mel2wav = torch.jit.freeze(torch.jit.trace(hifigan, torch.randn(80, 20)))
+    torch.jit.save(mel2wav, path)
+    return mel2wav
+
+
+def check_phone2mel_parity(fastspeech, phone2mel, utterance_embedding, lang_id, lengths=(7, 35, 120)):
+    """
+    Compares the exported module to the eager model for random inputs of lengths that differ from the one it was traced with.
+
+    Returns:
+        the largest absolute difference between the spectrograms
+    """
+    largest_difference = 0.0
+    for length in lengths:
+        text = (torch.rand(length, fastspeech.idim) > 0.8).float()
+        for scales in [dict(), dict(duration_scaling_factor=1.2, pitch_variance_scale=0.8, energy_variance_scale=1.1)]:
+            with torch.no_grad():
+                eager_mel, eager_durations, _, _ = fastspeech(text, utterance_embedding=utterance_embedding, lang_id=lang_id, return_duration_pitch_energy=True, **scales)
+                scripted_mel, scripted_durations, _, _ = phone2mel(text, utterance_embedding, lang_id, **scales)
+            if not torch.equal(eager_durations, scripted_durations):
+                raise ValueError(f"The exported model predicts different durations than the eager model for an input of length {length}.")
+            largest_difference = max(largest_difference, float((eager_mel - scripted_mel).abs().max()))
+    return largest_difference
+
+
+def check_mel2wav_parity(hifigan, mel2wav, lengths=(7, 35, 120)):
+    """
+    Compares the exported vocoder to the eager one for random spectrograms of lengths that differ from the one it was traced with.
+
+    Returns:
+        the largest absolute difference between the waves
+    """
+    largest_difference = 0.0
+    for length in lengths:
+        mel = torch.randn(80, length)
+        with torch.no_grad():
+            largest_difference = max(largest_difference, float((hifigan(mel) - mel2wav(mel)).abs().max()))
+    return largest_difference
@@ -3,7 +3,9 @@ Taken from ESPNet, modified by Florian Lux
 """
 
 import os
+import threading
 from abc import ABC
+from collections import OrderedDict
 
 import torch
 
@@ -171,6 +173,33 @@ def pad_list(xs, pad_value):
     return pad
 
 
+def masked_group_norm(norm, xs, masks):
+    """
+    Group normalization that only takes the frames into account which are not padding.
+
+    Args:
+        norm (torch.nn.GroupNorm): the normalization whose groups, epsilon and affine parameters are used.
+        xs (Tensor): Batch of padded sequences (B, C, Tmax).
+        masks (BoolTensor): Batch of masks that are True for the frames which are not padding (B, 1, Tmax).
+
+    Returns:
+        Tensor: the normalized sequences, the padded frames are zero before the affine transformation (B, C, Tmax).
+
+    """
+    if bool(masks.all()):
+        return norm(xs)
+    n_batch, channels, max_len = xs.size()
+    grouped = xs.masked_fill(~masks, 0.0).view(n_batch, norm.num_groups, -1, max_len)
+    group_masks = masks.unsqueeze(1)
+    counts = group_masks.sum(dim=(2, 3), keepdim=True) * grouped.size(2)
+    mean = grouped.sum(dim=(2, 3), keepdim=True) / counts
+    variance = ((grouped - mean) ** 2).masked_fill(~group_masks, 0.0).sum(dim=(2, 3), keepdim=True) / counts
+    xs = ((grouped - mean) / torch.sqrt(variance + norm.eps)).masked_fill(~group_masks, 0.0).view(n_batch, channels, max_len)
+    if norm.affine:
+        xs = xs * norm.weight.view(1, -1, 1) + norm.bias.view(1, -1, 1)
+    return xs
+
+
 def subsequent_mask(size, device="cpu", dtype=torch.bool):
     """
     Create mask for subsequent steps (size, size).
@@ -318,3 +347,59 @@ def to_device(m, x):
             "Expected torch.nn.Module or torch.tensor, " f"bot got: {type(m)}"
         )
     return x.to(device)
+
+
+class LRUCache:
+    """
+    Small thread-safe least recently used cache that counts its hits and misses.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def process_memory(pid="self"):
+    """
+    Memory of a process in kB, read from /proc/<pid>/smaps_rollup, so it only works on Linux.
+    rss is everything the process has in memory, shared is the part of it that other processes map as well,
+    and uss is the part that only this process uses, which is what one more process of the same kind costs.
+    """
+    fields = dict()
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {"rss": fields["Rss"],
+            "pss": fields["Pss"],
+            "shared": fields["Shared_Clean"] + fields["Shared_Dirty"],
+            "uss": fields["Private_Clean"] + fields["Private_Dirty"]}
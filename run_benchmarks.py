@@ -0,0 +1,258 @@
+"""
+Micro-benchmarks for parts of the inference pipeline.
+
+Each benchmark prints how long a single call takes on average.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import time
+
+
+def measure(function, repetitions):
+    function()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    return (time.perf_counter() - start) / repetitions
+
+
+def benchmark_phone_normalization(repetitions=2000):
+    from Preprocessing.TextFrontend import PhoneNormalizer
+    from Preprocessing.TextFrontend import _phone_replacements
+    from Preprocessing.TextFrontend import _prosody_replacements
+
+    phones = "ðɪs ɪz ɐ kˈɑːmplɛks sˈɛntəns, ɪt ˈiːvən hɐz ɐ pˈɔːz! bˌʌt kæn ɪt dˈuː ðˈɪs? nˈaɪs... " * 4
+    for name, replacements in [("feature extraction", _phone_replacements),
+                               ("segmental units only", _phone_replacements + _prosody_replacements)]:
+        normalizer = PhoneNormalizer(replacements)
+
+        def chained_replace():
+            result = phones
+            for old, new in list(replacements):
+                result = result.replace(old, new)
+            result = re.sub("~+", "~", result)
+            result = re.sub(r"\s+", " ", result)
+            return re.sub(r"\.+", ".", result)
+
+        assert chained_replace() == normalizer(phones)
+        chained_time = measure(chained_replace, repetitions)
+        normalizer_time = measure(lambda: normalizer(phones), repetitions)
+        print(f"phone normalization for {name}: {chained_time * 1e6:.1f}µs with chained replacements, "
+              f"{normalizer_time * 1e6:.1f}µs with the compiled normalizer ({chained_time / normalizer_time:.1f}x faster)")
+
+
+def benchmark_text_expansion(repetitions=2000):
+    from Preprocessing.TextFrontend import english_text_expansion
+
+    text = "Mr. and Mrs. Smith visited Dr. Jones at St. Mary's hospital, together with Capt. Miller and Col. Brown. " * 4
+    print(f"english text expansion: {measure(lambda: english_text_expansion(text), repetitions) * 1e6:.1f}µs")
+
+
+def run_in_fresh_interpreter(code):
+    """
+    Runs the code in a new python process, like a newly started worker would, and returns what it prints.
+    """
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip()
+
+
+def benchmark_startup(model_name="Meta", language="en"):
+    """
+    How long it takes until a new process can answer its first request: the import of the inference interface,
+    the construction of the model and the first synthesis, with and without warm-up.
+    Also shows what the libraries that are now only imported on first use would have added to the import.
+    """
+    for module in ["matplotlib.pyplot", "librosa", "librosa.display", "sounddevice", "speechbrain.pretrained"]:
+        import_time = run_in_fresh_interpreter(f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)")
+        if import_time is None:
+            print(f"import of {module}: not installed")
+        else:
+            print(f"import of {module}: {float(import_time) * 1000:.0f}ms (no longer paid at startup)")
+
+    import_time = run_in_fresh_interpreter("import time; start = time.perf_counter(); "
+                                           "import InferenceInterfaces.InferenceFastSpeech2; print(time.perf_counter() - start)")
+    if import_time is None:
+        print("import of the inference interface failed, are all requirements installed?")
+        return
+    print(f"import of the inference interface: {float(import_time) * 1000:.0f}ms")
+
+    for warmup in [False, True]:
+        timings = run_in_fresh_interpreter(f"""
+import time
+from InferenceInterfaces.InferenceFastSpeech2 import InferenceFastSpeech2
+start = time.perf_counter()
+tts = InferenceFastSpeech2(model_name="{model_name}", language="{language}", warmup={warmup}, encoder_cache_size=0)
+loaded = time.perf_counter()
+tts("Hello world, this is the first request.")
+print(loaded - start, time.perf_counter() - loaded)
+""")
+        if timings is None:
+            print(f"loading FastSpeech2_{model_name} failed, are the models downloaded?")
+            return
+        load_time, first_request_time = (float(timing) for timing in timings.split())
+        print(f"{'with' if warmup else 'without'} warm-up: {load_time * 1000:.0f}ms to load, {first_request_time * 1000:.0f}ms for the first request")
+
+
+def benchmark_checkpoint_loading(model_name="Meta"):
+    """
+    Time and unshareable memory for loading a model from its best.pt compared to its best.deploy,
+    each in a fresh process. Run run_checkpoint_converter.py first to create the best.deploy files.
+    """
+    for checkpoint_name in ["best.pt", "best.deploy"]:
+        if not os.path.exists(os.path.join("Models", f"FastSpeech2_{model_name}", checkpoint_name)):
+            print(f"{checkpoint_name} of FastSpeech2_{model_name} not found")
+            continue
+        result = run_in_fresh_interpreter(f"""
+import time
+from InferenceInterfaces.InferenceArchitectures.InferenceFastSpeech2 import FastSpeech2
+from Utility.deployment_checkpoint import load_fastspeech_checkpoint
+start = time.perf_counter()
+config, weights, _ = load_fastspeech_checkpoint("Models/FastSpeech2_{model_name}/{checkpoint_name}")
+model = FastSpeech2(weights=weights, **config)
+load_time = time.perf_counter() - start
+with open("/proc/self/smaps_rollup") as smaps:
+    anonymous = sum(int(line.split()[1]) for line in smaps if line.startswith("Anonymous:"))
+print(load_time, anonymous)
+""")
+        if result is None:
+            print(f"loading {checkpoint_name} failed")
+            continue
+        load_time, anonymous_kb = result.split()
+        print(f"{checkpoint_name}: {float(load_time) * 1000:.0f}ms to load, {int(anonymous_kb) / 1024:.0f}MB of memory that cannot be shared with other processes")
+
+
+def benchmark_weight_norm_removal(repetitions=10):
+    """
+    Vocoding a chunk of a stream and a spectrogram of about two seconds with and without the weight norm of HiFiGAN.
+    """
+    import torch
+
+    from InferenceInterfaces.InferenceArchitectures.InferenceHiFiGAN import HiFiGANGenerator
+
+    path_to_weights = os.path.join("Models", "HiFiGAN_combined", "best.pt")
+    if not os.path.exists(path_to_weights):
+        print("HiFiGAN_combined not found, are the models downloaded?")
+        return
+    with_weight_norm = HiFiGANGenerator(path_to_weights=path_to_weights).eval()
+    without_weight_norm = HiFiGANGenerator(path_to_weights=path_to_weights).optimize_for_inference().eval()
+    for frames in [8, 200]:
+        mel = torch.randn(80, frames)
+        with torch.inference_mode():
+            assert torch.allclose(with_weight_norm(mel), without_weight_norm(mel), atol=1e-4)
+            time_with = measure(lambda: with_weight_norm(mel), repetitions)
+            time_without = measure(lambda: without_weight_norm(mel), repetitions)
+        print(f"vocoding {frames} frames: {time_with * 1000:.0f}ms with weight norm, "
+              f"{time_without * 1000:.0f}ms without weight norm ({time_with / time_without:.2f}x faster)")
+
+
+def benchmark_torchscript(model_name="Meta", repetitions=5):
+    """
+    A whole utterance with the eager models compared to the TorchScript modules of run_torchscript_export.py
+    """
+    import torch
+
+    from InferenceInterfaces.InferenceFastSpeech2 import InferenceFastSpeech2
+    from InferenceInterfaces.ScriptedFastSpeech2 import ScriptedFastSpeech2
+
+    if not os.path.exists(os.path.join("Models", f"FastSpeech2_{model_name}", "phone2mel.jit")):
+        print(f"FastSpeech2_{model_name} has not been exported, run run_torchscript_export.py first")
+        return
+    # the scripted runtime has no encoder cache, so the eager one must not use its cache either
+    eager = InferenceFastSpeech2(model_name=model_name, encoder_cache_size=0)
+    scripted = ScriptedFastSpeech2(model_name=model_name)
+    text = "Hello world, this is a sentence of about average length, as it could be found in any book."
+    assert torch.allclose(eager(text), scripted(text), atol=1e-4)
+    eager_time = measure(lambda: eager(text), repetitions)
+    scripted_time = measure(lambda: scripted(text), repetitions)
+    print(f"synthesis of one sentence: {eager_time * 1000:.0f}ms eager, {scripted_time * 1000:.0f}ms with TorchScript ({eager_time / scripted_time:.2f}x faster)")
+
+
+def benchmark_encoder_cache(model_name="Meta", repetitions=5):
+    """
+    The acoustic model for a sentence that is rendered again with a different pitch variance scale,
+    once computed from scratch and once starting from the cached output of the encoder and the variance predictors
+    """
+    import torch
+
+    from InferenceInterfaces.InferenceFastSpeech2 import InferenceFastSpeech2
+
+    # the prediction is passed explicitly, so the cache of the interface must not serve the uncached runs
+    tts = InferenceFastSpeech2(model_name=model_name, encoder_cache_size=0)
+    phones = tts.text2phone.string_to_tensor("Hello world, this is a sentence of about average length, as it could be found in any book.")
+    with torch.inference_mode():
+        prediction = tts._predict(phones)
+        uncached_time = measure(lambda: tts.phone2mel(phones, utterance_embedding=tts.default_utterance_embedding, lang_id=tts.lang_id,
+                                                      pitch_variance_scale=1.2), repetitions)
+        cached_time = measure(lambda: tts.phone2mel(phones, utterance_embedding=tts.default_utterance_embedding, lang_id=tts.lang_id,
+                                                    pitch_variance_scale=1.2, prediction=prediction), repetitions)
+    print(f"acoustic model for a re-rendered sentence: {uncached_time * 1000:.0f}ms from scratch, "
+          f"{cached_time * 1000:.0f}ms from the encoder cache ({uncached_time / cached_time:.2f}x faster)")
+
+
+def benchmark_incremental_edit(model_name="Meta"):
+    """
+    Synthesizing a paragraph again after one word was changed, from scratch and with synthesize_edit
+    """
+    import torch
+
+    from InferenceInterfaces.InferenceFastSpeech2 import InferenceFastSpeech2
+
+    # synthesize_edit keeps what it needs itself, the encoder cache would only speed up the synthesis from scratch
+    tts = InferenceFastSpeech2(model_name=model_name, encoder_cache_size=0)
+    paragraph = "wɛn ðə sˈʌn ɹˈoʊz ˌoʊvɚ ðə hˈɪlz, ðə hˈoʊl vˈæli wʌz stˈɪl kˈʌvɚd ɪn ɐ θˈɪk lˈeɪɚɹ ʌv fˈɑːɡ, " \
+                "ænd nˈoʊbədi dˈɛɹd tə ɡˌoʊ ˌaʊtsˈaɪd. ðɪ ˈoʊld mˈɪlɚ wʌz ðə fˈɜːst tʊ ˈoʊpən hɪz dˈoːɹ."
+    edited_paragraph = paragraph.replace("θˈɪk", "θˈɪn")
+    with torch.inference_mode():
+        full_time = measure(lambda: tts(edited_paragraph, input_is_phones=True), 1)
+
+        def edit():
+            tts.synthesize_edit(paragraph, input_is_phones=True)
+            start = time.perf_counter()
+            tts.synthesize_edit(edited_paragraph, input_is_phones=True)
+            return time.perf_counter() - start
+
+        edit()  # warm-up
+        edit_time = edit()
+    print(f"paragraph after a one word edit: {full_time * 1000:.0f}ms from scratch, "
+          f"{edit_time * 1000:.0f}ms with synthesize_edit ({full_time / edit_time:.2f}x faster)")
+
+
+def benchmark_worker_pool(model_name="Meta"):
+    """
+    Sentences per second with one worker that uses all the cores compared to several workers with 8 cores each
+    """
+    from InferenceInterfaces.InferenceFastSpeech2 import InferenceFastSpeech2
+    from InferenceInterfaces.InferenceWorkerPool import InferenceWorkerPool
+
+    # the texts repeat, which the encoder cache would answer instead of the workers
+    tts = InferenceFastSpeech2(model_name=model_name, warmup=True, encoder_cache_size=0)
+    texts = ["Hello world, this is a sentence of about average length.",
+             "The quick brown fox jumps over the lazy dog.",
+             "Please call Stella and ask her to bring these things with her from the store.",
+             "Six spoons of fresh snow peas."] * 4
+    cores = len(os.sched_getaffinity(0))
+    for workers in sorted({1, max(1, cores // 8)}):
+        pool = InferenceWorkerPool(tts, workers=workers, threads_per_worker=cores // workers, pin_to_cores=workers > 1)
+        pool.map(texts[:workers])  # warm-up
+        start = time.perf_counter()
+        pool.map(texts)
+        duration = time.perf_counter() - start
+        pool.shutdown()
+        print(f"{workers} workers with {cores // workers} threads each: {len(texts) / duration:.2f} sentences per second")
+
+
+if __name__ == '__main__':
+    benchmark_phone_normalization()
+    benchmark_text_expansion()
+    benchmark_startup()
+    benchmark_checkpoint_loading()
+    benchmark_weight_norm_removal()
+    benchmark_torchscript()
+    benchmark_encoder_cache()
+    benchmark_incremental_edit()
+    benchmark_worker_pool()
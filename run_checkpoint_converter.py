@@ -0,0 +1,29 @@
+"""
+Converts the best.pt of every model in the Models directory into a best.deploy next to it.
+The inference interfaces prefer the best.deploy if there is one.
+"""
+
+import argparse
+import os
+
+from Utility.deployment_checkpoint import convert_checkpoint
+
+
+def convert_all_models(fp16=False):
+    for model_dir in os.listdir("Models"):
+        path_to_checkpoint = os.path.join("Models", model_dir, "best.pt")
+        if ("FastSpeech2" in model_dir or "HiFiGAN" in model_dir) and os.path.exists(path_to_checkpoint):
+            print(f"converting {path_to_checkpoint}")
+            convert_checkpoint(path_to_checkpoint, os.path.join("Models", model_dir, "best.deploy"), fp16=fp16)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='IMS Speech Synthesis Toolkit - Convert Checkpoints for Deployment')
+
+    parser.add_argument('--fp16',
+                        action="store_true",
+                        help="Store the weights in half precision. Halves the size of the files, but the weights are no longer shared between processes.",
+                        default=False)
+
+    args = parser.parse_args()
+    convert_all_models(fp16=args.fp16)
@@ -15,7 +15,7 @@ if __name__ == '__main__':
             available_fastspeech_models.append(model.lstrip("FastSpeech_2"))
     model_id = input("Which model do you want? \nCurrently supported are: {}\n".format("".join("\n\t- {}".format(key) for key in available_fastspeech_models)))
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    tts = InferenceFastSpeech2(device=device, model_name=model_id)
+    tts = InferenceFastSpeech2(device=device, model_name=model_id, warmup=True)
     tts.set_language(lang_id=input("Which Language?\n"))
     while True:
         text = input("\nWhat should I say? (or 'exit')\n")
@@ -0,0 +1,113 @@
+"""
+Load generator for run_synthesis_server.py. Sends synthesis requests, either from a fixed amount of clients
+that each send the next request as soon as the previous one is answered, or at a fixed average rate no matter
+how fast the server answers, and reports the latencies and the throughput. Only needs the standard library.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+sentences = ["Hello world.",
+             "This is a sentence of about average length.",
+             "The quick brown fox jumps over the lazy dog.",
+             "When the sun rose over the hills, the whole valley was still covered in a thick layer of fog.",
+             "Please call Stella.",
+             "Ask her to bring these things with her from the store.",
+             "Six spoons of fresh snow peas, five thick slabs of blue cheese, and maybe a snack for her brother Bob.",
+             "We also need a small plastic snake and a big toy frog for the kids."]
+
+
+async def send_request(host, port, payload):
+    """
+    Returns the status code and the amount of seconds of audio in the answer.
+    """
+    body = json.dumps(payload).encode("utf8")
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"POST /synthesize HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    content = (await reader.read()).split(b"\r\n\r\n", 1)[1]
+    writer.close()
+    # 16 bit samples at 48kHz after a header of 44 bytes
+    return status, (len(content) - 44) / 2 / 48000 if status == 200 else 0.0
+
+
+async def run_load(host, port, requests, concurrency=None, rate=None, deadline=None, language="en"):
+    results = list()
+
+    async def timed_request():
+        payload = {"text": random.choice(sentences), "language": language}
+        if deadline is not None:
+            payload["deadline"] = deadline
+        start = time.perf_counter()
+        try:
+            status, audio_seconds = await send_request(host, port, payload)
+        except (ConnectionError, IndexError, ValueError):
+            status, audio_seconds = None, 0.0
+        results.append((status, time.perf_counter() - start, audio_seconds))
+
+    start = time.perf_counter()
+    if rate is not None:
+        # open loop: the arrivals follow a poisson process, like the requests of many independent users
+        tasks = list()
+        for _ in range(requests):
+            tasks.append(asyncio.ensure_future(timed_request()))
+            await asyncio.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks)
+    else:
+        remaining = iter(range(requests))
+
+        async def client():
+            for _ in remaining:
+                await timed_request()
+
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+    return results, time.perf_counter() - start
+
+
+def report(results, duration):
+    latencies = sorted(latency for status, latency, _ in results if status == 200)
+    statuses = dict()
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"{len(results)} requests in {duration:.1f}s, answers: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+    if latencies:
+        print(f"latency of the successful requests: p50 {percentile(latencies, 50) * 1000:.0f}ms   "
+              f"p99 {percentile(latencies, 99) * 1000:.0f}ms   max {latencies[-1] * 1000:.0f}ms")
+    print(f"throughput: {len(latencies) / duration:.2f} requests/s, "
+          f"{sum(audio_seconds for _, _, audio_seconds in results) / duration:.2f} seconds of audio per second")
+
+
+def percentile(sorted_values, percent):
+    return sorted_values[min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='IMS Speech Synthesis Toolkit - Load Generator')
+
+    parser.add_argument('--host', type=str, help="Address of the server.", default="127.0.0.1")
+
+    parser.add_argument('--port', type=int, help="Port of the server.", default=8000)
+
+    parser.add_argument('--requests', type=int, help="Amount of requests to send.", default=100)
+
+    parser.add_argument('--concurrency', type=int, help="Amount of clients that each wait for their answer before sending the next request.", default=8)
+
+    parser.add_argument('--rate', type=float, help="Send this many requests per second on average instead of using a fixed amount of clients.", default=None)
+
+    parser.add_argument('--deadline', type=float, help="Deadline of the requests in seconds.", default=None)
+
+    parser.add_argument('--language', type=str, help="Language of the requests.", default="en")
+
+    args = parser.parse_args()
+    report(*asyncio.run(run_load(args.host,
+                                 args.port,
+                                 args.requests,
+                                 concurrency=args.concurrency,
+                                 rate=args.rate,
+                                 deadline=args.deadline,
+                                 language=args.language)))
@@ -0,0 +1,92 @@
+"""
+Compares the int8 quantized or the bfloat16 models to the float32 models on a few sentences:
+how often they predict the same durations, how much the spectrograms differ and how much faster the synthesis gets.
+"""
+
+import argparse
+import time
+
+import torch
+
+from InferenceInterfaces.InferenceFastSpeech2 import InferenceFastSpeech2
+
+sentences = ["Hello world, this is a sentence of about average length.",
+             "The quantized models should sound just like the ones that compute in full precision.",
+             "Short one.",
+             "When the sun rose over the hills, the whole valley was still covered in a thick layer of fog, and nobody dared to go outside."]
+
+
+def real_time_factor(tts, sentence, repetitions=3):
+    # the first run on an input of a new length also includes setting up the kernels for it, so the best of a few runs is taken
+    durations = list()
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        wave = tts(sentence)
+        durations.append(time.perf_counter() - start)
+    return min(durations) / (len(wave) / 48000)
+
+
+def evaluate(model_name="Meta", language="en", precision="int8"):
+    # without the encoder cache, since the repeated runs of real_time_factor would otherwise skip the encoder
+    float_tts = InferenceFastSpeech2(model_name=model_name, language=language, encoder_cache_size=0)
+    if precision == "int8":
+        reduced_tts = InferenceFastSpeech2(model_name=model_name, language=language, quantize="int8", encoder_cache_size=0)
+    else:
+        reduced_tts = InferenceFastSpeech2(model_name=model_name, language=language, dtype=torch.bfloat16, encoder_cache_size=0)
+    float_tts("Warm up.")
+    reduced_tts("Warm up.")
+    mel_differences = list()
+    same_durations = 0
+    phone_count = 0
+    float_rtfs = list()
+    reduced_rtfs = list()
+    for sentence in sentences:
+        phones = float_tts.text2phone.string_to_tensor(sentence)
+        with torch.inference_mode():
+            float_mel, float_durations, _, _ = float_tts.phone2mel(phones,
+                                                                   return_duration_pitch_energy=True,
+                                                                   utterance_embedding=float_tts.default_utterance_embedding,
+                                                                   lang_id=float_tts.lang_id)
+            _, reduced_durations, _, _ = reduced_tts.phone2mel(phones,
+                                                               return_duration_pitch_energy=True,
+                                                               utterance_embedding=reduced_tts.default_utterance_embedding,
+                                                               lang_id=reduced_tts.lang_id)
+            # the same durations for both, so the spectrograms have the same length
+            reduced_mel = reduced_tts.phone2mel(phones,
+                                                durations=float_durations,
+                                                utterance_embedding=reduced_tts.default_utterance_embedding,
+                                                lang_id=reduced_tts.lang_id)
+        same_durations += int((float_durations == reduced_durations).sum())
+        phone_count += len(float_durations)
+        mel_differences.append(float((float_mel - reduced_mel).abs().mean()))
+        float_rtfs.append(real_time_factor(float_tts, sentence))
+        reduced_rtfs.append(real_time_factor(reduced_tts, sentence))
+        print(f"{sentence}\n    durations the same: {float((float_durations == reduced_durations).float().mean()) * 100:.1f}%   "
+              f"mel L1: {mel_differences[-1]:.4f}   RTF float32: {float_rtfs[-1]:.3f}   RTF {precision}: {reduced_rtfs[-1]:.3f}")
+    float_rtf = sum(float_rtfs) / len(float_rtfs)
+    reduced_rtf = sum(reduced_rtfs) / len(reduced_rtfs)
+    print(f"\ndurations the same: {same_durations / phone_count * 100:.1f}% of the phones")
+    print(f"average mel L1: {sum(mel_differences) / len(mel_differences):.4f}")
+    print(f"average RTF: {float_rtf:.3f} float32, {reduced_rtf:.3f} {precision} ({float_rtf / reduced_rtf:.2f}x faster)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='IMS Speech Synthesis Toolkit - Evaluate Reduced Precision Inference')
+
+    parser.add_argument('--model_name',
+                        type=str,
+                        help="Name of the FastSpeech2 model, e.g. Meta for Models/FastSpeech2_Meta.",
+                        default="Meta")
+
+    parser.add_argument('--language',
+                        type=str,
+                        help="Shorthand of the language of the sentences.",
+                        default="en")
+
+    parser.add_argument('--precision',
+                        choices=["int8", "bf16"],
+                        help="Int8 quantization or bfloat16 weights and autocast.",
+                        default="int8")
+
+    args = parser.parse_args()
+    evaluate(model_name=args.model_name, language=args.language, precision=args.precision)
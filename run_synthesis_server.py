@@ -0,0 +1,42 @@
+"""
+Serves speech synthesis over HTTP on the local machine, see InferenceInterfaces/SynthesisServer.py for the API.
+run_load_generator.py measures how the server holds up under load.
+"""
+
+import argparse
+import asyncio
+
+from InferenceInterfaces.InferenceFastSpeech2 import InferenceFastSpeech2
+from InferenceInterfaces.SynthesisServer import SynthesisServer
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='IMS Speech Synthesis Toolkit - Synthesis Server')
+
+    parser.add_argument('--host', type=str, help="Address to listen on.", default="127.0.0.1")
+
+    parser.add_argument('--port', type=int, help="Port to listen on.", default=8000)
+
+    parser.add_argument('--model_name', type=str, help="Name of the FastSpeech2 model, e.g. Meta for Models/FastSpeech2_Meta.", default="Meta")
+
+    parser.add_argument('--language', type=str, help="Language of requests that do not name one.", default="en")
+
+    parser.add_argument('--gpu_id',
+                        type=str,
+                        help="Which GPU to run on. If not specified runs on CPU.",
+                        default="cpu")
+
+    parser.add_argument('--max_batch_size', type=int, help="Largest amount of requests that are synthesized together.", default=8)
+
+    parser.add_argument('--batch_window', type=float, help="Milliseconds that a request waits for others to join its batch.", default=20.0)
+
+    parser.add_argument('--max_queue_depth', type=int, help="Amount of requests that may be waiting at once, more are rejected.", default=32)
+
+    args = parser.parse_args()
+    device = "cpu" if args.gpu_id == "cpu" else f"cuda:{args.gpu_id}"
+    tts = InferenceFastSpeech2(device=device, model_name=args.model_name, language=args.language, warmup=True)
+    server = SynthesisServer(tts,
+                             max_batch_size=args.max_batch_size,
+                             batch_window=args.batch_window / 1000,
+                             max_queue_depth=args.max_queue_depth)
+    print(f"Serving on http://{args.host}:{args.port}")
+    asyncio.run(server.serve(host=args.host, port=args.port))
@@ -0,0 +1,185 @@
+"""
+Serves speech synthesis like run_synthesis_server.py, but with several worker processes that all accept requests
+on the same port, so they don't compete for the GIL. The models and the text frontend are loaded once, before
+the workers are forked, so all of them use the same pages of memory for the weights instead of a copy each.
+Deployment checkpoints (see run_checkpoint_converter.py) are memory-mapped, which shares them already, the
+weights of regular checkpoints are moved to shared memory. Once the workers are ready, the memory that every
+one of them uses on its own is reported, which tells how many workers fit on a host.
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import torch
+
+from InferenceInterfaces.InferenceFastSpeech2 import InferenceFastSpeech2
+from InferenceInterfaces.SynthesisServer import SynthesisServer
+from Utility.deployment_checkpoint import find_checkpoint
+from Utility.deployment_checkpoint import is_deployment_checkpoint
+from Utility.utils import process_memory
+
+
+def load_shared_models(model_name, language):
+    # threads that torch starts in the parent would be unusable in the forked workers, so the parent computes on one thread only
+    torch.set_num_threads(1)
+    tts = InferenceFastSpeech2(model_name=model_name, language=language)
+    for model, checkpoint in [(tts.phone2mel, find_checkpoint(os.path.join("Models", f"FastSpeech2_{model_name}"))),
+                              (tts.mel2wav, find_checkpoint(os.path.join("Models", "HiFiGAN_combined")))]:
+        if not is_deployment_checkpoint(checkpoint):
+            model.share_memory()
+    return tts
+
+
+def run_worker(tts, sock, cores, threads, ready, server_args):
+    torch.set_num_threads(threads)
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+    tts.warmup()
+    os.write(ready, b".")
+    os.close(ready)
+    asyncio.run(SynthesisServer(tts, **server_args).serve(sock=sock))
+
+
+def reap_workers(worker_pids, block):
+    # forgets the workers that exited and returns the exit codes of the ones that failed, waits for the next one to exit if block is set
+    failed = dict()
+    while worker_pids:
+        pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+        if pid == 0:
+            break  # none of them has exited
+        if pid in worker_pids:
+            worker_pids.remove(pid)
+            exit_code = os.waitstatus_to_exitcode(status)
+            if exit_code != 0:
+                failed[pid] = exit_code
+        if block:
+            break
+    return failed
+
+
+def report_memory(worker_pids):
+    unique = list()
+    for index, pid in enumerate(worker_pids):
+        try:
+            memory = process_memory(pid)
+        except FileNotFoundError:
+            print(f"worker {index} (pid {pid}) is no longer running")
+            continue
+        unique.append(memory["uss"])
+        print(f"worker {index} (pid {pid}): {memory['rss'] / 1024:.0f}MB resident, {memory['shared'] / 1024:.0f}MB of it shared, "
+              f"{memory['uss'] / 1024:.0f}MB unique")
+    memory = process_memory()
+    print(f"parent (pid {os.getpid()}): {memory['rss'] / 1024:.0f}MB resident, {memory['uss'] / 1024:.0f}MB unique")
+    if unique:
+        print(f"every additional worker needs about {sum(unique) / len(unique) / 1024:.0f}MB")
+
+
+def launch(model_name, language, host, port, workers, threads_per_worker, pin_to_cores, report_interval, server_args):
+    tts = load_shared_models(model_name, language)
+    sock = socket.create_server((host, port))
+    available_cores = sorted(os.sched_getaffinity(0))
+    # the objects that exist now are never collected, so the garbage collector doesn't write to their pages in the workers
+    gc.freeze()
+    ready_read, ready_write = os.pipe()
+    worker_pids = list()
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            exit_code = 1
+            try:
+                run_worker(tts,
+                           sock,
+                           set(available_cores[index * threads_per_worker:(index + 1) * threads_per_worker]) if pin_to_cores else None,
+                           threads_per_worker,
+                           ready_write,
+                           server_args)
+                exit_code = 0
+            except KeyboardInterrupt:
+                exit_code = 0
+            except BaseException:
+                # os._exit skips the handling of the interpreter, so the error would go unnoticed otherwise
+                traceback.print_exc()
+            finally:
+                sys.stderr.flush()
+                os._exit(exit_code)
+        worker_pids.append(pid)
+    os.close(ready_write)
+    sock.close()
+    ready_workers = 0
+    while ready_workers < workers:
+        signals = os.read(ready_read, workers)
+        if not signals:
+            break  # a worker died before it became ready
+        ready_workers += len(signals)
+    os.close(ready_read)
+    print(f"{ready_workers} of {workers} workers are serving on http://{host}:{port}")
+    running_pids = list(worker_pids)
+    try:
+        report_memory(worker_pids)
+        while running_pids:
+            if report_interval is None:
+                failed = reap_workers(running_pids, block=True)
+            else:
+                time.sleep(report_interval)
+                failed = reap_workers(running_pids, block=False)
+                report_memory(worker_pids)
+            if failed:
+                for pid, exit_code in failed.items():
+                    print(f"worker {worker_pids.index(pid)} (pid {pid}) failed with exit code {exit_code}")
+                sys.exit(1)
+    finally:
+        for pid in running_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='IMS Speech Synthesis Toolkit - Synthesis Workers with Shared Weights')
+
+    parser.add_argument('--host', type=str, help="Address to listen on.", default="127.0.0.1")
+
+    parser.add_argument('--port', type=int, help="Port to listen on.", default=8000)
+
+    parser.add_argument('--model_name', type=str, help="Name of the FastSpeech2 model, e.g. Meta for Models/FastSpeech2_Meta.", default="Meta")
+
+    parser.add_argument('--language', type=str, help="Language of requests that do not name one.", default="en")
+
+    parser.add_argument('--workers', type=int, help="Amount of worker processes.", default=2)
+
+    parser.add_argument('--threads_per_worker', type=int, help="Intra-op threads of every worker, an equal share of the cores by default.", default=None)
+
+    parser.add_argument('--pin_to_cores', action="store_true", help="Restrict every worker to cores of its own.")
+
+    parser.add_argument('--report_interval', type=float, help="Report the memory of the workers every so many seconds, not just once.", default=None)
+
+    parser.add_argument('--max_batch_size', type=int, help="Largest amount of requests that a worker synthesizes together.", default=8)
+
+    parser.add_argument('--batch_window', type=float, help="Milliseconds that a request waits for others to join its batch.", default=20.0)
+
+    parser.add_argument('--max_queue_depth', type=int, help="Amount of requests that may be waiting at once in every worker, more are rejected.", default=32)
+
+    args = parser.parse_args()
+    threads = args.threads_per_worker or max(1, len(os.sched_getaffinity(0)) // args.workers)
+    if args.pin_to_cores and args.workers * threads > len(os.sched_getaffinity(0)):
+        parser.error("There are not enough cores to pin every worker to cores of its own.")
+    launch(model_name=args.model_name,
+           language=args.language,
+           host=args.host,
+           port=args.port,
+           workers=args.workers,
+           threads_per_worker=threads,
+           pin_to_cores=args.pin_to_cores,
+           report_interval=args.report_interval,
+           server_args=dict(max_batch_size=args.max_batch_size,
+                            batch_window=args.batch_window / 1000,
+                            max_queue_depth=args.max_queue_depth))
@@ -0,0 +1,53 @@
+"""
+Exports FastSpeech2 models and the combined HiFiGAN to TorchScript, next to their checkpoints.
+The exported modules are compared to the eager models right away. They can be run with
+InferenceInterfaces/ScriptedFastSpeech2.py
+"""
+
+import argparse
+import os
+
+import torch
+
+from InferenceInterfaces.InferenceArchitectures.InferenceFastSpeech2 import FastSpeech2
+from InferenceInterfaces.InferenceArchitectures.InferenceHiFiGAN import HiFiGANGenerator
+from Utility.deployment_checkpoint import find_checkpoint
+from Utility.deployment_checkpoint import load_fastspeech_checkpoint
+from Utility.torchscript_export import check_mel2wav_parity
+from Utility.torchscript_export import check_phone2mel_parity
+from Utility.torchscript_export import export_fastspeech2
+from Utility.torchscript_export import export_hifigan
+
+
+def export_model(model_name):
+    model_dir = os.path.join("Models", f"FastSpeech2_{model_name}")
+    config, weights, default_emb = load_fastspeech_checkpoint(find_checkpoint(model_dir))
+    fastspeech = FastSpeech2(weights=weights, **config).eval()
+    lang_id = torch.LongTensor([12])  # English
+    phone2mel = export_fastspeech2(fastspeech, default_emb, os.path.join(model_dir, "phone2mel.jit"), lang_id=lang_id)
+    print(f"exported FastSpeech2_{model_name}, largest difference to the eager model: "
+          f"{check_phone2mel_parity(fastspeech, phone2mel, phone2mel.default_utterance_embedding, lang_id):.2e}")
+
+
+def export_vocoder():
+    model_dir = os.path.join("Models", "HiFiGAN_combined")
+    hifigan = HiFiGANGenerator(path_to_weights=find_checkpoint(model_dir)).optimize_for_inference().eval()
+    mel2wav = export_hifigan(hifigan, os.path.join(model_dir, "mel2wav.jit"))
+    print(f"exported HiFiGAN_combined, largest difference to the eager model: {check_mel2wav_parity(hifigan, mel2wav):.2e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='IMS Speech Synthesis Toolkit - Export to TorchScript')
+
+    parser.add_argument('model_names',
+                        nargs="*",
+                        help="Names of the FastSpeech2 models to export, e.g. Meta for Models/FastSpeech2_Meta. Exports all of them if none are given.")
+
+    args = parser.parse_args()
+    model_names = args.model_names
+    if not model_names:
+        model_names = [model_dir[len("FastSpeech2_"):] for model_dir in os.listdir("Models")
+                       if model_dir.startswith("FastSpeech2_") and os.path.isdir(os.path.join("Models", model_dir))]
+    for name in model_names:
+        export_model(name)
+    export_vocoder()
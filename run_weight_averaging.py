@@ -8,23 +8,14 @@ import torch
 
 from TrainingInterfaces.Spectrogram_to_Wave.HiFIGAN.HiFiGAN import HiFiGANGenerator
 from TrainingInterfaces.Text_to_Spectrogram.FastSpeech2.FastSpeech2 import FastSpeech2
+from Utility.deployment_checkpoint import infer_fastspeech_config
 
 
 def load_net_fast(path):
     check_dict = torch.load(path, map_location=torch.device("cpu"))
-    try:
-        net = FastSpeech2()
-        net.load_state_dict(check_dict["model"])
-        return net, check_dict["default_emb"]
-    except RuntimeError:
-        try:
-            net = FastSpeech2(lang_embs=None)
-            net.load_state_dict(check_dict["model"])
-            return net, check_dict["default_emb"]
-        except RuntimeError:
-            net = FastSpeech2(lang_embs=None, utt_embed_dim=None)
-            net.load_state_dict(check_dict["model"])
-            return net, check_dict["default_emb"]
+    net = FastSpeech2(**infer_fastspeech_config(check_dict["model"]))
+    net.load_state_dict(check_dict["model"])
+    return net, check_dict["default_emb"]
 
 
 def load_net_hifigan(path):